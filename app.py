@@ -1,58 +1,124 @@
 import streamlit as st
-from langchain.schema import HumanMessage, AIMessage
+from streamlit.errors import StreamlitAPIException
 from datetime import datetime
 import os
 import json
 import re
-import glob
-import unicodedata
-
-from src.agents.router_agent import RouterAgent
-from src.rag.retriever import CustomerHistoryRAG
-from src.agents.budget_agent import BudgetCalculatorAgent
-from src.agents.price_margin_agent import PriceMarginAgent
-from src.agents.autonomous_agent import calcular_presupuesto, generar_pdf_presupuesto_streamlit, generar_pdf_factura_streamlit
+
 from src.utils.history_manager import guardar_presupuesto_en_historial
-from src.rag.vector_store import rebuild_customer_history_vectorstore
-from src.utils.text_helpers import normalize_text, text_contains_word
+from src.utils.budget_index import get_budget_index, guardar_presupuesto_json
+from src.utils.storage import read_json, VersionConflictError
+from src.utils.budget_resolver import resolver_presupuesto
+
+LOGO_PATH = "static/logo.png"
+# URL del logo servido como archivo estático (ver .streamlit/config.toml)
+LOGO_URL = "app/static/logo.png"
 
 # Configuración de la página
 st.set_page_config(
     page_title="Entre Brochas | Asistente Empresarial", 
-    page_icon="public/logo.png",
+    page_icon=LOGO_PATH,
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
 # Inicialización de agentes con cache
+# Viven todo el proceso: las escrituras del historial no los invalidan. Lo único que
+# depende del historial es el retriever del RAG, que se sustituye en el sitio cuando
+# el worker del índice publica un snapshot nuevo (ver src/rag/index_worker.py).
+# Cada agente (LangChain, Chroma, cliente del LLM) se importa en su primer uso, no
+# al cargar la página.
+@st.cache_resource
+def initialize_embeddings():
+    from src.rag.embeddings import start_embeddings_warmup
+    return start_embeddings_warmup()
+
 @st.cache_resource
 def initialize_router_agent():
+    from src.agents.router_agent import RouterAgent
     return RouterAgent()
 
 @st.cache_resource
 def initialize_rag():
+    from src.rag.retriever import CustomerHistoryRAG
     return CustomerHistoryRAG()
 
 @st.cache_resource
 def initialize_price_agent():
+    from src.agents.price_margin_agent import PriceMarginAgent
     return PriceMarginAgent()
 
 @st.cache_resource
 def initialize_budget_agent():
+    from src.agents.budget_agent import BudgetCalculatorAgent
     return BudgetCalculatorAgent()
 
 
+def schedule_history_reindex():
+    """Encola la actualización del índice del RAG (importa Chroma solo al usarse)"""
+    from src.rag.index_worker import schedule_history_reindex as programar
+    programar()
+
+@st.cache_resource
+def load_logo():
+    """Bytes del logo para el avatar del asistente (leídos una vez por proceso)"""
+    if not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, "rb") as img_file:
+        return img_file.read()
+
+
+def _candidatos_ambiguos(resolucion: dict):
+    """
+    Si la resolución es ambigua, retorna los candidatos para que el usuario elija
+    (nunca se elige uno por él: la acción siguiente modifica el documento).
+    """
+    if resolucion["resultado"] != "ambiguo":
+        return None
+    return {"candidatos": resolucion["candidatos"][:5]}
+
+
+def formatear_candidatos(candidatos: list, documento: str) -> str:
+    """Mensaje que pide al usuario elegir entre varios presupuestos o facturas"""
+    lineas = [f"He encontrado varios {documento} que encajan. ¿A cuál te refieres? Indícame su número:"]
+    for fila in candidatos:
+        fecha = (fila.get("fecha") or "")[:10]
+        lineas.append(f"- **{fila['numero']}** · {fila['nombre']} ({fila['nif']}){f' · {fecha}' if fecha else ''}")
+    return "\n".join(lineas)
+
+
 def buscar_presupuesto_por_rag(prompt: str):
     """
-    Usa RAG para buscar presupuestos pendientes y luego localiza el archivo JSON.
+    Busca el presupuesto pendiente al que se refiere el usuario.
+    
+    Primero intenta una resolución determinista (número, NIF o nombre) contra el
+    índice de presupuestos. Si es ambigua retorna {"candidatos": [...]} para que el
+    usuario elija; solo si no hay ninguna coincidencia usa RAG.
     """
     try:
+        index = get_budget_index()
+        resolucion = resolver_presupuesto(prompt, estado="Presupuestado", index=index)
+        
+        if resolucion["resultado"] == "unico":
+            return {
+                "path": resolucion["fila"]["path"],
+                "data": index.load(resolucion["fila"]),
+                "numero": resolucion["fila"]["numero"]
+            }
+        if resolucion["metodo"] == "numero":
+            # El usuario dio un número concreto y no está pendiente: no adivinar otro
+            return None
+        ambiguos = _candidatos_ambiguos(resolucion)
+        if ambiguos:
+            return ambiguos
+        
         rag = initialize_rag()
         
         # Construir query más natural para mejorar la búsqueda semántica
         query = f"Estado del presupuesto para: {prompt}"
         
-        result = rag.query(query)
+        # Sin caché de respuestas: aquí se decide sobre qué presupuesto actuar
+        result = rag.query(query, use_cache=False)
         respuesta_rag = result.get("answer", "")
         
         # Intentar extraer el número de presupuesto de la respuesta RAG
@@ -61,43 +127,24 @@ def buscar_presupuesto_por_rag(prompt: str):
         if match:
             presupuesto_numero = match.group(0)
             
-            # Localizar el archivo JSON correspondiente
-            json_path = os.path.join("data/presupuestos", f"presupuesto_{presupuesto_numero}.json")
-            
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Verificar que esté en estado "Presupuestado"
-                    if data.get("estado", "").lower() == "presupuestado":
-                        return {
-                            "path": json_path,
-                            "data": data,
-                            "numero": presupuesto_numero
-                        }
-        
-        # Si no encontramos por número PRES, buscar por nombre de cliente en los JSONs
-        json_files = glob.glob("data/presupuestos/presupuesto_*.json")
-        
-        for json_file in json_files:
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Verificar que esté en estado "Presupuestado"
-                    if data.get("estado", "").lower() == "presupuestado":
-                        cliente_nombre = data.get("cliente", {}).get("nombre", "")
-                        
-                        # Verificar si el nombre del cliente coincide con el prompt
-                        if text_contains_word(cliente_nombre, prompt, min_word_length=4):
-                            presupuesto_numero = data.get("presupuesto_numero")
-                            return {
-                                "path": json_file,
-                                "data": data,
-                                "numero": presupuesto_numero
-                            }
-            except Exception as e:
-                continue
+            # Localizar el JSON correspondiente en el índice, solo si está en estado "Presupuestado"
+            encontrados = index.find(numero=presupuesto_numero, estado="Presupuestado", limit=1)
+            if encontrados:
+                return {
+                    "path": encontrados[0]["path"],
+                    "data": index.load(encontrados[0]),
+                    "numero": presupuesto_numero
+                }
+        
+        # Si no encontramos por número PRES, buscar por nombre de cliente en el índice
+        # (el resolutor no encontró nada, así que no hay otros candidatos que descartar)
+        encontrados = index.find(estado="Presupuestado", name_query=prompt, limit=1)
+        if encontrados:
+            return {
+                "path": encontrados[0]["path"],
+                "data": index.load(encontrados[0]),
+                "numero": encontrados[0]["numero"]
+            }
         
         return None
     
@@ -108,15 +155,35 @@ def buscar_presupuesto_por_rag(prompt: str):
 
 def buscar_factura_por_rag(prompt: str):
     """
-    Usa RAG para buscar facturas pendientes de pago y luego localiza el archivo JSON.
+    Busca la factura pendiente de pago a la que se refiere el usuario.
+    
+    Primero intenta una resolución determinista (número, NIF o nombre) contra el
+    índice de presupuestos. Si es ambigua retorna {"candidatos": [...]} para que el
+    usuario elija; solo si no hay ninguna coincidencia usa RAG.
     """
     try:
+        index = get_budget_index()
+        resolucion = resolver_presupuesto(prompt, estado_pago="Pendiente", index=index)
+        
+        if resolucion["resultado"] == "unico":
+            return {
+                "path": resolucion["fila"]["path"],
+                "data": index.load(resolucion["fila"]),
+                "numero": resolucion["fila"]["numero"]
+            }
+        if resolucion["metodo"] == "numero":
+            return None
+        ambiguos = _candidatos_ambiguos(resolucion)
+        if ambiguos:
+            return ambiguos
+        
         rag = initialize_rag()
         
         # Construir query más natural para mejorar la búsqueda semántica
         query = f"Estado de la factura o presupuesto para: {prompt}"
         
-        result = rag.query(query)
+        # Sin caché de respuestas: aquí se decide sobre qué presupuesto actuar
+        result = rag.query(query, use_cache=False)
         respuesta_rag = result.get("answer", "")
         
         # Intentar extraer el número de presupuesto de la respuesta RAG
@@ -125,47 +192,24 @@ def buscar_factura_por_rag(prompt: str):
         if match:
             presupuesto_numero = match.group(0)
             
-            # Localizar el archivo JSON correspondiente
-            json_path = os.path.join("data/presupuestos", f"presupuesto_{presupuesto_numero}.json")
-            
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Verificar que esté pendiente de pago
-                    if data.get("estadoPago", "").lower() == "pendiente":
-                        return {
-                            "path": json_path,
-                            "data": data,
-                            "numero": presupuesto_numero
-                        }
-        
-        # Si no encontramos por número PRES, intentar buscar por nombre de cliente en los JSONs
-        # Extraer posible nombre del cliente del prompt
-        import os
-        import json
-        
-        json_files = glob.glob("data/presupuestos/presupuesto_*.json")
-        
-        for json_file in json_files:
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Verificar que esté pendiente de pago
-                    if data.get("estadoPago", "").lower() == "pendiente":
-                        cliente_nombre = data.get("cliente", {}).get("nombre", "")
-                        
-                        # Verificar si el nombre del cliente coincide con el prompt
-                        if text_contains_word(cliente_nombre, prompt, min_word_length=4):
-                            presupuesto_numero = data.get("presupuesto_numero")
-                            return {
-                                "path": json_file,
-                                "data": data,
-                                "numero": presupuesto_numero
-                            }
-            except Exception as e:
-                continue
+            # Localizar el JSON correspondiente en el índice, solo si está pendiente de pago
+            encontrados = index.find(numero=presupuesto_numero, estado_pago="Pendiente", limit=1)
+            if encontrados:
+                return {
+                    "path": encontrados[0]["path"],
+                    "data": index.load(encontrados[0]),
+                    "numero": presupuesto_numero
+                }
+        
+        # Si no encontramos por número PRES, buscar por nombre de cliente en el índice
+        # (el resolutor no encontró nada, así que no hay otros candidatos que descartar)
+        encontrados = index.find(estado_pago="Pendiente", name_query=prompt, limit=1)
+        if encontrados:
+            return {
+                "path": encontrados[0]["path"],
+                "data": index.load(encontrados[0]),
+                "numero": encontrados[0]["numero"]
+            }
         
         return None
     
@@ -178,14 +222,13 @@ def handle_mark_as_paid(budget_dict, budget_json_path, chat_history):
     """Marca una factura como pagada en el archivo JSON y actualiza el historial."""
     try:
         # Cargar el JSON actual para asegurar que tenemos la última versión
-        with open(budget_json_path, 'r', encoding='utf-8') as f:
-            current_budget_data = json.load(f)
+        current_budget_data, version = read_json(budget_json_path)
         
         current_budget_data["estadoPago"] = "Pagada"
         current_budget_data["fechaPago"] = datetime.now().isoformat()
         
-        with open(budget_json_path, 'w', encoding='utf-8') as f:
-            json.dump(current_budget_data, f, indent=4, ensure_ascii=False)
+        # Falla con VersionConflictError si otra sesión lo modificó entretanto
+        guardar_presupuesto_json(current_budget_data, budget_json_path, expected_version=version)
         
         st.session_state.messages.append({"role": "assistant", "content": f"✅ Factura {current_budget_data['presupuesto_numero']} marcada como PAGADA."})
         
@@ -195,8 +238,7 @@ def handle_mark_as_paid(budget_dict, budget_json_path, chat_history):
         guardar_historial_resultado = guardar_presupuesto_en_historial(historial_entrada_pagada)
         
         if guardar_historial_resultado["estado"] == "éxito":
-            rebuild_customer_history_vectorstore()
-            st.cache_resource.clear()
+            schedule_history_reindex()
             st.session_state.messages.append({"role": "assistant", "content": "Historial de cliente actualizado (Factura Pagada)."})
         else:
             st.session_state.messages.append({"role": "assistant", "content": f"Error actualizando historial: {guardar_historial_resultado['error']}"})
@@ -204,6 +246,8 @@ def handle_mark_as_paid(budget_dict, budget_json_path, chat_history):
         st.session_state.current_task = None
         st.session_state.rag_refresh = True
         
+    except VersionConflictError:
+        st.session_state.messages.append({"role": "assistant", "content": "⚠️ Esta factura acaba de ser modificada desde otra sesión. Vuelve a intentarlo para trabajar sobre la versión actual."})
     except Exception as e:
         st.session_state.messages.append({"role": "assistant", "content": f"Error al marcar como pagada: {str(e)}"})
 
@@ -212,15 +256,14 @@ def handle_accept_budget(budget_dict, budget_json_path, chat_history):
     """Convierte un presupuesto aceptado en una factura."""
     try:
         # Cargar el JSON actual
-        with open(budget_json_path, 'r', encoding='utf-8') as f:
-            current_budget_data = json.load(f)
+        current_budget_data, version = read_json(budget_json_path)
         
         # 1. Generar la factura en PDF
+        from src.agents.autonomous_agent import generar_pdf_factura_streamlit
         invoice_result = generar_pdf_factura_streamlit(current_budget_data)
         
         if invoice_result["estado"] == "éxito":
-            with open(invoice_result["ruta_completa"], 'rb') as f:
-                st.session_state.invoice_pdf_bytes = f.read()
+            st.session_state.invoice_pdf_bytes = invoice_result["pdf_bytes"]
             st.session_state.messages.append({"role": "assistant", "content": f"✅ Factura {invoice_result['archivo']} generada y guardada."})
         else:
             st.session_state.messages.append({"role": "assistant", "content": f"Error generando factura: {invoice_result['error']}"})
@@ -231,8 +274,7 @@ def handle_accept_budget(budget_dict, budget_json_path, chat_history):
         current_budget_data["estadoPago"] = "Pendiente"
         current_budget_data["fechaFacturacion"] = datetime.now().isoformat()
         
-        with open(budget_json_path, 'w', encoding='utf-8') as f:
-            json.dump(current_budget_data, f, indent=4, ensure_ascii=False)
+        guardar_presupuesto_json(current_budget_data, budget_json_path, expected_version=version)
         
         st.session_state.final_budget_dict = current_budget_data
         st.session_state.messages.append({"role": "assistant", "content": "Estado del presupuesto actualizado a 'Facturado y Pendiente de Pago'."})
@@ -243,8 +285,7 @@ def handle_accept_budget(budget_dict, budget_json_path, chat_history):
         guardar_historial_resultado = guardar_presupuesto_en_historial(historial_entrada)
         
         if guardar_historial_resultado["estado"] == "éxito":
-            rebuild_customer_history_vectorstore()
-            st.cache_resource.clear()
+            schedule_history_reindex()
             st.session_state.messages.append({"role": "assistant", "content": "Historial de cliente actualizado (Factura Pendiente)."})
         else:
             st.session_state.messages.append({"role": "assistant", "content": f"Error actualizando historial: {guardar_historial_resultado['error']}"})
@@ -253,14 +294,38 @@ def handle_accept_budget(budget_dict, budget_json_path, chat_history):
         st.session_state.task_completed = True
         st.session_state.rag_refresh = True
         
+    except VersionConflictError:
+        st.session_state.messages.append({"role": "assistant", "content": "⚠️ Este presupuesto acaba de ser modificado desde otra sesión. Vuelve a intentarlo para trabajar sobre la versión actual."})
     except Exception as e:
         st.session_state.messages.append({"role": "assistant", "content": f"Error al aceptar el presupuesto como factura: {str(e)}"})
 
 
+def stream_sin_json(chunks, recogido: list):
+    """
+    Reenvía los tokens del agente de presupuestos para mostrarlos en streaming,
+    salvo que la respuesta sea el JSON final (que no se enseña al usuario).
+    Todo el texto recibido se acumula en `recogido`.
+    """
+    es_json = None
+    for chunk in chunks:
+        recogido.append(chunk)
+        if es_json is None:
+            inicio = "".join(recogido).lstrip()
+            if not inicio:
+                continue
+            es_json = inicio.startswith("{") or inicio.startswith("```")
+            if not es_json:
+                yield inicio
+        elif not es_json:
+            yield chunk
+
+
 def handle_budget_conversation(prompt, history):
     """Maneja la conversación para crear un presupuesto."""
     agent = initialize_budget_agent()
-    response_text = agent.generate_budget(prompt, chat_history=history)
+    recogido = []
+    st.write_stream(stream_sin_json(agent.generate_budget_stream(prompt, chat_history=history), recogido))
+    response_text = "".join(recogido)
     
     # Intentar extraer el JSON de la respuesta del agente de forma más robusta
     json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
@@ -273,16 +338,15 @@ def handle_budget_conversation(prompt, history):
             st.session_state.messages.append({"role": "assistant", "content": "Perfecto! Tengo todos los datos. Procesando todo automáticamente..."})
             
             with st.spinner("Calculando presupuesto, generando PDFs y guardando en historial..."):
+                from src.agents.autonomous_agent import calcular_presupuesto, generar_pdf_presupuesto_streamlit
+                
                 # 1. Calcular
                 final_budget = calcular_presupuesto(**data_collected)
                 final_budget["estado"] = "Presupuestado"
                 st.session_state.final_budget_dict = final_budget
                 
-                # Guardar JSON
-                os.makedirs("data/presupuestos", exist_ok=True)
-                budget_json_path = os.path.join("data/presupuestos", f"presupuesto_{final_budget['presupuesto_numero']}.json")
-                with open(budget_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(final_budget, f, indent=4, ensure_ascii=False)
+                # Guardar JSON (y registrarlo en el índice de presupuestos)
+                budget_json_path = guardar_presupuesto_json(final_budget)
                 
                 st.session_state.budget_json_path = budget_json_path
                 
@@ -290,8 +354,7 @@ def handle_budget_conversation(prompt, history):
                 pdf_result = generar_pdf_presupuesto_streamlit(final_budget)
                 
                 if pdf_result["estado"] == "éxito":
-                    with open(pdf_result["ruta_completa"], 'rb') as f:
-                        st.session_state.pdf_bytes = f.read()
+                    st.session_state.pdf_bytes = pdf_result["pdf_bytes"]
                     st.session_state.messages.append({"role": "assistant", "content": f"✅ Presupuesto PDF '{pdf_result['archivo']}' generado."})
                 else:
                     # Log the error and inform the user
@@ -304,8 +367,7 @@ def handle_budget_conversation(prompt, history):
                 guardar_resultado = guardar_presupuesto_en_historial(final_budget)
                 
                 if guardar_resultado["estado"] == "éxito":
-                    rebuild_customer_history_vectorstore()
-                    st.cache_resource.clear()
+                    schedule_history_reindex()
                     # Only mark task as completed and show success message if PDF was also successful
                     if st.session_state.pdf_bytes:
                         st.session_state.messages.append({"role": "assistant", "content": "✅ Presupuesto generado! Puedes descargarlo. Si deseas aceptarlo y generar la factura, házmelo saber."})
@@ -334,10 +396,10 @@ def handle_budget_conversation(prompt, history):
 def handle_history_query(prompt):
     """Maneja una consulta al historial de clientes."""
     rag = initialize_rag()
-    with st.spinner("Buscando en el historial..."):
-        result = rag.query(prompt)
+    response = st.write_stream(rag.query_stream(prompt))
     
-    response = result.get("answer", "No he encontrado información sobre eso.")
+    if not response:
+        response = "No he encontrado información sobre eso."
     st.session_state.messages.append({"role": "assistant", "content": response})
     st.session_state.last_rag_response_content = response
     st.session_state.current_task = None
@@ -349,12 +411,11 @@ def handle_margins_query(prompt, history_text):
     
     full_context = f"Historial de trabajos:\n{history_text}\n\nConsulta del usuario: {prompt}"
     
-    with st.spinner("Analizando precios y márgenes..."):
-        analysis = price_agent.analyze_margins(
-            history_text=history_text,
-            job_description=prompt,
-            target_margin_percent=25.0,
-        )
+    analysis = st.write_stream(price_agent.analyze_margins_stream(
+        history_text=history_text,
+        job_description=prompt,
+        target_margin_percent=25.0,
+    ))
     
     st.session_state.messages.append({"role": "assistant", "content": analysis})
     st.session_state.current_task = None
@@ -362,8 +423,13 @@ def handle_margins_query(prompt, history_text):
 
 # ============== UI PRINCIPAL ==============
 
+# Logo como avatar del asistente: Streamlit lo sirve por URL (no se incrusta en cada mensaje)
+logo_avatar = load_logo()
+
 # CSS Personalizado - Paleta Profesional
-st.markdown("""
+# El logo (marca de agua y cabecera) va por URL estática, así que cada rerun solo
+# reenvía este texto, sin imágenes en base64
+CUSTOM_CSS = """
 <style>
     /* Ocultar elementos por defecto de Streamlit */
     #MainMenu {visibility: hidden;}
@@ -384,7 +450,7 @@ st.markdown("""
         transform: translate(-50%, -50%);
         width: 400px;
         height: 400px;
-        background-image: url('data:image/png;base64,LOGO_BASE64');
+        background-image: url('app/static/logo.png');
         background-size: contain;
         background-repeat: no-repeat;
         background-position: center;
@@ -522,45 +588,22 @@ st.markdown("""
         border-top-color: #2563eb !important;
     }
 </style>
-""", unsafe_allow_html=True)
-
-# Cargar logo para marca de agua y avatares
-logo_path = "public/logo.png"
-logo_base64 = ""
-if os.path.exists(logo_path):
-    import base64
-    with open(logo_path, "rb") as img_file:
-        logo_base64 = base64.b64encode(img_file.read()).decode()
-    
-    # Inyectar el logo en el CSS como marca de agua
-    st.markdown(f"""
-    <style>
-        .main::before {{
-            background-image: url('data:image/png;base64,{logo_base64}') !important;
-        }}
-    </style>
-    """, unsafe_allow_html=True)
+"""
+
+HEADER_HTML = f"""
+<div class="custom-header">
+    {f'<img src="{LOGO_URL}" alt="Logo">' if logo_avatar else ''}
+    <div class="custom-header-text">
+        <h1>Entre Brochas</h1>
+        <p>Asistente profesional para gestión empresarial</p>
+    </div>
+</div>
+"""
+
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # Header personalizado con logo
-if logo_base64:
-    st.markdown(f"""
-    <div class="custom-header">
-        <img src="data:image/png;base64,{logo_base64}" alt="Logo">
-        <div class="custom-header-text">
-            <h1>Entre Brochas</h1>
-            <p>Asistente profesional para gestión empresarial</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-else:
-    st.markdown("""
-    <div class="custom-header">
-        <div class="custom-header-text">
-            <h1>Entre Brochas</h1>
-            <p>Asistente profesional para gestión empresarial</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
 # Sidebar
 with st.sidebar:
@@ -612,32 +655,33 @@ if "last_rag_response_content" not in st.session_state:
 if "rag_refresh" not in st.session_state:
     st.session_state.rag_refresh = False
 
-# Mostrar historial del chat con avatares personalizados
-for message in st.session_state.messages:
-    if message["role"] == "assistant" and logo_base64:
-        # Usar el logo como avatar del asistente
-        with st.chat_message(message["role"], avatar=f"data:image/png;base64,{logo_base64}"):
-            st.markdown(message["content"])
-    else:
-        with st.chat_message(message["role"]):
+def pintar_mensajes(mensajes):
+    """Muestra mensajes del chat con avatares personalizados"""
+    for message in mensajes:
+        avatar = logo_avatar if message["role"] == "assistant" else None
+        with st.chat_message(message["role"], avatar=avatar):
             st.markdown(message["content"])
 
-# Input del usuario
-if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
+
+def procesar_mensaje(prompt):
+    """Enruta un mensaje del usuario y ejecuta la tarea correspondiente"""
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.chat_message("user").markdown(prompt)
     
-    with st.chat_message("assistant", avatar=f"data:image/png;base64,{logo_base64}" if logo_base64 else None):
+    with st.chat_message("assistant", avatar=logo_avatar):
         # Lógica principal de enrutamiento
         if st.session_state.current_task is None:
             router = initialize_router_agent()
-            route = router.route(prompt)
+            decision = router.route_with_decision(prompt)
+            print(f"🧭 Ruta '{decision['route']}' decidida por el nivel '{decision['tier']}'")
+            route = decision["route"]
             st.session_state.current_task = route
         else:
             route = st.session_state.current_task
         
         # Ejecutar la tarea correspondiente
         if route == "presupuesto":
+            from langchain_core.messages import HumanMessage, AIMessage
             lc_history = [HumanMessage(content=msg["content"]) if msg["role"] == "user" else AIMessage(content=msg["content"]) 
                          for msg in st.session_state.messages[:-1]]
             handle_budget_conversation(prompt, lc_history)
@@ -659,12 +703,15 @@ if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
                 # Si existe en sesión, usar ese
                 handle_accept_budget(st.session_state.final_budget_dict, st.session_state.budget_json_path, st.session_state.messages[:-1])
             else:
-                # Buscar usando RAG
-                st.session_state.messages.append({"role": "assistant", "content": "🔍 Buscando el presupuesto mediante RAG..."})
+                # Buscar en el índice (y con RAG solo si hace falta)
+                st.session_state.messages.append({"role": "assistant", "content": "🔍 Buscando el presupuesto..."})
                 
                 resultado = buscar_presupuesto_por_rag(prompt)
                 
-                if resultado:
+                if resultado and "candidatos" in resultado:
+                    st.session_state.messages.append({"role": "assistant", "content": formatear_candidatos(resultado["candidatos"], "presupuestos pendientes")})
+                    st.session_state.current_task = None
+                elif resultado:
                     st.session_state.messages.append({"role": "assistant", "content": f"✅ Presupuesto {resultado['numero']} encontrado para {resultado['data']['cliente']['nombre']}. Procediendo a generar la factura..."})
                     handle_accept_budget(resultado['data'], resultado['path'], st.session_state.messages[:-1])
                 else:
@@ -678,11 +725,11 @@ if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
             if match_presupuesto:
                 # Si hay número exacto, usarlo directamente
                 presupuesto_numero_a_pagar = match_presupuesto.group(0)
-                budget_json_path_to_pay = os.path.join("data/presupuestos", f"presupuesto_{presupuesto_numero_a_pagar}.json")
+                fila_a_pagar = get_budget_index().find_by_numero(presupuesto_numero_a_pagar)
                 
-                if os.path.exists(budget_json_path_to_pay):
-                    with open(budget_json_path_to_pay, 'r', encoding='utf-8') as f:
-                        budget_data_to_pay = json.load(f)
+                if fila_a_pagar:
+                    budget_json_path_to_pay = fila_a_pagar["path"]
+                    budget_data_to_pay = get_budget_index().load(fila_a_pagar)
                     
                     if budget_data_to_pay.get("estadoPago") == "Pendiente":
                         handle_mark_as_paid(budget_data_to_pay, budget_json_path_to_pay, st.session_state.messages[:-1])
@@ -691,12 +738,14 @@ if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
                 else:
                     st.session_state.messages.append({"role": "assistant", "content": f"No encontré la factura {presupuesto_numero_a_pagar}."})
             else:
-                # Buscar usando RAG
-                st.session_state.messages.append({"role": "assistant", "content": "🔍 Buscando la factura mediante RAG..."})
+                # Buscar en el índice (y con RAG solo si hace falta)
+                st.session_state.messages.append({"role": "assistant", "content": "🔍 Buscando la factura..."})
                 
                 resultado = buscar_factura_por_rag(prompt)
                 
-                if resultado:
+                if resultado and "candidatos" in resultado:
+                    st.session_state.messages.append({"role": "assistant", "content": formatear_candidatos(resultado["candidatos"], "facturas pendientes")})
+                elif resultado:
                     st.session_state.messages.append({"role": "assistant", "content": f"✅ Factura {resultado['numero']} encontrada para {resultado['data']['cliente']['nombre']}. Marcando como pagada..."})
                     handle_mark_as_paid(resultado['data'], resultado['path'], st.session_state.messages[:-1])
                 else:
@@ -707,42 +756,90 @@ if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
         else:  # Ruta general
             st.session_state.messages.append({"role": "assistant", "content": "Hola, ¿en qué puedo ayudarte? Si necesitas un presupuesto, consultar un historial o analizar precios, solo tienes que pedírmelo."})
             st.session_state.current_task = None
+
+
+def _estado_descargas():
+    """Lo que muestra la sección de descargas (fuera del fragmento de la conversación)"""
+    return (
+        st.session_state.task_completed,
+        id(st.session_state.pdf_bytes),
+        id(st.session_state.invoice_pdf_bytes),
+        id(st.session_state.final_budget_dict),
+    )
+
+
+# Conversación: los mensajes que ya había en la última ejecución completa se pintan
+# aquí y se quedan en la página; el fragmento solo pinta los posteriores y el input.
+# Cada mensaje vuelve a ejecutar solo el fragmento, así que su coste no crece con la
+# longitud del chat; cada MAX_MENSAJES_FRAGMENTO mensajes (o si cambian las
+# descargas) se hace una ejecución completa que los pasa a la parte fija.
+MAX_MENSAJES_FRAGMENTO = 20
+
+st.session_state.mensajes_pintados = len(st.session_state.messages)
+pintar_mensajes(st.session_state.messages)
+
+
+@st.fragment
+def conversacion():
+    pintar_mensajes(st.session_state.messages[st.session_state.mensajes_pintados:])
     
-    st.rerun()
+    # Input del usuario
+    if prompt := st.chat_input("¿Cómo puedo ayudarte?"):
+        descargas = _estado_descargas()
+        procesar_mensaje(prompt)
+        
+        nuevos = len(st.session_state.messages) - st.session_state.mensajes_pintados
+        if _estado_descargas() != descargas or nuevos > MAX_MENSAJES_FRAGMENTO:
+            st.rerun()
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            # El input llegó en una ejecución completa: no hay fragmento que relanzar solo
+            st.rerun()
+
+
+conversacion()
 
 # Lógica para mostrar descargas
-if st.session_state.task_completed and (st.session_state.pdf_bytes or st.session_state.invoice_pdf_bytes):
-    st.markdown("---")
-    st.markdown("### 📥 Descargas Disponibles")
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if st.session_state.pdf_bytes and st.session_state.final_budget_dict:
-            st.download_button(
-                label="📄 Descargar Presupuesto PDF",
-                data=st.session_state.pdf_bytes,
-                file_name=f"presupuesto_{st.session_state.final_budget_dict['presupuesto_numero']}.pdf",
-                mime="application/pdf",
-                type="primary"
-            )
-        else:
-            st.download_button(
-                label="📄 Descargar Presupuesto PDF",
-                data=b"",
-                file_name="presupuesto.pdf",
-                mime="application/pdf",
-                disabled=True
-            )
-    
-    with col2:
-        if st.session_state.invoice_pdf_bytes and st.session_state.final_budget_dict:
-            st.download_button(
-                label="🧾 Descargar Factura PDF",
-                data=st.session_state.invoice_pdf_bytes,
-                file_name=f"factura_{st.session_state.final_budget_dict['presupuesto_numero']}.pdf",
-                mime="application/pdf",
-                type="primary"
-            )
+# Fragmento: pulsar un botón de descarga solo vuelve a ejecutar esta sección, no
+# toda la conversación
+@st.fragment
+def mostrar_descargas():
+    if st.session_state.task_completed and (st.session_state.pdf_bytes or st.session_state.invoice_pdf_bytes):
+        st.markdown("---")
+        st.markdown("### 📥 Descargas Disponibles")
+        col1, col2 = st.columns(2)
+    
+        with col1:
+            if st.session_state.pdf_bytes and st.session_state.final_budget_dict:
+                st.download_button(
+                    label="📄 Descargar Presupuesto PDF",
+                    data=st.session_state.pdf_bytes,
+                    file_name=f"presupuesto_{st.session_state.final_budget_dict['presupuesto_numero']}.pdf",
+                    mime="application/pdf",
+                    type="primary"
+                )
+            else:
+                st.download_button(
+                    label="📄 Descargar Presupuesto PDF",
+                    data=b"",
+                    file_name="presupuesto.pdf",
+                    mime="application/pdf",
+                    disabled=True
+                )
+    
+        with col2:
+            if st.session_state.invoice_pdf_bytes and st.session_state.final_budget_dict:
+                st.download_button(
+                    label="🧾 Descargar Factura PDF",
+                    data=st.session_state.invoice_pdf_bytes,
+                    file_name=f"factura_{st.session_state.final_budget_dict['presupuesto_numero']}.pdf",
+                    mime="application/pdf",
+                    type="primary"
+                )
+
+
+mostrar_descargas()
 
 # Footer
 st.markdown("---")
@@ -750,3 +847,8 @@ st.markdown(
     '<div style="text-align: center; color: gray;"><small>Asistente Empresarial v6.0 | RAG-Powered Search</small></div>',
     unsafe_allow_html=True
 )
+
+# Precalentar el modelo de embeddings una sola vez por proceso, en segundo plano.
+# Va al final del script: su import (LangChain, caché de embeddings) no retrasa el
+# primer render de la página
+initialize_embeddings()
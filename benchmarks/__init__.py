@@ -0,0 +1,6 @@
+"""
+Benchmarks de rendimiento del asistente.
+
+Se ejecutan como módulos desde la raíz del proyecto, p. ej.:
+    python -m benchmarks.history_save
+"""
@@ -0,0 +1,144 @@
+"""
+Latencia de `guardar_presupuesto_en_historial` según el tamaño del historial.
+
+Genera historiales sintéticos de distintos tamaños en un directorio temporal y
+mide tres operaciones: crear una entrada nueva, cambiar el estado de una entrada
+reciente (el caso habitual: facturar o cobrar un presupuesto) y cambiar el estado
+de la entrada más antigua (peor caso: hay que desplazar todo lo que va detrás).
+
+Uso:
+    python -m benchmarks.history_save [--sizes 1000,10000,50000] [--repeat 20] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from src.utils.history_manager import guardar_presupuesto_en_historial, ENCABEZADO_HISTORIAL
+from src.utils.history_index import get_history_index
+
+
+def _presupuesto(i: int, estado: str = "Presupuestado") -> dict:
+    return {
+        "cliente": {
+            "nombre": f"Cliente {i}",
+            "nif": f"{i:08d}X",
+            "email": f"cliente{i}@example.com",
+            "direccion": f"Calle {i}, Sevilla",
+        },
+        "detalles_trabajo": {
+            "area_m2": 50 + i % 200,
+            "tipo_trabajo": "interior",
+            "tipo_pintura": "plástica",
+            "zona": "Interior",
+        },
+        "presupuesto": {"total_con_iva": round(1000 + i * 1.5, 2)},
+        "presupuesto_numero": f"PRES-{i:06d}",
+        "estado": estado,
+    }
+
+
+def _crear_historial(path: str, n: int):
+    """Escribe un historial de n entradas con el mismo formato que la aplicación"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(ENCABEZADO_HISTORIAL)
+        for i in range(n):
+            f.write(f"""
+## Presupuestado - Cliente {i} (01/01/2025 10:00)
+
+**Cliente:** Cliente {i}
+**NIF/CIF:** {i:08d}X
+**Email:** cliente{i}@example.com
+**Dirección:** Calle {i}, Sevilla
+
+**Detalles del trabajo:**
+- Área: {50 + i % 200} m²
+- Tipo de trabajo: interior
+- Tipo de pintura: plástica
+- Zona: Interior
+
+**Total con IVA:** €{round(1000 + i * 1.5, 2)}
+**Estado actual:** Presupuestado
+
+---
+""")
+
+
+def _medir(funcion, repeticiones: int) -> dict:
+    tiempos = []
+    for r in range(repeticiones):
+        inicio = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            resultado = funcion(r)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert resultado["estado"] == "éxito", resultado
+    return {
+        "p50_ms": round(statistics.median(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+    }
+
+
+def run(sizes, repeticiones: int) -> list:
+    resultados = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "customer_history.md")
+            _crear_historial(path, n)
+
+            # Importación inicial al log y construcción del índice (una vez por proceso)
+            inicio = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                guardar_presupuesto_en_historial(_presupuesto(n - 1, "Presupuestado"), path)
+                get_history_index(path)
+            arranque_ms = (time.perf_counter() - inicio) * 1000
+
+            estados = ["Facturado y Pendiente de Pago", "Factura Pagada"]
+            fila = {
+                "entries": n,
+                "file_mb": round(os.path.getsize(path) / 1e6, 2),
+                "startup_ms": round(arranque_ms, 1),
+                "create": _medir(
+                    lambda r: guardar_presupuesto_en_historial(_presupuesto(n + r), path),
+                    repeticiones,
+                ),
+                "update_recent": _medir(
+                    lambda r: guardar_presupuesto_en_historial(_presupuesto(n + r, estados[r % 2]), path),
+                    repeticiones,
+                ),
+                "update_oldest": _medir(
+                    lambda r: guardar_presupuesto_en_historial(_presupuesto(0, estados[r % 2]), path),
+                    repeticiones,
+                ),
+            }
+            resultados.append(fila)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    resultados = run([int(s) for s in args.sizes.split(",")], args.repeat)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'entradas':>9} {'MB':>6} {'arranque':>9} {'crear p50':>10} {'reciente p50':>13} {'antigua p50':>12}")
+    for fila in resultados:
+        print(
+            f"{fila['entries']:>9} {fila['file_mb']:>6} {fila['startup_ms']:>8.1f}ms"
+            f" {fila['create']['p50_ms']:>8.2f}ms {fila['update_recent']['p50_ms']:>11.2f}ms"
+            f" {fila['update_oldest']['p50_ms']:>10.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
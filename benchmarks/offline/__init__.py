@@ -0,0 +1,8 @@
+"""
+Benchmarks offline: la app completa con un LLM de sustitución (sin OpenRouter).
+
+    python -m benchmarks.offline [--sizes 100,10000,100000] [--json]
+"""
+from benchmarks.offline.fakes import FakeChatModel, FakeEmbeddings, modo_offline
+
+__all__ = ["FakeChatModel", "FakeEmbeddings", "modo_offline"]
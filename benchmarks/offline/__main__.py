@@ -0,0 +1,3 @@
+from benchmarks.offline.suite import main
+
+main()
@@ -0,0 +1,164 @@
+"""
+Modelos de sustitución para medir la app sin red: un chat model con respuestas
+guionizadas y latencia configurable, y unos embeddings deterministas.
+
+`modo_offline()` los conecta en los mismos puntos por los que la app crea sus
+modelos: `get_llm` (router, agente de presupuestos, márgenes y RAG),
+`langchain_openai.ChatOpenAI` (AutonomousPresupuestoAgent lo importa al crearse) y
+el modelo de embeddings compartido del proceso.
+"""
+import hashlib
+import json
+import math
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Iterator, List, Optional
+from unittest import mock
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.utils.text_helpers import normalize_text
+
+# Módulos que hacen `from src.llm_setup import get_llm` en su nivel superior
+MODULOS_CON_GET_LLM = (
+    "src.llm_setup",
+    "src.agents.router_agent",
+    "src.agents.budget_agent",
+    "src.agents.price_margin_agent",
+    "src.rag.retriever",
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model local con respuestas guionizadas.
+
+    `guion` es una lista de (regex, respuesta): se usa la primera cuya regex encaje
+    con el texto del último mensaje. La respuesta puede ser un texto o un AIMessage
+    (p. ej. con `tool_calls` para los agentes con herramientas). Si ninguna encaja
+    se responde `respuesta_defecto`.
+
+    La latencia imita a la de un proveedor remoto: `latencia_ms` hasta el primer
+    token y `ms_por_token` entre tokens (en streaming se reparten entre los chunks).
+    """
+
+    guion: List[Any] = []
+    respuesta_defecto: str = "De acuerdo."
+    latencia_ms: float = 0.0
+    ms_por_token: float = 0.0
+    llamadas: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        # Las llamadas a herramientas vienen del guion, no hace falta describirlas
+        return self
+
+    def _responder(self, messages: List[BaseMessage]) -> AIMessage:
+        self.llamadas += 1
+        texto = messages[-1].content if messages else ""
+        if not isinstance(texto, str):
+            texto = str(texto)
+
+        respuesta = self.respuesta_defecto
+        for patron, candidata in self.guion:
+            if re.search(patron, texto):
+                respuesta = candidata
+                break
+        if isinstance(respuesta, AIMessage):
+            return respuesta.model_copy(deep=True)
+        return AIMessage(content=respuesta)
+
+    @staticmethod
+    def _tokens(texto: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", texto)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        mensaje = self._responder(messages)
+        time.sleep((self.latencia_ms + self.ms_por_token * len(self._tokens(mensaje.content))) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        mensaje = self._responder(messages)
+        time.sleep(self.latencia_ms / 1000)
+
+        if mensaje.tool_calls:
+            # Las llamadas a herramientas llegan en un único chunk
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=mensaje.content,
+                tool_call_chunks=[
+                    {
+                        "name": llamada["name"],
+                        "args": json.dumps(llamada["args"], ensure_ascii=False),
+                        "id": llamada["id"],
+                        "index": i,
+                    }
+                    for i, llamada in enumerate(mensaje.tool_calls)
+                ],
+            ))
+            return
+
+        for token in self._tokens(mensaje.content):
+            time.sleep(self.ms_por_token / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings deterministas sin modelo: cada palabra (normalizada, sin tildes) suma
+    ±1 en una dimensión elegida por su hash, y el vector se normaliza. Textos con
+    palabras en común quedan cerca, suficiente para que el retriever devuelva
+    entradas con sentido, y el coste es lineal en el tamaño del texto.
+    """
+
+    def __init__(self, dimensiones: int = 384):
+        self.dimensiones = dimensiones
+
+    def _vector(self, texto: str) -> List[float]:
+        vector = [0.0] * self.dimensiones
+        for palabra in re.findall(r"\w+", normalize_text(texto)):
+            h = int.from_bytes(hashlib.blake2b(palabra.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dimensiones] += 1.0 if h >> 63 else -1.0
+        norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norma for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+@contextmanager
+def modo_offline(llm: Optional[FakeChatModel] = None, embeddings: Optional[Embeddings] = None):
+    """
+    Sustituye los LLM (y opcionalmente el modelo de embeddings) mientras dura el bloque.
+
+    Todos los agentes reciben el mismo `llm`, así que un único guion cubre el router,
+    la conversación de presupuesto, el RAG y el agente autónomo. Con
+    `embeddings=None` se mantiene el modelo real de sentence-transformers.
+    """
+    llm = llm or FakeChatModel()
+
+    def get_llm(temperature=None):
+        return llm
+
+    def chat_openai(*args, **kwargs):
+        return llm
+
+    with ExitStack() as pila:
+        for modulo in MODULOS_CON_GET_LLM:
+            pila.enter_context(mock.patch(f"{modulo}.get_llm", get_llm))
+        pila.enter_context(mock.patch("langchain_openai.ChatOpenAI", chat_openai))
+        if embeddings is not None:
+            pila.enter_context(mock.patch("src.rag.embeddings.get_shared_embeddings", lambda: embeddings))
+        yield llm
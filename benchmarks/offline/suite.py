@@ -0,0 +1,389 @@
+"""
+Benchmarks de los caminos calientes de la app sin OpenRouter ni red.
+
+Los LLM se sustituyen por `FakeChatModel` (respuestas del GUION y latencia
+configurable) y, por defecto, los embeddings por `FakeEmbeddings`, de modo que los
+tiempos miden solo nuestro código: enrutado, conversación de presupuesto, agente
+autónomo, renderizado de PDF y, sobre historiales sintéticos de varios tamaños,
+reconstrucción del índice vectorial, guardado en el historial, reindexación tras
+guardar y consulta RAG.
+
+Todo se escribe en un directorio temporal (historial, Chroma, caché de embeddings
+y de PDFs); `data/` no se toca.
+
+Uso:
+    python -m benchmarks.offline [--sizes 100,10000,100000] [--repeat 10]
+                                 [--llm-latency-ms 0] [--ms-per-token 0]
+                                 [--real-embeddings] [--json]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout, contextmanager
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.history_save import _crear_historial, _presupuesto, _medir
+from benchmarks.offline.fakes import FakeChatModel, FakeEmbeddings, modo_offline
+from benchmarks.pdf_render import PRESUPUESTO_EJEMPLO
+
+DATOS_PRESUPUESTO = {
+    "cliente_nombre": "Ana López",
+    "cliente_nif": "12345678Z",
+    "cliente_direccion": "Calle Sol 3, Sevilla",
+    "area_m2": 85.5,
+    "tipo_pintura": "plástica",
+    "tipo_trabajo": "interior",
+}
+
+# (regex sobre el último mensaje, respuesta). El orden importa: gana la primera.
+GUION = [
+    # Router: el prompt de clasificación
+    (r"Tu única tarea es clasificar", "general"),
+    # RAG: el prompt con el contexto recuperado
+    (r"Contexto de trabajos anteriores", (
+        "Según el historial, el último trabajo para este cliente fue una pintura interior "
+        "con pintura plástica de 120 m², presupuestada en 4.432,96 € con IVA y ya pagada "
+        "(documento PRES-000123)."
+    )),
+    # Agente autónomo: primero la herramienta, después el informe
+    (r"^Genera y guarda", AIMessage(content="", tool_calls=[{
+        "name": "calcular_presupuesto",
+        "args": DATOS_PRESUPUESTO,
+        "id": "call_bench_1",
+    }])),
+    (r"total_con_iva", "He calculado el presupuesto de Ana López: 1.263,26 € con IVA."),
+    # Conversación de presupuesto: pide lo que falta y termina con el JSON
+    (r"\d+(,\d+)?\s*m(2|²)", json.dumps(DATOS_PRESUPUESTO, ensure_ascii=False)),
+    (r"NIF", "Gracias, Ana. ¿Cuántos metros cuadrados hay que pintar y con qué tipo de pintura?"),
+]
+RESPUESTA_DEFECTO = (
+    "¡Hola! Encantado de ayudarte con tu presupuesto. ¿Me indicas tu nombre completo, "
+    "NIF y la dirección donde se realizará el trabajo?"
+)
+
+CONVERSACION_PRESUPUESTO = [
+    "Hola, quiero pintar el salón de mi piso",
+    "Soy Ana López, NIF 12345678Z, Calle Sol 3, Sevilla",
+    "Son 85,5 m2 de plástica en interior",
+]
+
+# Mezcla de entradas que deciden las reglas, los embeddings o el LLM
+ENTRADAS_ROUTER = [
+    "Quiero un presupuesto para pintar mi oficina",
+    "dame el historial de Ana de Armas",
+    "acepto el presupuesto",
+    "la factura PRES-20250101120000 ya está pagada",
+    "es rentable pintar una fachada de 200m2 por 2000 euros?",
+    "hola que tal",
+    "qué opinas del color del techo",
+    "mañana llueve y no sé si ir",
+]
+
+
+def _p50_ms(tiempos: list) -> float:
+    return round(statistics.median(tiempos) * 1000, 3)
+
+
+def _cronometrar(funcion, repeticiones: int) -> dict:
+    """Ejecuta `funcion(r)` varias veces sin su salida por consola"""
+    tiempos = []
+    for r in range(repeticiones):
+        inicio = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            funcion(r)
+        tiempos.append(time.perf_counter() - inicio)
+    return {"p50_ms": _p50_ms(tiempos), "max_ms": round(max(tiempos) * 1000, 3)}
+
+
+def _primer_chunk(chunks) -> tuple:
+    """Consume un stream y retorna (segundos hasta el primer chunk, texto completo)"""
+    inicio = time.perf_counter()
+    primero = None
+    partes = []
+    for chunk in chunks:
+        if primero is None:
+            primero = time.perf_counter() - inicio
+        partes.append(chunk)
+    return primero or 0.0, "".join(partes)
+
+
+@contextmanager
+def _cache_embeddings(directorio: str):
+    """Caché de embeddings nueva en `directorio` para todo lo que use get_cached_embeddings"""
+    from src.rag import embeddings
+    from src.rag.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+    cacheados = CachedEmbeddings(
+        embeddings._LazyEmbeddings(),
+        EmbeddingCache(os.path.join(directorio, "embeddings.sqlite3")),
+        "benchmark",
+    )
+    with mock.patch.object(embeddings, "_cached_embeddings", cacheados):
+        yield cacheados
+
+
+def bench_router(repeticiones: int) -> dict:
+    from src.agents.router_agent import RouterAgent
+
+    # Primera pasada: calentamiento (centroides) y qué nivel decide cada entrada
+    niveles = {}
+    with redirect_stdout(StringIO()):
+        router = RouterAgent()
+        for entrada in ENTRADAS_ROUTER:
+            tier = router.route_with_decision(entrada)["tier"]
+            niveles[tier] = niveles.get(tier, 0) + 1
+
+    tiempos = []
+    for _ in range(repeticiones):
+        for entrada in ENTRADAS_ROUTER:
+            inicio = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                router.route_with_decision(entrada)
+            tiempos.append(time.perf_counter() - inicio)
+
+    return {"p50_ms": _p50_ms(tiempos), "max_ms": round(max(tiempos) * 1000, 3), "tiers": niveles}
+
+
+def bench_conversacion_presupuesto(repeticiones: int) -> dict:
+    """Conversación completa (streaming, como la app) hasta el JSON y el cálculo"""
+    from src.agents.budget_agent import BudgetCalculatorAgent
+    from src.agents.autonomous_agent import calcular_presupuesto
+
+    with redirect_stdout(StringIO()):
+        agente = BudgetCalculatorAgent()
+        agente.setup_agent()
+
+    primeros = []
+    turnos = []
+    totales = []
+    for _ in range(repeticiones):
+        historial = []
+        inicio_total = time.perf_counter()
+        for mensaje in CONVERSACION_PRESUPUESTO:
+            inicio = time.perf_counter()
+            primero, respuesta = _primer_chunk(agente.generate_budget_stream(mensaje, chat_history=historial))
+            turnos.append(time.perf_counter() - inicio)
+            primeros.append(primero)
+            historial += [HumanMessage(content=mensaje), AIMessage(content=respuesta)]
+
+        datos = json.loads(re.search(r"\{.*\}", respuesta, re.DOTALL).group())
+        presupuesto = calcular_presupuesto(**datos)
+        totales.append(time.perf_counter() - inicio_total)
+
+    return {
+        "turns": len(CONVERSACION_PRESUPUESTO),
+        "first_chunk_p50_ms": _p50_ms(primeros),
+        "turn_p50_ms": _p50_ms(turnos),
+        "conversation_p50_ms": _p50_ms(totales),
+        "total_con_iva": presupuesto["presupuesto"]["total_con_iva"],
+    }
+
+
+def bench_agente_autonomo(repeticiones: int) -> dict:
+    """Petición al AutonomousPresupuestoAgent: llamada a herramienta + respuesta final"""
+    from src.agents.autonomous_agent import AutonomousPresupuestoAgent
+
+    with redirect_stdout(StringIO()):
+        agente = AutonomousPresupuestoAgent(api_key="offline")
+        resultado = agente.procesar_solicitud("Genera y guarda el presupuesto de Ana López")
+    if resultado["estado"] != "éxito":
+        raise RuntimeError(resultado["error"])
+
+    return _cronometrar(
+        lambda _: agente.procesar_solicitud("Genera y guarda el presupuesto de Ana López"),
+        repeticiones,
+    )
+
+
+def bench_pdf(repeticiones: int, directorio: str) -> dict:
+    """Render en el pool de procesos frente a un acierto de la caché de PDFs"""
+    from src.utils.pdf_cache import PdfCache
+    from src.utils.pdf_service import get_pdf_service
+
+    servicio = get_pdf_service()
+    servicio.render("presupuesto", PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025")  # arranque del pool
+
+    cache = PdfCache(os.path.join(directorio, "pdfs"))
+    clave = PdfCache.make_key("presupuesto", PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025")
+    cache.put(clave, servicio.render("presupuesto", PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025"))
+
+    return {
+        tipo: {
+            "render": _cronometrar(
+                lambda r: servicio.render(tipo, PRESUPUESTO_EJEMPLO, f"BENCH-{r}", "01/01/2025"),
+                repeticiones,
+            ),
+        }
+        for tipo in ("presupuesto", "factura")
+    } | {"cache_hit": _cronometrar(lambda _: cache.get(clave), repeticiones)}
+
+
+def bench_historial(n: int, repeticiones: int, directorio: str) -> dict:
+    """Índice vectorial, guardado, reindexación y RAG sobre un historial de n entradas"""
+    from src.rag.index_worker import VectorIndexWorker
+    from src.rag.retriever import CustomerHistoryRAG
+    from src.rag.vector_store import CustomerHistoryVectorStore
+    from src.utils.history_manager import guardar_presupuesto_en_historial
+
+    md_path = os.path.join(directorio, "customer_history.md")
+    chroma_dir = os.path.join(directorio, "chroma_db")
+    _crear_historial(md_path, n)
+
+    with _cache_embeddings(directorio):
+        # Reconstrucción completa: todas las entradas pasan por el encoder
+        store = CustomerHistoryVectorStore(md_path, chroma_dir)
+        inicio = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            store.create_vectorstore()
+        reconstruccion = time.perf_counter() - inicio
+
+        # Guardado en el historial (mismo camino que la app al presupuestar y facturar)
+        with redirect_stdout(StringIO()):
+            guardar_presupuesto_en_historial(_presupuesto(n - 1), md_path)
+        estados = ["Facturado y Pendiente de Pago", "Factura Pagada"]
+        crear = _medir(lambda r: guardar_presupuesto_en_historial(_presupuesto(n + r), md_path), repeticiones)
+        actualizar = _medir(
+            lambda r: guardar_presupuesto_en_historial(_presupuesto(n + r, estados[r % 2]), md_path),
+            repeticiones,
+        )
+
+        # Reindexación en segundo plano tras un guardado, hasta que el snapshot se publica
+        worker = VectorIndexWorker(md_path, chroma_dir)
+        worker.store.adopt_snapshot(store)
+        worker.subscribe(store)
+        reindexados = []
+        for r in range(max(1, repeticiones // 5)):
+            with redirect_stdout(StringIO()):
+                guardar_presupuesto_en_historial(_presupuesto(n + repeticiones + r), md_path)
+                inicio = time.perf_counter()
+                worker.schedule_reindex()
+                if not worker.wait_until_idle(timeout=3600):
+                    raise RuntimeError("La reindexación no terminó")
+            reindexados.append(time.perf_counter() - inicio)
+
+        # Consulta RAG en streaming: preguntas distintas (fallo de caché) y repetidas
+        with redirect_stdout(StringIO()):
+            rag = CustomerHistoryRAG()
+            rag.vectorstore = store
+            rag.setup_qa_chain()
+        primeros = []
+        consultas = []
+        for r in range(repeticiones):
+            inicio = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                primero, _ = _primer_chunk(rag.query_stream(f"¿Qué trabajos hicimos para Cliente {(r * 7919) % n}?"))
+            consultas.append(time.perf_counter() - inicio)
+            primeros.append(primero)
+        repetida = _cronometrar(lambda _: _primer_chunk(rag.query_stream("¿Qué trabajos hicimos para Cliente 0?")), repeticiones)
+
+    return {
+        "entries": n,
+        "file_mb": round(os.path.getsize(md_path) / 1e6, 2),
+        "vector_rebuild_ms": round(reconstruccion * 1000, 1),
+        "history_save": {"create": crear, "update_recent": actualizar},
+        "reindex_after_save_p50_ms": _p50_ms(reindexados),
+        "rag_query": {
+            "first_chunk_p50_ms": _p50_ms(primeros),
+            "p50_ms": _p50_ms(consultas),
+            "cached": repetida,
+        },
+    }
+
+
+def run(sizes: list, repeticiones: int, latencia_ms: float = 0.0, ms_por_token: float = 0.0,
+        embeddings_reales: bool = False) -> dict:
+    llm = FakeChatModel(
+        guion=GUION,
+        respuesta_defecto=RESPUESTA_DEFECTO,
+        latencia_ms=latencia_ms,
+        ms_por_token=ms_por_token,
+    )
+    resultados = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": repeticiones,
+            "llm_latency_ms": latencia_ms,
+            "ms_per_token": ms_por_token,
+            "embeddings": "real" if embeddings_reales else "fake",
+        },
+    }
+
+    with modo_offline(llm, None if embeddings_reales else FakeEmbeddings()), tempfile.TemporaryDirectory() as tmp:
+        with _cache_embeddings(tmp):
+            resultados["routing"] = bench_router(repeticiones)
+            resultados["budget_conversation"] = bench_conversacion_presupuesto(repeticiones)
+            resultados["autonomous_agent"] = bench_agente_autonomo(repeticiones)
+        resultados["pdf"] = bench_pdf(repeticiones, tmp)
+
+        resultados["history"] = []
+        for n in sizes:
+            with tempfile.TemporaryDirectory(dir=tmp) as directorio:
+                resultados["history"].append(bench_historial(n, repeticiones, directorio))
+
+    resultados["meta"]["llm_calls"] = llm.llamadas
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="latencia simulada hasta el primer token")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="latencia simulada entre tokens")
+    parser.add_argument("--real-embeddings", action="store_true", help="usar el modelo de sentence-transformers")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    resultados = run(
+        [int(s) for s in args.sizes.split(",")],
+        args.repeat,
+        latencia_ms=args.llm_latency_ms,
+        ms_por_token=args.ms_per_token,
+        embeddings_reales=args.real_embeddings,
+    )
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+        return
+
+    routing = resultados["routing"]
+    print(f"Enrutado:               p50 {routing['p50_ms']:>9.2f} ms  niveles {routing['tiers']}")
+    conversacion = resultados["budget_conversation"]
+    print(
+        f"Conversación ({conversacion['turns']} turnos): p50 {conversacion['conversation_p50_ms']:>9.2f} ms"
+        f"  (turno {conversacion['turn_p50_ms']:.2f} ms, primer chunk {conversacion['first_chunk_p50_ms']:.2f} ms)"
+    )
+    print(f"Agente autónomo:        p50 {resultados['autonomous_agent']['p50_ms']:>9.2f} ms")
+    pdf = resultados["pdf"]
+    print(
+        f"PDF presupuesto:        p50 {pdf['presupuesto']['render']['p50_ms']:>9.2f} ms"
+        f"  (factura {pdf['factura']['render']['p50_ms']:.2f} ms, caché {pdf['cache_hit']['p50_ms']:.3f} ms)"
+    )
+
+    print(
+        f"\n{'entradas':>9} {'MB':>6} {'reconstruir':>12} {'crear p50':>10} {'actualizar p50':>15}"
+        f" {'reindexar p50':>14} {'RAG p50':>10} {'RAG caché':>10}"
+    )
+    for fila in resultados["history"]:
+        print(
+            f"{fila['entries']:>9} {fila['file_mb']:>6} {fila['vector_rebuild_ms']:>10.1f}ms"
+            f" {fila['history_save']['create']['p50_ms']:>8.2f}ms"
+            f" {fila['history_save']['update_recent']['p50_ms']:>13.2f}ms"
+            f" {fila['reindex_after_save_p50_ms']:>12.1f}ms"
+            f" {fila['rag_query']['p50_ms']:>8.2f}ms {fila['rag_query']['cached']['p50_ms']:>8.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Tiempo de renderizado de los PDF de presupuesto y factura.
+
+Compara el camino anterior (entorno de Jinja nuevo y plantilla compilada en cada
+documento) con el renderizador compartido de `src/utils/document_renderer.py`, que
+reutiliza la plantilla ya compilada. La columna "CSS" es lo que tarda xhtml2pdf en
+parsear las hojas de estilo de cada documento: lo máximo que ahorraría cachearlas.
+
+Uso:
+    python -m benchmarks.pdf_render [--repeat 30] [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+from unittest import mock
+
+from jinja2 import Environment, FileSystemLoader
+from xhtml2pdf.context import pisaContext
+from src.utils.document_renderer import DocumentRenderer, PLANTILLAS, TEMPLATES_DIR
+
+PRESUPUESTO_EJEMPLO = {
+    "cliente": {
+        "nombre": "Juan Pérez",
+        "nif": "12345678Z",
+        "direccion": "Calle Mayor 1, Sevilla",
+        "email": "juan@example.com",
+    },
+    "detalles_trabajo": {"area_m2": 120.0, "tipo_pintura": "plástica", "tipo_trabajo": "interior", "zona": "Interior"},
+    "presupuesto": {
+        "costo_material": 1020.0,
+        "costo_mano_obra": 1800.0,
+        "costos_adicionales": {"preparación": 153.0, "transporte": 50.0, "limpieza_final": 30.0},
+        "subtotal_sin_ganancia": 3053.0,
+        "total_sin_iva": 3663.6,
+        "iva_21": 769.36,
+        "total_con_iva": 4432.96,
+    },
+}
+
+
+def _sin_cache(renderer: DocumentRenderer, tipo: str) -> bytes:
+    """Camino anterior: todo se prepara de nuevo para cada documento"""
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    template = env.get_template(PLANTILLAS[tipo])
+    contexto = renderer.build_context(tipo, PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025")
+    return renderer.render_pdf(template.render(**contexto))
+
+
+def _con_renderer(renderer: DocumentRenderer, tipo: str) -> bytes:
+    return renderer.render_document(tipo, PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025")
+
+
+def _medir_css(renderer: DocumentRenderer, tipo: str, repeticiones: int) -> float:
+    """p50 (ms) del parseo de CSS dentro de un documento, instrumentando solo este bloque"""
+    parseo_original = pisaContext.parseCSS
+    tiempos = []
+
+    def parse_css(contexto):
+        inicio = time.perf_counter()
+        parseo_original(contexto)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    with mock.patch.object(pisaContext, "parseCSS", parse_css):
+        for _ in range(repeticiones):
+            _con_renderer(renderer, tipo)
+    return round(statistics.median(tiempos), 3)
+
+
+def _medir(funciones: dict, repeticiones: int) -> dict:
+    """Mide varias variantes intercaladas, para que el ruido de la máquina afecte a todas por igual"""
+    tiempos = {nombre: [] for nombre in funciones}
+    for funcion in funciones.values():
+        funcion()  # calentamiento (imports, fuentes de reportlab, cachés)
+    for _ in range(repeticiones):
+        for nombre, funcion in funciones.items():
+            inicio = time.perf_counter()
+            funcion()
+            tiempos[nombre].append((time.perf_counter() - inicio) * 1000)
+    return {
+        nombre: {
+            "p50_ms": round(statistics.median(valores), 3),
+            "mean_ms": round(statistics.fmean(valores), 3),
+        }
+        for nombre, valores in tiempos.items()
+    }
+
+
+def run(repeticiones: int) -> list:
+    renderer = DocumentRenderer()
+    resultados = []
+    for tipo in PLANTILLAS:
+        contexto = lambda: renderer.build_context(tipo, PRESUPUESTO_EJEMPLO, "BENCH-1", "01/01/2025")
+        resultados.append({
+            "document": tipo,
+            **_medir({
+                "uncached": lambda: _sin_cache(renderer, tipo),
+                "renderer": lambda: _con_renderer(renderer, tipo),
+                "html_only": lambda: renderer.render_html(tipo, **contexto()),
+            }, repeticiones),
+            "css_p50_ms": _medir_css(renderer, tipo, repeticiones),
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    resultados = run(args.repeat)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'documento':>12} {'sin caché p50':>14} {'renderer p50':>13} {'solo HTML p50':>14} {'CSS p50':>9}")
+    for fila in resultados:
+        print(
+            f"{fila['document']:>12} {fila['uncached']['p50_ms']:>12.2f}ms"
+            f" {fila['renderer']['p50_ms']:>11.2f}ms {fila['html_only']['p50_ms']:>12.3f}ms"
+            f" {fila['css_p50_ms']:>7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Tiempo de cálculo de importes: trabajo a trabajo frente al cálculo por lotes.
+
+Compara `pricing.calcular_costes` en un bucle de Python con
+`pricing.calcular_costes_lote` sobre las mismas filas, y comprueba que ambos dan
+exactamente los mismos importes.
+
+Uso:
+    python -m benchmarks.pricing [--sizes 1000 10000 100000] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from src.utils.pricing import (
+    PRECIOS_BASE, MULTIPLICADORES, calcular_costes, calcular_costes_lote, costes_de_fila,
+)
+
+
+def _trabajos(n: int, semilla: int = 0):
+    rng = np.random.default_rng(semilla)
+    areas = np.round(rng.uniform(5, 2000, n), 2)
+    pinturas = rng.choice(list(PRECIOS_BASE) + ["Plástica", "otra"], n)
+    trabajos = rng.choice(list(MULTIPLICADORES) + ["Exterior"], n)
+    return areas, pinturas, trabajos
+
+
+def _escalar(areas, pinturas, trabajos) -> list:
+    return [
+        calcular_costes(area, pintura, trabajo)
+        for area, pintura, trabajo in zip(areas.tolist(), pinturas.tolist(), trabajos.tolist())
+    ]
+
+
+def _p50_ms(funcion, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 3)
+
+
+def run(sizes: list, repeticiones: int) -> list:
+    resultados = []
+    for n in sizes:
+        areas, pinturas, trabajos = _trabajos(n)
+
+        escalar = _escalar(areas, pinturas, trabajos)
+        lote = calcular_costes_lote(areas, pinturas, trabajos)
+        diferencias = sum(1 for i, costes in enumerate(escalar) if costes != costes_de_fila(lote, i))
+
+        resultados.append({
+            "rows": n,
+            "scalar_p50_ms": _p50_ms(lambda: _escalar(areas, pinturas, trabajos), repeticiones),
+            "batch_p50_ms": _p50_ms(lambda: calcular_costes_lote(areas, pinturas, trabajos), repeticiones),
+            "mismatches": diferencias,
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    resultados = run(args.sizes, args.repeat)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'filas':>8} {'escalar p50':>12} {'lote p50':>10} {'diferencias':>12}")
+    for fila in resultados:
+        print(
+            f"{fila['rows']:>8} {fila['scalar_p50_ms']:>10.1f}ms"
+            f" {fila['batch_p50_ms']:>8.1f}ms {fila['mismatches']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
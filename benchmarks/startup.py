@@ -0,0 +1,162 @@
+"""
+Coste de arranque de app.py: tiempo de importación de sus dependencias.
+
+Lee los imports de nivel superior de app.py y los importa en un intérprete nuevo:
+- con `python -X importtime` para el desglose por módulo y por paquete;
+- varias veces sin instrumentar, para el tiempo real de arranque (mediana).
+
+También lista qué dependencias pesadas (Chroma, sentence-transformers, librerías
+de PDF, agentes de LangChain...) se cargan ya al importar, cuando deberían
+cargarse en su primer uso.
+
+Uso:
+    python -m benchmarks.startup [--repeat 5] [--top 15] [--json]
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_PATH = "app.py"
+
+# Dependencias que no deberían cargarse hasta su primer uso
+DEPENDENCIAS_PESADAS = (
+    "chromadb",
+    "langchain_chroma",
+    "langchain_community.vectorstores",
+    "sentence_transformers",
+    "torch",
+    "transformers",
+    "xhtml2pdf",
+    "reportlab",
+    "jinja2",
+    "langchain.agents",
+    "langchain.chains",
+    "langchain_openai",
+    "openai",
+    "langfuse",
+)
+
+
+def modulos_de_app(path: str = APP_PATH) -> list:
+    """Módulos importados en el nivel superior de app.py, en orden"""
+    with open(path, "r", encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=path)
+
+    modulos = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import):
+            modulos.extend(alias.name for alias in nodo.names)
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+            modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+
+def _codigo_import(modulos: list) -> str:
+    return "; ".join(f"import {modulo}" for modulo in modulos)
+
+
+def _entorno() -> dict:
+    entorno = dict(os.environ)
+    entorno.setdefault("PYTHONPATH", os.getcwd())
+    return entorno
+
+
+def medir_importtime(modulos: list) -> list:
+    """
+    Importa los módulos con `-X importtime`.
+
+    Returns:
+        Lista de (módulo, self_us, acumulado_us, profundidad) en el orden del informe
+    """
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _codigo_import(modulos)],
+        capture_output=True, text=True, env=_entorno(),
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        # El nombre va sangrado dos espacios por nivel de anidamiento (más uno fijo)
+        profundidad = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        filas.append((nombre.strip(), int(propio), int(acumulado), profundidad))
+    return filas
+
+
+def medir_arranque(modulos: list, repeticiones: int) -> float:
+    """Mediana en ms del tiempo real de un intérprete nuevo que importa los módulos"""
+    codigo = _codigo_import(modulos)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", codigo], check=True, capture_output=True, env=_entorno())
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 1)
+
+
+def run(repeticiones: int, top: int, modulos: list = None) -> dict:
+    modulos = modulos or modulos_de_app()
+    filas = medir_importtime(modulos)
+
+    por_paquete = {}
+    for nombre, propio, _, _ in filas:
+        paquete = nombre.split(".")[0]
+        por_paquete[paquete] = por_paquete.get(paquete, 0) + propio
+
+    cargados = {nombre for nombre, _, _, _ in filas}
+    acumulado_app = {nombre: acumulado for nombre, _, acumulado, profundidad in filas if profundidad == 0}
+
+    return {
+        "modules": modulos,
+        "startup_wall_ms": medir_arranque(modulos, repeticiones),
+        "import_total_ms": round(sum(propio for _, propio, _, _ in filas) / 1000, 1),
+        "imported_modules": len(filas),
+        "app_imports_ms": {
+            modulo: round(acumulado_app.get(modulo, 0) / 1000, 1) for modulo in modulos
+        },
+        "top_packages_ms": {
+            paquete: round(us / 1000, 1)
+            for paquete, us in sorted(por_paquete.items(), key=lambda x: -x[1])[:top]
+        },
+        "heavy_loaded_at_import": [dep for dep in DEPENDENCIAS_PESADAS if dep in cargados],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    resultado = run(args.repeat, args.top)
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+
+    print(f"Arranque (mediana de {args.repeat}): {resultado['startup_wall_ms']:.1f} ms")
+    print(f"Importación: {resultado['import_total_ms']:.1f} ms en {resultado['imported_modules']} módulos\n")
+
+    print("Imports de app.py (acumulado; cada módulo sin lo ya importado antes):")
+    for modulo, ms in resultado["app_imports_ms"].items():
+        print(f"  {ms:>9.1f} ms  {modulo}")
+
+    print("\nPaquetes más costosos (tiempo propio):")
+    for paquete, ms in resultado["top_packages_ms"].items():
+        print(f"  {ms:>9.1f} ms  {paquete}")
+
+    pesadas = resultado["heavy_loaded_at_import"]
+    print(f"\nDependencias pesadas cargadas al importar: {', '.join(pesadas) if pesadas else 'ninguna'}")
+
+
+if __name__ == "__main__":
+    main()
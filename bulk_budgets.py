@@ -0,0 +1,37 @@
+import json
+import sys
+
+
+def bulk_budgets(path: str, generar_pdfs: bool = True, actualizar_indice: bool = True):
+    """Genera presupuestos por lotes desde un CSV o JSONL de trabajos"""
+    from src.utils.bulk_budgets import leer_trabajos, generar_lote
+    
+    resultado = generar_lote(leer_trabajos(path), generar_pdfs=generar_pdfs, actualizar_indice=actualizar_indice)
+    informe = resultado["informe"]
+    
+    print(f"\n📦 {resultado['presupuestos']}/{resultado['trabajos']} presupuestos, {resultado['pdfs']} PDFs")
+    for etapa, segundos in informe["tiempos_s"].items():
+        print(f"   {etapa:<12} {segundos:>8.3f} s")
+    print(f"   {'total':<12} {informe['total_s']:>8.3f} s ({informe['presupuestos_por_segundo']} presupuestos/s)")
+    for error in resultado["errores"]:
+        print(f"⚠️ {json.dumps(error, ensure_ascii=False)}")
+    
+    if resultado["indice_actualizado"]:
+        print("\n🔄 Índice vectorial sincronizado con el historial")
+    elif resultado["presupuestos"]:
+        print("\n🔄 El índice vectorial se pondrá al día en el próximo arranque de la aplicación")
+    
+    if resultado["presupuestos"] == 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    # Uso: python bulk_budgets.py trabajos.csv [--sin-pdf] [--sin-indice]
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(argumentos) != 1:
+        print("Uso: python bulk_budgets.py trabajos.csv|trabajos.jsonl [--sin-pdf] [--sin-indice]")
+        sys.exit(2)
+    bulk_budgets(
+        argumentos[0],
+        generar_pdfs="--sin-pdf" not in sys.argv[1:],
+        actualizar_indice="--sin-indice" not in sys.argv[1:],
+    )
@@ -0,0 +1,16 @@
+import sys
+
+
+def compact_history():
+    """Compacta el log de eventos del historial y regenera customer_history.md desde él"""
+    from src.utils.history_manager import compactar_historial
+    
+    resultado = compactar_historial()
+    if resultado["estado"] != "éxito":
+        sys.exit(1)
+    
+    print("\n🔄 El índice vectorial se pondrá al día en el próximo arranque de la aplicación")
+
+if __name__ == "__main__":
+    # Uso: python compact_history.py
+    compact_history()
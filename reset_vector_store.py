@@ -1,5 +1,6 @@
 import shutil
 import os
+import sys
 
 def reset_chroma_db():
     """Elimina completamente la base de datos vectorial corrupta"""
@@ -14,5 +15,17 @@ def reset_chroma_db():
     
     print("\n🔄 Ahora reinicia tu aplicación Streamlit")
 
+
+def rebuild_chroma_db():
+    """Reconstruye por completo la base de datos vectorial desde el historial (mantenimiento)"""
+    from src.rag.vector_store import rebuild_customer_history_vectorstore
+    
+    if not rebuild_customer_history_vectorstore():
+        sys.exit(1)
+
 if __name__ == "__main__":
-    reset_chroma_db()
+    # Uso: python reset_vector_store.py [--rebuild]
+    if "--rebuild" in sys.argv[1:]:
+        rebuild_chroma_db()
+    else:
+        reset_chroma_db()
@@ -1,8 +1,17 @@
-from src.agents.budget_agent import BudgetCalculatorAgent
-from src.agents.autonomous_agent import AutonomousPresupuestoAgent
-
-__all__ = [
-    'BudgetCalculatorAgent',
-    'PriceMarginAgent',
-    'AutonomousPresupuestoAgent', 
-]
+"""
+Agentes del asistente.
+
+Los agentes se importan en su primer uso (PEP 562), para no cargar LangChain y
+el cliente de OpenAI al importar un único agente o el paquete.
+"""
+from src.lazy_exports import lazy_exports
+
+_EXPORTS = {
+    'BudgetCalculatorAgent': 'src.agents.budget_agent',
+    'PriceMarginAgent': 'src.agents.price_margin_agent',
+    'AutonomousPresupuestoAgent': 'src.agents.autonomous_agent',
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -4,11 +4,9 @@ Ejecuta acciones de forma independiente sin intervención manual del usuario
 Ahora con PDFs profesionales usando xhtml2pdf (compatible Windows)
 """
 
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain.tools import BaseTool, tool
+from langchain_core.tools import BaseTool, tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 from typing import Optional, Any
 import os
@@ -16,11 +14,10 @@ from datetime import datetime
 import json
 from src.config import MODEL_NAME_DEEPSEEK, OPENROUTER_BASE_URL, TEMPERATURE_AUTONOMOUS
 
-from jinja2 import Environment, FileSystemLoader
-from xhtml2pdf import pisa
-from io import BytesIO
+from src.utils.storage import atomic_write_bytes_async
 
-from src.utils.pdf_helpers import generate_pdf_items
+# El servicio de PDF, su caché, las tarifas y el historial se importan dentro de las
+# herramientas que los usan: importar este módulo no arranca nada de eso
 
 # --- Tools del Agente ---
 
@@ -51,44 +48,7 @@ def calcular_presupuesto(
     Returns:
         dict con presupuesto completo
     """
-    # Precios base por m² según tipo
-    precios_base = {
-        "plástica": 8.50,
-        "acrílica": 12.00,
-        "esmalte": 15.00,
-        "epoxi": 25.00,
-        "poliuretano": 28.00,
-    }
-    
-    # Multiplicadores según tipo de trabajo
-    multiplicadores = {
-        "interior": 1.0,
-        "exterior": 1.3,
-        "restauración": 1.5,
-        "fachada": 1.4,
-    }
-    
-    precio_base = precios_base.get(tipo_pintura.lower(), 10.00)
-    multiplicador = multiplicadores.get(tipo_trabajo.lower(), 1.0)
-    
-    costo_material = area_m2 * precio_base * multiplicador
-    
-    # Calcular costo de mano de obra (1 pintor = 12€/hora, 8m²/hora)
-    horas_trabajo = area_m2 / 8
-    costo_mano_obra = horas_trabajo * 12
-    
-    costos_adicionales = {
-        "preparación": costo_material * 0.15,
-        "transporte": 50.00,
-        "limpieza_final": 30.00,
-    }
-    
-    subtotal = costo_material + costo_mano_obra + sum(costos_adicionales.values())
-    
-    # No se aplica margen de ganancia por solicitud del usuario
-    total_sin_iva = subtotal
-    iva = total_sin_iva * 0.21
-    total_con_iva = total_sin_iva + iva
+    from src.utils.pricing import calcular_costes
     
     presupuesto_numero = f"PRES-{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
@@ -106,15 +66,7 @@ def calcular_presupuesto(
             "tipo_trabajo": tipo_trabajo,
             "zona": zona_trabajo,
         },
-        "presupuesto": {
-            "costo_material": round(costo_material, 2),
-            "costo_mano_obra": round(costo_mano_obra, 2),
-            "costos_adicionales": {k: round(v, 2) for k, v in costos_adicionales.items()},
-            "subtotal_sin_ganancia": round(subtotal, 2),
-            "total_sin_iva": round(total_sin_iva, 2),
-            "iva_21": round(iva, 2),
-            "total_con_iva": round(total_con_iva, 2),
-        },
+        "presupuesto": calcular_costes(area_m2, tipo_pintura, tipo_trabajo),
         "timestamp": datetime.now().isoformat(),
     }
 
@@ -199,64 +151,64 @@ Plazo de pago: 30 días desde emisión
     return factura.strip()
 
 
-@tool
-def generar_pdf_presupuesto(presupuesto_dict: dict) -> dict:
+def _generar_documento_pdf(tipo: str, presupuesto_dict: dict, incluir_bytes: bool = False) -> dict:
     """
-    Genera PDF de PRESUPUESTO con xhtml2pdf.
+    Genera el PDF de un presupuesto o una factura en el pool de renderizado
+    (procesos con las plantillas y el CSS ya compilados).
     
-    Args:
-        presupuesto_dict: Diccionario completo del presupuesto
+    El PDF se genera en memoria y se guarda en disco en segundo plano, así que la
+    respuesta no espera a la escritura ni vuelve a leer el archivo. Si el mismo
+    documento ya se generó (mismos datos y plantilla) se sirve de la caché de PDFs.
     
-    Returns:
-        dict con información del PDF generado
+    Args:
+        incluir_bytes: añade el PDF al resultado ("pdf_bytes"); solo para Streamlit,
+            nunca en las respuestas de las tools del agente
     """
+    from src.utils.pdf_cache import get_pdf_cache
+    from src.utils.pdf_service import get_pdf_service
+    
     try:
         cliente = presupuesto_dict["cliente"]
-        detalles = presupuesto_dict["detalles_trabajo"]
-        presupuesto = presupuesto_dict["presupuesto"]
-        # Configurar Jinja2
-        env = Environment(loader=FileSystemLoader('templates'))
-        template = env.get_template('presupuesto_template.html.j2')
         
-        presupuesto_numero = f"PRES-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # El número sale del presupuesto para que regenerar el mismo documento dé el mismo PDF
+        numero_presupuesto = presupuesto_dict.get("presupuesto_numero")
+        if numero_presupuesto:
+            numero = numero_presupuesto if tipo == "presupuesto" else numero_presupuesto.replace("PRES-", "FAC-", 1)
+        else:
+            prefijo = "PRES" if tipo == "presupuesto" else "FAC"
+            numero = f"{prefijo}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
         fecha_actual = datetime.now().strftime("%d/%m/%Y")
         
-        # Generar items usando la función helper
-        items = generate_pdf_items(presupuesto_dict)
-        
-        html_content = template.render(
-            presupuesto_numero=presupuesto_numero,
-            fecha=fecha_actual,
-            cliente_nombre=cliente['nombre'],
-            cliente_nif=cliente['nif'],
-            cliente_direccion=cliente['direccion'],
-            cliente_email=cliente['email'],
-            items=items,
-            subtotal=f"{presupuesto['subtotal_sin_ganancia']:.2f}",
-
-            base_imponible=f"{presupuesto['total_sin_iva']:.2f}",
-            iva=f"{presupuesto['iva_21']:.2f}",
-            total=f"{presupuesto['total_con_iva']:.2f}"
+        carpeta = "data/presupuestos" if tipo == "presupuesto" else "data/facturas"
+        nombre_archivo = f"{tipo}_{cliente['nombre'].replace(' ', '_').lower()}_{numero}.pdf"
+        ruta_pdf = f"{carpeta}/{nombre_archivo}"
+        
+        cache = get_pdf_cache()
+        clave = cache.make_key(tipo, presupuesto_dict, numero, fecha_actual)
+        pdf_bytes = cache.get(clave)
+        if pdf_bytes is None:
+            pdf_bytes = get_pdf_service().render(tipo, presupuesto_dict, numero, fecha_actual)
+            cache.put(clave, pdf_bytes)
+            atomic_write_bytes_async(ruta_pdf, pdf_bytes)
+        elif not os.path.exists(ruta_pdf):
+            atomic_write_bytes_async(ruta_pdf, pdf_bytes)
+        
+        mensaje = (
+            f"✅ Presupuesto PDF generado para {cliente['nombre']}"
+            if tipo == "presupuesto"
+            else f"✅ Factura PDF generada para {cliente['nombre']}"
         )
-        
-        nombre_archivo = f"presupuesto_{cliente['nombre'].replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        os.makedirs("data/presupuestos", exist_ok=True)
-        ruta_pdf = f"data/presupuestos/{nombre_archivo}"
-        
-        with open(ruta_pdf, "wb") as pdf_file:
-            pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
-        
-        if pisa_status.err:
-            raise Exception(f"Error generando PDF: {pisa_status.err}")
-        
-        return {
+        resultado = {
             "estado": "éxito",
             "archivo": nombre_archivo,
             "ruta_completa": ruta_pdf,
-            "tamano_bytes": os.path.getsize(ruta_pdf),
+            "tamano_bytes": len(pdf_bytes),
             "timestamp": datetime.now().isoformat(),
-            "mensaje": f"✅ Presupuesto PDF generado para {cliente['nombre']}"
+            "mensaje": mensaje
         }
+        if incluir_bytes:
+            resultado["pdf_bytes"] = pdf_bytes
+        return resultado
     
     except Exception as e:
         return {
@@ -266,6 +218,20 @@ def generar_pdf_presupuesto(presupuesto_dict: dict) -> dict:
         }
 
 
+@tool
+def generar_pdf_presupuesto(presupuesto_dict: dict) -> dict:
+    """
+    Genera PDF de PRESUPUESTO con xhtml2pdf.
+    
+    Args:
+        presupuesto_dict: Diccionario completo del presupuesto
+    
+    Returns:
+        dict con información del PDF generado
+    """
+    return _generar_documento_pdf("presupuesto", presupuesto_dict)
+
+
 @tool
 def generar_pdf_factura(presupuesto_dict: dict) -> dict:
     """
@@ -277,58 +243,7 @@ def generar_pdf_factura(presupuesto_dict: dict) -> dict:
     Returns:
         dict con información del PDF generado
     """
-    try:
-        cliente = presupuesto_dict["cliente"]
-        detalles = presupuesto_dict["detalles_trabajo"]
-        presupuesto = presupuesto_dict["presupuesto"]
-        
-        env = Environment(loader=FileSystemLoader('templates'))
-        template = env.get_template('factura_template.html.j2')
-        
-        factura_numero = f"FAC-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        fecha_actual = datetime.now().strftime("%d/%m/%Y")
-        
-        # Generar items usando la función helper
-        items = generate_pdf_items(presupuesto_dict)
-        # Renderizar
-        html_content = template.render(
-            factura_numero=factura_numero,
-            fecha=fecha_actual,
-            cliente_nombre=cliente['nombre'],
-            cliente_nif=cliente['nif'],
-            cliente_direccion=cliente['direccion'],
-            cliente_email=cliente['email'],
-            items=items,
-            subtotal=f"{presupuesto['total_sin_iva']:.2f}",
-            iva=f"{presupuesto['iva_21']:.2f}",
-            total=f"{presupuesto['total_con_iva']:.2f}"
-        )
-        
-        nombre_archivo = f"factura_{cliente['nombre'].replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        os.makedirs("data/facturas", exist_ok=True)
-        ruta_pdf = f"data/facturas/{nombre_archivo}"
-        
-        with open(ruta_pdf, "wb") as pdf_file:
-            pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
-        
-        if pisa_status.err:
-            raise Exception(f"Error generando PDF: {pisa_status.err}")
-        
-        return {
-            "estado": "éxito",
-            "archivo": nombre_archivo,
-            "ruta_completa": ruta_pdf,
-            "tamano_bytes": os.path.getsize(ruta_pdf),
-            "timestamp": datetime.now().isoformat(),
-            "mensaje": f"✅ Factura PDF generada para {cliente['nombre']}"
-        }
-    
-    except Exception as e:
-        return {
-            "estado": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+    return _generar_documento_pdf("factura", presupuesto_dict)
 
 
 @tool
@@ -343,40 +258,15 @@ def guardar_en_historial_cliente(presupuesto_dict: dict, ruta_historial: str = "
     Returns:
         dict con resultado de la operación
     """
+    from src.utils.history_manager import guardar_presupuesto_en_historial
+    
     try:
         cliente = presupuesto_dict["cliente"]
-        detalles = presupuesto_dict["detalles_trabajo"]
-        presupuesto = presupuesto_dict["presupuesto"]
-        
-        entrada_historial = f"""
-## Presupuesto - {cliente['nombre']} ({datetime.now().strftime('%d/%m/%Y %H:%M')})
-
-**Cliente:** {cliente['nombre']}  
-**NIF/CIF:** {cliente['nif']}  
-**Email:** {cliente['email']}  
-**Dirección:** {cliente['direccion']}
-
-**Detalles del trabajo:**
-- Área: {detalles['area_m2']} m²
-- Tipo: {detalles['tipo_trabajo']}
-- Pintura: {detalles['tipo_pintura']}
-- Zona: {detalles['zona']}
-
-**Total con IVA:** €{presupuesto['total_con_iva']}
-
----
-
-"""
-        
-        os.makedirs(os.path.dirname(ruta_historial) or ".", exist_ok=True)
         
-        if os.path.exists(ruta_historial):
-            with open(ruta_historial, "a", encoding="utf-8") as f:
-                f.write(entrada_historial)
-        else:
-            with open(ruta_historial, "w", encoding="utf-8") as f:
-                f.write("# Historial de Presupuestos\n\n")
-                f.write(entrada_historial)
+        # El historial se registra en el log de eventos y la vista Markdown se deriva de él
+        resultado = guardar_presupuesto_en_historial(presupuesto_dict, ruta_historial)
+        if resultado["estado"] != "éxito":
+            raise RuntimeError(resultado["error"])
         
         return {
             "estado": "éxito",
@@ -406,6 +296,11 @@ class AutonomousPresupuestoAgent:
     """
     
     def __init__(self, api_key: Optional[str] = None):
+        # Imports perezosos: el módulo lo importa app.py por sus funciones de cálculo y
+        # PDF, y el agente (langchain.agents, openai) solo se necesita al crearlo
+        from langchain.agents import AgentExecutor, create_tool_calling_agent
+        from langchain_openai import ChatOpenAI
+        
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         
         self.llm = ChatOpenAI(
@@ -416,7 +311,8 @@ class AutonomousPresupuestoAgent:
         )
         
         self.tools = [
-            calcular_presupuesto,
+            # calcular_presupuesto es una función normal (la usa app.py): se envuelve aquí
+            tool(calcular_presupuesto),
             generar_texto_factura,
             generar_pdf_presupuesto,
             generar_pdf_factura,
@@ -532,60 +428,7 @@ def generar_pdf_presupuesto_streamlit(presupuesto_dict: dict) -> dict:
     Versión sin @tool para usar desde Streamlit.
     Genera PDF de PRESUPUESTO con xhtml2pdf.
     """
-    try:
-        cliente = presupuesto_dict["cliente"]
-        detalles = presupuesto_dict["detalles_trabajo"]
-        presupuesto = presupuesto_dict["presupuesto"]
-        
-        env = Environment(loader=FileSystemLoader('templates'))
-        template = env.get_template('presupuesto_template.html.j2')
-        
-        presupuesto_numero = f"PRES-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        fecha_actual = datetime.now().strftime("%d/%m/%Y")
-        
-        # Generar items usando la función helper
-        items = generate_pdf_items(presupuesto_dict)
-        
-        html_content = template.render(
-            presupuesto_numero=presupuesto_numero,
-            fecha=fecha_actual,
-            cliente_nombre=cliente['nombre'],
-            cliente_nif=cliente['nif'],
-            cliente_direccion=cliente['direccion'],
-            cliente_email=cliente['email'],
-            items=items,
-            subtotal=f"{presupuesto['subtotal_sin_ganancia']:.2f}",
-
-            base_imponible=f"{presupuesto['total_sin_iva']:.2f}",
-            iva=f"{presupuesto['iva_21']:.2f}",
-            total=f"{presupuesto['total_con_iva']:.2f}"
-        )
-        
-        nombre_archivo = f"presupuesto_{cliente['nombre'].replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        os.makedirs("data/presupuestos", exist_ok=True)
-        ruta_pdf = f"data/presupuestos/{nombre_archivo}"
-        
-        with open(ruta_pdf, "wb") as pdf_file:
-            pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
-        
-        if pisa_status.err:
-            raise Exception(f"Error generando PDF: {pisa_status.err}")
-        
-        return {
-            "estado": "éxito",
-            "archivo": nombre_archivo,
-            "ruta_completa": ruta_pdf,
-            "tamano_bytes": os.path.getsize(ruta_pdf),
-            "timestamp": datetime.now().isoformat(),
-            "mensaje": f"✅ Presupuesto PDF generado para {cliente['nombre']}"
-        }
-    
-    except Exception as e:
-        return {
-            "estado": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+    return _generar_documento_pdf("presupuesto", presupuesto_dict, incluir_bytes=True)
 
 
 def generar_pdf_factura_streamlit(presupuesto_dict: dict) -> dict:
@@ -593,58 +436,7 @@ def generar_pdf_factura_streamlit(presupuesto_dict: dict) -> dict:
     Versión sin @tool para usar desde Streamlit.
     Genera PDF de FACTURA con xhtml2pdf.
     """
-    try:
-        cliente = presupuesto_dict["cliente"]
-        detalles = presupuesto_dict["detalles_trabajo"]
-        presupuesto = presupuesto_dict["presupuesto"]
-        
-        env = Environment(loader=FileSystemLoader('templates'))
-        template = env.get_template('factura_template.html.j2')
-        
-        factura_numero = f"FAC-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        fecha_actual = datetime.now().strftime("%d/%m/%Y")
-        
-        # Generar items usando la función helper
-        items = generate_pdf_items(presupuesto_dict)
-        
-        html_content = template.render(
-            factura_numero=factura_numero,
-            fecha=fecha_actual,
-            cliente_nombre=cliente['nombre'],
-            cliente_nif=cliente['nif'],
-            cliente_direccion=cliente['direccion'],
-            cliente_email=cliente['email'],
-            items=items,
-            subtotal=f"{presupuesto['total_sin_iva']:.2f}",
-            iva=f"{presupuesto['iva_21']:.2f}",
-            total=f"{presupuesto['total_con_iva']:.2f}"
-        )
-        
-        nombre_archivo = f"factura_{cliente['nombre'].replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        os.makedirs("data/facturas", exist_ok=True)
-        ruta_pdf = f"data/facturas/{nombre_archivo}"
-        
-        with open(ruta_pdf, "wb") as pdf_file:
-            pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
-        
-        if pisa_status.err:
-            raise Exception(f"Error generando PDF: {pisa_status.err}")
-        
-        return {
-            "estado": "éxito",
-            "archivo": nombre_archivo,
-            "ruta_completa": ruta_pdf,
-            "tamano_bytes": os.path.getsize(ruta_pdf),
-            "timestamp": datetime.now().isoformat(),
-            "mensaje": f"✅ Factura PDF generada para {cliente['nombre']}"
-        }
-    
-    except Exception as e:
-        return {
-            "estado": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+    return _generar_documento_pdf("factura", presupuesto_dict, incluir_bytes=True)
 
 
 # --- Ejemplo de Uso ---
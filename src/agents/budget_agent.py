@@ -1,5 +1,4 @@
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from src.llm_setup import get_llm
 from src.config import TEMPERATURE_BUDGET
 
@@ -13,6 +12,7 @@ class BudgetCalculatorAgent:
     def __init__(self):
         self.llm = get_llm(temperature=TEMPERATURE_BUDGET)
         self.agent_executor = None
+        self.prompt = None
         
     def _create_tools(self):
         """Este agente ya no usa herramientas de cálculo. Su única función es conversar."""
@@ -20,6 +20,8 @@ class BudgetCalculatorAgent:
     
     def setup_agent(self):
         """Configura el agente con el nuevo system prompt enfocado en devolver JSON."""
+        # Import perezoso: langchain.agents tarda más de un segundo en importarse
+        from langchain.agents import AgentExecutor, create_openai_functions_agent
         
         system_prompt = """Eres un asistente experto en recopilar información para crear presupuestos de "Entre Brochas".
 
@@ -49,6 +51,7 @@ REGLAS CLAVE:
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
+        self.prompt = prompt
         
         # Este agente ya no necesita tools, pero la función las espera
         agent = create_openai_functions_agent(
@@ -81,3 +84,22 @@ REGLAS CLAVE:
             
         result = self.agent_executor.invoke(inputs)
         return result["output"]
+
+    def generate_budget_stream(self, user_input: str, chat_history=None):
+        """
+        Versión en streaming de `generate_budget`: genera la respuesta token a token.
+        
+        Como este agente no tiene herramientas, el ejecutor equivale a una única
+        llamada al LLM con el mismo prompt, que aquí se hace en modo streaming.
+        """
+        if not self.agent_executor:
+            self.setup_agent()
+        
+        chain = self.prompt | self.llm
+        inputs = {"input": user_input, "agent_scratchpad": []}
+        if chat_history:
+            inputs["chat_history"] = chat_history
+        
+        for chunk in chain.stream(inputs):
+            if chunk.content:
+                yield chunk.content
@@ -0,0 +1,249 @@
+"""
+Clasificador local de intenciones que se ejecuta antes del RouterAgent.
+
+Dos niveles baratos delante de la llamada al LLM:
+1. Reglas (palabras clave y expresiones regulares) para los casos evidentes.
+2. Centroide más cercano sobre los embeddings MiniLM ya cargados en el proceso,
+   construido a partir de los ejemplos del prompt del router.
+
+Si ninguno de los dos está suficientemente seguro, el RouterAgent consulta al LLM.
+Las rutas que cambian el estado de un documento (aceptar un presupuesto, marcar
+una factura como pagada) solo las deciden las reglas o el LLM, nunca la mera
+similitud de embeddings.
+"""
+import math
+import re
+import threading
+from typing import Optional
+
+from src.utils.text_helpers import normalize_text
+
+CATEGORIAS = (
+    "presupuesto",
+    "historial",
+    "margenes",
+    "aceptar_presupuesto",
+    "marcar_pagada",
+    "general",
+)
+
+# Ejemplos del prompt del router más algunas variantes habituales por categoría
+EJEMPLOS_INTENCION = [
+    ("Hola, necesito un presupuesto para pintar 100m2", "presupuesto"),
+    ("¿cuánto le cobramos a juan pérez la última vez?", "historial"),
+    ("merece la pena este trabajo con un margen del 25%?", "margenes"),
+    ("acepto el presupuesto que me has dado", "aceptar_presupuesto"),
+    ("la factura del presupuesto PRES-20231128123456 ya está pagada", "marcar_pagada"),
+    ("gracias", "general"),
+    ("buenos días", "general"),
+    
+    ("Quiero un presupuesto para mi oficina", "presupuesto"),
+    ("hazme un presupuesto de 80 m² de fachada para Ana Ruiz", "presupuesto"),
+    ("generar presupuesto para 50m2 cliente Pepe", "presupuesto"),
+    ("dame el historial de Ana de Armas", "historial"),
+    ("¿qué trabajo le hicimos a María?", "historial"),
+    ("¿qué facturas están pendientes de pago?", "historial"),
+    ("es rentable pintar una fachada de 200m2 por 2000 euros?", "margenes"),
+    ("analiza el precio para pintar una fachada de 300m²", "margenes"),
+    ("¿qué precio mínimo debería cobrar para ganar un 30%?", "margenes"),
+    ("acepta el presupuesto de Juan Pérez", "aceptar_presupuesto"),
+    ("el cliente ha aceptado, genera la factura", "aceptar_presupuesto"),
+    ("¿qué facturas están pagadas?", "historial"),
+    ("¿Carlos Bacca tiene la factura pagada?", "historial"),
+    ("muéstrame las facturas cobradas este mes", "historial"),
+    ("¿qué presupuestos aceptó Carlos?", "historial"),
+    ("la factura de María López ya está pagada", "marcar_pagada"),
+    ("Carlos ya nos ha pagado la factura", "marcar_pagada"),
+    ("hola que tal", "general"),
+    ("adiós", "general"),
+]
+
+# Rutas que modifican un presupuesto o una factura
+RUTAS_CON_ACCION = ("aceptar_presupuesto", "marcar_pagada")
+
+# Umbrales del nivel de embeddings: similitud mínima con el centroide ganador
+# y distancia mínima respecto al segundo
+SIMILITUD_MINIMA = 0.55
+MARGEN_MINIMO = 0.08
+
+_PATRON_PRESUPUESTO = re.compile(r"pres-\d{14}")
+_PATRON_PAGO = re.compile(r"\b(pagad[oa]s?|pagaron|pago ya|ha pagado|cobrad[oa]s?|abonad[oa]s?)\b")
+_PATRON_ACEPTAR = re.compile(r"\bacept\w*")
+# Las reglas que cambian el estado de un documento solo saltan con frases afirmativas
+# o imperativas ("ya está pagada", "marca como pagada", "acepto el presupuesto")
+_PATRON_PAGO_AFIRMADO = re.compile(
+    r"\b(ya|marca\w*\b.*\bcomo|(esta|estan|ha sido|han sido) (pagad|cobrad|abonad)\w*"
+    r"|(ha|han|hemos) (pagado|cobrado|abonado)|pagaron|cobramos)\b"
+)
+_PATRON_ACEPTAR_AFIRMADO = re.compile(r"\b(acepto|aceptamos|acepta|aceptalo|(ha|han) aceptado)\b")
+# Preguntas y peticiones de consulta: nunca deciden una acción por reglas
+_PATRON_CONSULTA = re.compile(
+    r"[¿?]|^(que|cual|cuales|cuanto|cuanta|cuantos|cuantas|quien|quienes|como|cuando|donde|hay|dime|lista\w*|busca\w*)\b"
+    r"|\b(historial|tiene|tienen|muestra\w*|ensena\w*|listado)\b"
+)
+# Negación antes del verbo o participio ("no ha pagado", "aún no está pagada",
+# "sin pagar", "no acepto"): las reglas se abstienen
+_PATRON_NEGACION = re.compile(r"\b(no|nunca|jamas|tampoco|sin)\b.*\b(pag|cobr|abon|acept)\w*")
+_INTERROGATIVOS = re.compile(r"\b(qué|cuál|cuáles|cuánt[oa]s?|quién|quiénes|cómo|cuándo|dónde)\b")
+_PATRON_MARGEN = re.compile(r"\b(margen|margenes|rentable|rentabilidad|merece la pena|beneficio)\b")
+_PATRON_SUPERFICIE = re.compile(r"\d+(?:[.,]\d+)?\s*(m2|m²|metros)")
+_PATRON_HISTORIAL = re.compile(r"\b(historial|le hicimos|ultima vez|le cobramos|trabajos? (anterior|pasad)\w*)\b")
+_SALUDOS = {"hola", "gracias", "buenos dias", "buenas tardes", "buenas noches", "adios", "hasta luego", "ok", "vale"}
+
+
+def _decision(route: str, tier: str, confidence: float) -> dict:
+    return {"route": route, "tier": tier, "confidence": round(confidence, 3)}
+
+
+def classify_by_rules(user_input: str) -> Optional[dict]:
+    """Nivel 1: reglas de palabras clave. Retorna None si ninguna regla es concluyente"""
+    texto = normalize_text(user_input).strip()
+    texto_limpio = re.sub(r"[^\w\s²-]", "", texto).strip()
+    
+    if texto_limpio in _SALUDOS:
+        return _decision("general", "reglas", 1.0)
+    
+    # "pendiente de pago" es una consulta al historial, no un pago
+    hay_pago = bool(_PATRON_PAGO.search(texto)) and "pendiente" not in texto
+    # Una pregunta sobre facturas pagadas o presupuestos aceptados no es una orden:
+    # la deciden los embeddings o el LLM
+    es_consulta = bool(_PATRON_CONSULTA.search(texto) or _INTERROGATIVOS.search(user_input.lower()))
+    # "todavía no ha pagado" o "no acepto el presupuesto" describen lo contrario
+    es_negacion = bool(_PATRON_NEGACION.search(texto))
+    if es_negacion and (hay_pago or _PATRON_ACEPTAR.search(texto)):
+        return None
+    
+    if (hay_pago and not es_consulta and _PATRON_PAGO_AFIRMADO.search(texto)
+            and (_PATRON_PRESUPUESTO.search(texto) or "factura" in texto)):
+        return _decision("marcar_pagada", "reglas", 1.0)
+    
+    if (_PATRON_ACEPTAR.search(texto) and "presupuesto" in texto and not hay_pago
+            and not es_consulta and _PATRON_ACEPTAR_AFIRMADO.search(texto)):
+        return _decision("aceptar_presupuesto", "reglas", 1.0)
+    
+    if _PATRON_MARGEN.search(texto):
+        return _decision("margenes", "reglas", 0.9)
+    
+    if _PATRON_HISTORIAL.search(texto):
+        return _decision("historial", "reglas", 0.9)
+    
+    if "presupuesto" in texto and _PATRON_SUPERFICIE.search(texto):
+        return _decision("presupuesto", "reglas", 0.9)
+    
+    return None
+
+
+class IntentClassifier:
+    """
+    Clasificador local (reglas + centroides de embeddings) para el RouterAgent.
+    
+    Los centroides se calculan la primera vez que se necesitan con el modelo de
+    embeddings compartido del proceso (los ejemplos quedan en la caché de disco).
+    """
+    
+    def __init__(self, embeddings=None):
+        self._embeddings = embeddings
+        self._centroides = None
+        self._lock = threading.Lock()
+    
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from src.rag.embeddings import get_cached_embeddings
+            self._embeddings = get_cached_embeddings()
+        return self._embeddings
+    
+    @staticmethod
+    def _normalizar(vector):
+        norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norma for x in vector]
+    
+    def _get_centroides(self) -> dict:
+        if self._centroides is None:
+            with self._lock:
+                if self._centroides is None:
+                    vectores = self._get_embeddings().embed_documents([t for t, _ in EJEMPLOS_INTENCION])
+                    sumas = {}
+                    for (_, categoria), vector in zip(EJEMPLOS_INTENCION, vectores):
+                        suma = sumas.setdefault(categoria, [0.0] * len(vector))
+                        for i, x in enumerate(vector):
+                            suma[i] += x
+                    self._centroides = {c: self._normalizar(v) for c, v in sumas.items()}
+        return self._centroides
+    
+    def classify_by_embeddings(self, user_input: str) -> Optional[dict]:
+        """
+        Nivel 2: centroide más cercano. Retorna None si la confianza es baja o si la
+        ruta ganadora cambia el estado de un documento (la decide el LLM).
+        """
+        centroides = self._get_centroides()
+        consulta = self._normalizar(self._get_embeddings().embed_query(user_input))
+        
+        similitudes = sorted(
+            ((sum(a * b for a, b in zip(consulta, centroide)), categoria) for categoria, centroide in centroides.items()),
+            reverse=True,
+        )
+        mejor, categoria = similitudes[0]
+        segunda = similitudes[1][0] if len(similitudes) > 1 else 0.0
+        
+        if categoria in RUTAS_CON_ACCION:
+            return None
+        if mejor >= SIMILITUD_MINIMA and mejor - segunda >= MARGEN_MINIMO:
+            return _decision(categoria, "embeddings", mejor)
+        return None
+    
+    def classify(self, user_input: str) -> Optional[dict]:
+        """
+        Clasifica localmente la entrada del usuario.
+        
+        Returns:
+            dict con `route`, `tier` ("reglas" o "embeddings") y `confidence`,
+            o None si hay que consultar al LLM.
+        """
+        decision = classify_by_rules(user_input)
+        if decision:
+            return decision
+        
+        try:
+            return self.classify_by_embeddings(user_input)
+        except Exception as e:
+            print(f"⚠️ Clasificador por embeddings no disponible: {e}")
+            return None
+
+
+# Frases que las reglas nunca deben convertir en una acción (ver classify_by_rules)
+CONSULTAS_SIN_ACCION = [
+    "¿Carlos Bacca tiene la factura pagada?",
+    "¿Qué facturas están pagadas?",
+    "muéstrame las facturas cobradas este mes",
+    "historial de facturas pagadas",
+    "¿qué presupuestos aceptó Carlos?",
+    "que presupuestos acepto carlos",
+    "Carlos todavía no ha pagado la factura",
+    "la factura de Carlos no está pagada todavía",
+    "la factura de Carlos aún no ha sido pagada",
+    "la factura PRES-20231128123456 sigue sin pagar",
+    "Carlos nunca ha pagado la factura",
+    "no acepto el presupuesto de Juan",
+    "el cliente no acepta el presupuesto",
+]
+
+# Órdenes y afirmaciones que sí deciden las reglas
+ACCIONES_POR_REGLAS = [
+    ("la factura PRES-20231128123456 ya está pagada", "marcar_pagada"),
+    ("marca como pagada la factura de Carlos", "marcar_pagada"),
+    ("Carlos ya nos ha pagado la factura", "marcar_pagada"),
+    ("acepto el presupuesto", "aceptar_presupuesto"),
+    ("acepta el presupuesto de Juan Pérez", "aceptar_presupuesto"),
+]
+
+
+if __name__ == '__main__':
+    # Comprobación rápida de las reglas: python -m src.agents.intent_classifier
+    for texto in CONSULTAS_SIN_ACCION:
+        decision = classify_by_rules(texto)
+        assert decision is None or decision["route"] not in RUTAS_CON_ACCION, (texto, decision)
+        print(f"✅ '{texto}' -> {decision['route'] if decision else 'embeddings/LLM'}")
+    for texto, ruta in ACCIONES_POR_REGLAS:
+        decision = classify_by_rules(texto)
+        assert decision and decision["route"] == ruta, (texto, decision)
+        print(f"✅ '{texto}' -> {ruta}")
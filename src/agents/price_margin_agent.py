@@ -16,7 +16,26 @@ class PriceMarginAgent:
         Analiza el historial de presupuestos y sugiere precios mínimos
         para el trabajo descrito, manteniendo al menos el margen objetivo.
         """
-        prompt = f"""
+        prompt = self._build_prompt(history_text, job_description, target_margin_percent)
+        resp = self.llm.invoke(prompt)
+        return resp.content.strip()
+
+    def analyze_margins_stream(
+        self,
+        history_text: str,
+        job_description: str,
+        target_margin_percent: float
+    ):
+        """
+        Versión en streaming de `analyze_margins`: genera el análisis token a token.
+        """
+        prompt = self._build_prompt(history_text, job_description, target_margin_percent)
+        for chunk in self.llm.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+    def _build_prompt(self, history_text: str, job_description: str, target_margin_percent: float) -> str:
+        return f"""
 Eres un asesor de precios y márgenes para una empresa de pintura en España.
 
 Tienes:
@@ -49,5 +68,3 @@ NUEVO TRABAJO A ANALIZAR:
 -------------------------
 {job_description}
 """
-        resp = self.llm.invoke(prompt)
-        return resp.content.strip()
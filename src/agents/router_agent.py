@@ -1,17 +1,22 @@
 from src.llm_setup import get_llm
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from src.agents.intent_classifier import IntentClassifier, CATEGORIAS
 
 class RouterAgent:
     """
     Un agente simple que clasifica la intención del usuario para dirigir la
     solicitud al agente o herramienta adecuada.
+    
+    Antes de llamar al LLM pasa por un clasificador local (reglas + embeddings);
+    el LLM solo se usa cuando la clasificación local no es concluyente.
     """
 
     def __init__(self):
         self.llm = get_llm(temperature=0)
         self.prompt_template = self._create_prompt_template()
         self.chain = self.prompt_template | self.llm | StrOutputParser()
+        self.classifier = IntentClassifier()
 
     def _create_prompt_template(self):
         """
@@ -58,18 +63,35 @@ Usuario: "{user_input}"
 Respuesta:""" 
         return ChatPromptTemplate.from_template(prompt)
 
-    def route(self, user_input: str) -> str:
+    def route_with_decision(self, user_input: str) -> dict:
         """
-        Clasifica la entrada del usuario y devuelve la categoría.
+        Clasifica la entrada del usuario indicando qué nivel tomó la decisión.
+        
+        Returns:
+            dict con `route` (categoría), `tier` ("reglas", "embeddings" o "llm")
+            y `confidence` (None cuando decide el LLM)
         """
+        decision = self.classifier.classify(user_input)
+        if decision:
+            return decision
+        
         try:
             # .invoke espera un diccionario, pasamos el input del usuario
             result = self.chain.invoke({"user_input": user_input})
-            # Limpiamos espacios en blanco o nuevas líneas
-            return result.strip().lower()
+            # Limpiamos espacios en blanco, comillas o nuevas líneas
+            route = result.strip().strip("'\"").lower()
+            if route not in CATEGORIAS:
+                route = "general"
+            return {"route": route, "tier": "llm", "confidence": None}
         except Exception as e:
             print(f"Error al enrutar la solicitud: {e}")
-            return "general"
+            return {"route": "general", "tier": "llm", "confidence": None}
+
+    def route(self, user_input: str) -> str:
+        """
+        Clasifica la entrada del usuario y devuelve la categoría.
+        """
+        return self.route_with_decision(user_input)["route"]
 
 if __name__ == '__main__':
     # Ejemplo de uso
@@ -85,6 +107,6 @@ if __name__ == '__main__':
     ]
     
     for text in test_inputs:
-        route = router.route(text)
-        print(f"Input: '{text}' -> Ruta: '{route}'")
+        decision = router.route_with_decision(text)
+        print(f"Input: '{text}' -> Ruta: '{decision['route']}' (nivel: {decision['tier']})")
 
@@ -12,3 +12,17 @@ MODEL_NAME_DEEPSEEK = "deepseek/deepseek-chat"
 TEMPERATURE = 0.7
 TEMPERATURE_AUTONOMOUS = 0.3
 TEMPERATURE_BUDGET = 0.2
+
+# Modelo de embeddings local (compartido por todo el proceso)
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_CACHE_PATH = "data/cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_MB = 256
+
+# Servicio de renderizado de PDFs (pool de procesos)
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "0")) or None  # None = un proceso por núcleo
+PDF_RENDER_MAX_QUEUE = 32
+PDF_RENDER_TIMEOUT_S = 60
+
+# Caché de PDFs renderizados (por contenido del documento)
+PDF_CACHE_DIR = "data/cache/pdfs"
+PDF_CACHE_MAX_MB = 128
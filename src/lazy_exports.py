@@ -0,0 +1,30 @@
+"""
+Exportaciones perezosas de los paquetes (PEP 562).
+
+Los `__init__` de `src.agents`, `src.rag` y `src.utils` declaran qué nombre sale de
+qué submódulo y obtienen de aquí su `__getattr__` y `__dir__`: el submódulo solo se
+importa cuando alguien pide el nombre, y a partir de ahí queda en el paquete.
+"""
+import importlib
+import sys
+
+
+def lazy_exports(package: str, exports: dict) -> tuple:
+    """
+    Retorna (__getattr__, __dir__) para el paquete `package`.
+
+    Args:
+        package: `__name__` del paquete
+        exports: nombre exportado -> módulo del que se importa
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        valor = getattr(importlib.import_module(exports[name]), name)
+        setattr(sys.modules[package], name, valor)
+        return valor
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(exports))
+
+    return __getattr__, __dir__
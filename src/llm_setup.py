@@ -1,9 +1,11 @@
-from langchain_openai import ChatOpenAI
 from src.config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, MODEL_NAME, TEMPERATURE
 from src.monitoring import get_langfuse_callback
 
 def get_llm(temperature=TEMPERATURE):
     """Configura y retorna el LLM con OpenRouter y callbacks de Langfuse"""
+    # Import perezoso: langchain_openai/openai solo se cargan al crear el primer LLM
+    from langchain_openai import ChatOpenAI
+    
     langfuse_handler = get_langfuse_callback()
     
     return ChatOpenAI(
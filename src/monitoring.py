@@ -1,9 +1,14 @@
 import os
-try:
-    from langfuse.langchain import CallbackHandler
-except ImportError:
-    print("⚠️ Could not import CallbackHandler from langfuse.langchain. Please ensure langfuse is installed correctly.")
-    CallbackHandler = None
+
+
+def _load_callback_handler():
+    # Import perezoso: langfuse solo se carga si hay credenciales configuradas
+    try:
+        from langfuse.langchain import CallbackHandler
+    except ImportError:
+        print("⚠️ Could not import CallbackHandler from langfuse.langchain. Please ensure langfuse is installed correctly.")
+        return None
+    return CallbackHandler
 
 
 def get_langfuse_callback():
@@ -19,7 +24,10 @@ def get_langfuse_callback():
     public_key = os.getenv("LANGFUSE_PUBLIC_KEY")
     secret_key = os.getenv("LANGFUSE_SECRET_KEY")
     
-    if public_key and secret_key and CallbackHandler:
+    if public_key and secret_key:
+        CallbackHandler = _load_callback_handler()
+        if CallbackHandler is None:
+            return None
         try:
             # El CallbackHandler lee automáticamente las variables de entorno
             # No necesita argumentos en el constructor
@@ -1,4 +1,18 @@
-from src.rag.vector_store import CustomerHistoryVectorStore
-from src.rag.retriever import CustomerHistoryRAG
+"""
+Búsqueda sobre el historial de clientes (RAG).
 
-__all__ = ['CustomerHistoryVectorStore', 'CustomerHistoryRAG']
+Los nombres exportados se importan en su primer uso (PEP 562): el vector store y
+el modelo de embeddings solo se cargan cuando alguien los pide.
+"""
+from src.lazy_exports import lazy_exports
+
+_EXPORTS = {
+    'CustomerHistoryVectorStore': 'src.rag.vector_store',
+    'CustomerHistoryRAG': 'src.rag.retriever',
+    'get_shared_embeddings': 'src.rag.embeddings',
+    'warmup_embeddings': 'src.rag.embeddings',
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,160 @@
+"""
+Caché de respuestas del RAG de historial.
+
+Las preguntas se indexan por su texto normalizado y por la versión del historial,
+de modo que tras cualquier escritura en el historial nunca se sirve una respuesta
+antigua. Opcionalmente reconoce preguntas casi idénticas por similitud de embeddings,
+pero solo si mencionan exactamente los mismos identificadores (números PRES, NIF,
+nombres, importes...): dos preguntas sobre clientes distintos pueden tener un
+embedding casi igual y nunca deben compartir respuesta.
+"""
+from collections import OrderedDict
+import math
+import re
+import threading
+import time
+from typing import Optional
+
+from src.utils.text_helpers import normalize_text
+
+
+# Palabras que no identifican a nadie: artículos, preposiciones, interrogativos y
+# verbos de petición. Cualquier otra palabra de la pregunta cuenta como identificador.
+_PALABRAS_VACIAS = frozenset("""
+a al ante con contra de del desde en entre hacia hasta para por segun sin sobre tras
+el la lo los las un una unos unas y e o u ni que se le les me te nos mi mis su sus tu tus
+es son era fue ha han hay esta estan este esto ese eso esa
+cual cuales como cuando cuanto cuanta cuantos cuantas donde quien quienes
+dame dime muestrame ensename quiero quisiera saber puedes podrias favor hola gracias
+""".split())
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza la pregunta: sin tildes, minúsculas, sin signos y espacios colapsados"""
+    texto = re.sub(r"[^\w\s-]", " ", normalize_text(question))
+    return " ".join(texto.split())
+
+
+def question_identifiers(question: str) -> frozenset:
+    """
+    Identificadores que menciona la pregunta (números PRES, NIF, nombres, importes...).
+    
+    Son todas sus palabras salvo las de `_PALABRAS_VACIAS`. Dos preguntas solo pueden
+    compartir respuesta por similitud si sus identificadores coinciden exactamente.
+    """
+    return frozenset(
+        palabra for palabra in normalize_question(question).split()
+        if palabra not in _PALABRAS_VACIAS
+    )
+
+
+class AnswerCache:
+    """
+    Caché LRU con caducidad (TTL) de respuestas del RAG.
+    
+    Args:
+        max_entries: Número máximo de respuestas guardadas (se expulsa la menos usada)
+        ttl_seconds: Segundos que una respuesta se considera válida
+        embeddings: Modelo de embeddings para detectar preguntas casi idénticas (opcional)
+        similarity_threshold: Similitud coseno mínima para considerar dos preguntas iguales
+            (además deben tener los mismos identificadores, ver `question_identifiers`)
+    """
+    
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 3600, embeddings=None, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        
+        # pregunta normalizada -> (instante, vector, identificadores, resultado)
+        self._entradas = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+    
+    def _vector(self, pregunta: str):
+        if self.embeddings is None:
+            return None
+        try:
+            vector = self.embeddings.embed_query(pregunta)
+        except Exception as e:
+            print(f"⚠️ No se pudo calcular el embedding de la pregunta: {e}")
+            return None
+        norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norma for x in vector]
+    
+    def _sincronizar_version(self, version: str):
+        """Descarta todas las respuestas si el historial ha cambiado"""
+        if version != self._version:
+            self._entradas.clear()
+            self._version = version
+    
+    def get(self, question: str, version: str) -> Optional[dict]:
+        """Retorna la respuesta cacheada para la pregunta, o None"""
+        clave = normalize_question(question)
+        ahora = time.time()
+        
+        with self._lock:
+            self._sincronizar_version(version)
+            
+            # Expulsar las entradas caducadas
+            for k in [k for k, (t, _, _, _) in self._entradas.items() if ahora - t > self.ttl_seconds]:
+                del self._entradas[k]
+            
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return self._entradas[clave][3]
+            
+            identificadores = question_identifiers(question)
+            hay_candidatas = any(
+                v is not None and ids == identificadores
+                for _, v, ids, _ in self._entradas.values()
+            )
+        
+        if not hay_candidatas:
+            self.misses += 1
+            return None
+        
+        # Coincidencia aproximada por embeddings (fuera del lock: es la parte lenta)
+        vector = self._vector(question)
+        if vector is None:
+            self.misses += 1
+            return None
+        
+        with self._lock:
+            if version != self._version:
+                self.misses += 1
+                return None
+            
+            mejor_clave, mejor_similitud = None, 0.0
+            for k, (_, v, ids, _) in self._entradas.items():
+                if v is not None and ids == identificadores:
+                    similitud = sum(a * b for a, b in zip(vector, v))
+                    if similitud > mejor_similitud:
+                        mejor_clave, mejor_similitud = k, similitud
+            
+            if mejor_clave is not None and mejor_similitud >= self.similarity_threshold:
+                self._entradas.move_to_end(mejor_clave)
+                self.hits += 1
+                return self._entradas[mejor_clave][3]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, question: str, version: str, result: dict):
+        """Guarda la respuesta de una pregunta para la versión del historial indicada"""
+        vector = self._vector(question)
+        clave = normalize_question(question)
+        
+        with self._lock:
+            self._sincronizar_version(version)
+            self._entradas[clave] = (time.time(), vector, question_identifiers(question), result)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
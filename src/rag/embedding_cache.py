@@ -0,0 +1,158 @@
+"""
+Caché persistente de embeddings indexada por modelo + hash del texto.
+
+Evita volver a pasar por el encoder (CPU) los chunks del historial que no han
+cambiado desde la última vez que se embebieron.
+"""
+from array import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingCache:
+    """
+    Caché de vectores en SQLite con expulsión por tamaño (LRU por último uso).
+    
+    Los vectores se guardan como float32, que es la precisión con la que los
+    devuelve sentence-transformers, así que la lectura es exacta.
+    """
+    
+    def __init__(self, db_path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Clave de caché: hash del modelo y del texto exacto del chunk"""
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+    
+    def get_many(self, model_name: str, texts: List[str]) -> dict:
+        """Retorna {índice: vector} para los textos que ya están en caché"""
+        keys = [self.make_key(model_name, t) for t in texts]
+        encontrados = {}
+        
+        with self._lock, self._connect() as conn:
+            # SQLite limita el número de parámetros por consulta
+            for inicio in range(0, len(keys), 500):
+                lote = keys[inicio:inicio + 500]
+                filas = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(lote))})",
+                    lote,
+                ).fetchall()
+                encontrados.update(filas)
+            
+            if encontrados:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), k) for k in encontrados],
+                )
+        
+        resultado = {}
+        for i, key in enumerate(keys):
+            if key in encontrados:
+                resultado[i] = array("f", encontrados[key]).tolist()
+        
+        self.hits += len(resultado)
+        self.misses += len(texts) - len(resultado)
+        return resultado
+    
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        """Guarda vectores nuevos y aplica la expulsión por tamaño si hace falta"""
+        ahora = time.time()
+        filas = [
+            (self.make_key(model_name, t), model_name, array("f", v).tobytes(), ahora)
+            for t, v in zip(texts, vectors)
+        ]
+        
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                filas,
+            )
+            self._evict(conn)
+    
+    def _evict(self, conn):
+        """Elimina las entradas menos usadas hasta quedar por debajo del tamaño máximo"""
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        liberar = total - int(self.max_bytes * 0.9)
+        liberado = 0
+        keys_a_borrar = []
+        for key, tamano in conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"):
+            keys_a_borrar.append((key,))
+            liberado += tamano
+            if liberado >= liberar:
+                break
+        
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", keys_a_borrar)
+        print(f"🧹 Caché de embeddings: {len(keys_a_borrar)} vectores expulsados")
+    
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos y tamaño actual de la caché"""
+        with self._connect() as conn:
+            entradas, tamano = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+        
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+            "entries": entradas,
+            "size_bytes": tamano,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y consulta la caché antes de codificar.
+    
+    Solo los documentos que no están en caché pasan por el encoder; las
+    consultas (embed_query) se delegan siempre al modelo.
+    """
+    
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectores = self.cache.get_many(self.model_name, texts)
+        
+        pendientes = [i for i in range(len(texts)) if i not in vectores]
+        if pendientes:
+            nuevos = self.embeddings.embed_documents([texts[i] for i in pendientes])
+            self.cache.put_many(self.model_name, [texts[i] for i in pendientes], nuevos)
+            vectores.update(zip(pendientes, nuevos))
+        
+        return [vectores[i] for i in range(len(texts))]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,91 @@
+"""
+Registro de embeddings compartido por todo el proceso.
+
+El modelo de sentence-transformers tarda varios segundos en cargarse, así que se
+crea una única vez (de forma perezosa) y lo reutilizan todos los vector stores,
+retrievers y reconstrucciones del índice.
+"""
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB
+from src.rag.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+_embeddings = None
+_cached_embeddings = None
+_lock = threading.Lock()
+
+
+def get_shared_embeddings() -> Embeddings:
+    """
+    Retorna el modelo de embeddings del proceso, cargándolo en el primer uso.
+    
+    Es seguro llamarla desde varios hilos (sesiones de Streamlit): solo uno
+    carga el modelo y el resto espera a que esté listo.
+    """
+    global _embeddings
+    
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                # Import perezoso: arrastra sentence-transformers y torch
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                
+                _embeddings = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    model_kwargs={'device': 'cpu'},
+                    encode_kwargs={'normalize_embeddings': True}
+                )
+                print("✅ Embeddings locales cargados (multilingüe)")
+    
+    return _embeddings
+
+
+class _LazyEmbeddings(Embeddings):
+    """Proxy que no carga el modelo hasta que realmente hace falta codificar"""
+    
+    def embed_documents(self, texts):
+        return get_shared_embeddings().embed_documents(texts)
+    
+    def embed_query(self, text):
+        return get_shared_embeddings().embed_query(text)
+
+
+def get_cached_embeddings() -> CachedEmbeddings:
+    """
+    Retorna el modelo compartido envuelto con la caché persistente de embeddings.
+    
+    La caché se abre en el primer uso; el modelo solo se carga si hay que
+    codificar algún texto que no esté en caché.
+    """
+    global _cached_embeddings
+    
+    if _cached_embeddings is None:
+        with _lock:
+            if _cached_embeddings is None:
+                cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+                _cached_embeddings = CachedEmbeddings(_LazyEmbeddings(), cache, EMBEDDING_MODEL_NAME)
+    
+    return _cached_embeddings
+
+
+def warmup_embeddings() -> Embeddings:
+    """
+    Carga el modelo y hace un encode de prueba para que la primera consulta
+    real no pague la inicialización perezosa de torch/tokenizer.
+    """
+    embeddings = get_shared_embeddings()
+    embeddings.embed_query("calentamiento del modelo de embeddings")
+    print("🔥 Modelo de embeddings precalentado")
+    return embeddings
+
+
+def start_embeddings_warmup() -> threading.Thread:
+    """
+    Precalienta el modelo en un hilo aparte para no retrasar el primer render de la
+    app. Si llega una consulta antes de que termine, espera en el lock del modelo.
+    """
+    hilo = threading.Thread(target=warmup_embeddings, name="embeddings-warmup", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,110 @@
+"""
+Worker en segundo plano para el mantenimiento del índice vectorial del historial.
+
+Las escrituras en el historial solo encolan una reindexación (`schedule_history_reindex`)
+y vuelven inmediatamente. Un único hilo por vector store aplica los cambios en sitio
+en la colección de Chroma, construye el índice BM25 nuevo y publica el snapshot en
+las instancias suscritas. Mientras tanto estas siguen usando su snapshot BM25 y
+descartan los resultados densos que aún no le corresponden, de modo que nunca
+mezclan dos versiones (ver `CustomerHistoryVectorStore`). Varias peticiones
+seguidas se agrupan en una sola pasada.
+"""
+import threading
+import weakref
+
+from src.rag.vector_store import CustomerHistoryVectorStore
+
+_workers = {}
+_lock = threading.Lock()
+
+
+class VectorIndexWorker:
+    """Hilo de reindexación incremental de un vector store de historial"""
+
+    def __init__(self, markdown_path="data/customer_history.md", persist_directory="./chroma_db"):
+        self.store = CustomerHistoryVectorStore(markdown_path, persist_directory)
+        self._suscriptores = weakref.WeakSet()
+        self._pendiente = threading.Event()
+        self._condicion = threading.Condition()
+        self._solicitadas = 0
+        self._completadas = 0
+        self._hilo = None
+
+    def subscribe(self, store):
+        """Registra una instancia para que reciba cada snapshot nuevo"""
+        self._suscriptores.add(store)
+
+    def seed(self, store):
+        """
+        Parte del snapshot que otra instancia acaba de cargar, para no volver a leer
+        la colección entera de disco en la primera reindexación.
+        """
+        if self.store.vectorstore is None:
+            self.store.adopt_snapshot(store)
+
+    def schedule_reindex(self):
+        """Encola una reindexación; no espera a que termine"""
+        with self._condicion:
+            self._solicitadas += 1
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(
+                    target=self._bucle,
+                    name="vector-index-worker",
+                    daemon=True,
+                )
+                self._hilo.start()
+        self._pendiente.set()
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Espera a que se hayan procesado todas las reindexaciones solicitadas.
+
+        Returns:
+            True si el índice está al día, False si se agotó el timeout
+        """
+        with self._condicion:
+            return self._condicion.wait_for(
+                lambda: self._completadas >= self._solicitadas,
+                timeout=timeout,
+            )
+
+    def _bucle(self):
+        while True:
+            self._pendiente.wait()
+            self._pendiente.clear()
+
+            # Todo lo solicitado hasta aquí queda cubierto por esta pasada
+            with self._condicion:
+                objetivo = self._solicitadas
+
+            try:
+                if self.store.vectorstore is None:
+                    self.store.load_vectorstore(background=False)
+                else:
+                    self.store.sync_vectorstore()
+
+                for store in list(self._suscriptores):
+                    store.adopt_snapshot(self.store)
+            except Exception as e:
+                print(f"❌ Error reindexando el historial en segundo plano: {e}")
+
+            with self._condicion:
+                self._completadas = max(self._completadas, objetivo)
+                self._condicion.notify_all()
+
+
+def get_index_worker(markdown_path="data/customer_history.md", persist_directory="./chroma_db"):
+    """Retorna el worker del proceso para ese historial y directorio de Chroma"""
+    clave = (markdown_path, persist_directory)
+    with _lock:
+        if clave not in _workers:
+            _workers[clave] = VectorIndexWorker(markdown_path, persist_directory)
+        return _workers[clave]
+
+
+def schedule_history_reindex(markdown_path="data/customer_history.md", persist_directory="./chroma_db"):
+    """
+    Helper para llamar desde app.py tras guardar o actualizar el historial: encola
+    la actualización del índice y vuelve sin esperar a los embeddings.
+    """
+    get_index_worker(markdown_path, persist_directory).schedule_reindex()
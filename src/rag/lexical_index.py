@@ -0,0 +1,211 @@
+"""
+Índice léxico BM25 sobre los chunks del historial y retriever híbrido (BM25 + vectores).
+
+El texto se normaliza con `normalize_text` (sin tildes ni mayúsculas), así que
+"Ruben" y "Rubén" son el mismo término, y los identificadores exactos (NIF,
+números PRES-...) se conservan como un único token.
+"""
+from collections import Counter, defaultdict
+import math
+import re
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.utils.text_helpers import normalize_text
+from src.rag.query_filters import matches_where
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados; los guiones se mantienen para no partir "pres-20251210165436" """
+    return re.findall(r"\w+(?:-\w+)*", normalize_text(text))
+
+
+def document_key(doc: Document) -> tuple:
+    """Identidad de un chunk para combinar resultados de distintos retrievers"""
+    return (doc.metadata.get("entry_id"), doc.page_content)
+
+
+class BM25Index:
+    """
+    Índice invertido con puntuación BM25 (Okapi) construido en memoria.
+    
+    No se modifica una vez creado: `with_changes` devuelve un índice nuevo que
+    comparte con este todo lo que no cambia, así que los lectores del índice
+    anterior no ven estados intermedios.
+    """
+    
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        
+        # Posición -> documento (None si se quitó) y su longitud en tokens
+        self.documents = []
+        self._longitudes = []
+        self._postings = {}  # término -> {posición del doc: frecuencia}
+        self._posiciones = {}  # entry_id -> posición
+        self._longitud_total = 0
+        self._vivos = 0
+        self._agregar(documents, copiados=None)
+    
+    def __len__(self) -> int:
+        return self._vivos
+    
+    @property
+    def _longitud_media(self) -> float:
+        return self._longitud_total / self._vivos if self._vivos else 0.0
+    
+    def _posting(self, termino: str, copiados) -> dict:
+        """Lista de posting modificable; con `copiados` se copia antes de tocarla"""
+        postings = self._postings.get(termino)
+        if postings is None:
+            postings = self._postings[termino] = {}
+        elif copiados is not None and termino not in copiados:
+            postings = self._postings[termino] = dict(postings)
+            copiados.add(termino)
+        return postings
+    
+    def _agregar(self, documents, copiados):
+        for doc in documents:
+            i = len(self.documents)
+            frecuencias = Counter(tokenize(doc.page_content))
+            self.documents.append(doc)
+            self._longitudes.append(sum(frecuencias.values()))
+            self._longitud_total += self._longitudes[i]
+            self._vivos += 1
+            if "entry_id" in doc.metadata:
+                self._posiciones[doc.metadata["entry_id"]] = i
+            for termino, tf in frecuencias.items():
+                self._posting(termino, copiados)[i] = tf
+    
+    def _quitar(self, entry_id: str, copiados):
+        i = self._posiciones.pop(entry_id, None)
+        if i is None:
+            return
+        for termino in set(tokenize(self.documents[i].page_content)):
+            postings = self._posting(termino, copiados)
+            postings.pop(i, None)
+            if not postings:
+                del self._postings[termino]
+        self._longitud_total -= self._longitudes[i]
+        self._vivos -= 1
+        self.documents[i] = None
+        self._longitudes[i] = 0
+    
+    def with_changes(self, added: List[Document], removed_entry_ids=()) -> "BM25Index":
+        """
+        Índice nuevo con los documentos `added` (sustituyen a los del mismo `entry_id`)
+        y sin los de `removed_entry_ids`.
+        
+        Solo se tokenizan los documentos que cambian; del resto se copian las
+        estructuras por referencia (las listas de posting que cambian se copian antes
+        de modificarlas).
+        """
+        nuevo = BM25Index([], k1=self.k1, b=self.b)
+        nuevo.documents = list(self.documents)
+        nuevo._longitudes = list(self._longitudes)
+        nuevo._postings = dict(self._postings)
+        nuevo._posiciones = dict(self._posiciones)
+        nuevo._longitud_total = self._longitud_total
+        nuevo._vivos = self._vivos
+        
+        copiados = set()
+        for entry_id in list(removed_entry_ids) + [d.metadata.get("entry_id") for d in added]:
+            nuevo._quitar(entry_id, copiados)
+        nuevo._agregar(added, copiados)
+        return nuevo
+    
+    def _idf(self, termino: str) -> float:
+        n = len(self._postings.get(termino, ()))
+        return math.log(1 + (self._vivos - n + 0.5) / (n + 0.5))
+    
+    def search(self, query: str, k: int = 8, filter_fn=None) -> List[tuple]:
+        """
+        Busca los `k` documentos con mayor puntuación BM25.
+        
+        Returns:
+            Lista de tuplas (Document, puntuación), de mayor a menor
+        """
+        puntuaciones = defaultdict(float)
+        longitud_media = self._longitud_media or 1.0
+        for termino in set(tokenize(query)):
+            postings = self._postings.get(termino)
+            if not postings:
+                continue
+            idf = self._idf(termino)
+            for i, tf in postings.items():
+                norma = self.k1 * (1 - self.b + self.b * self._longitudes[i] / longitud_media)
+                puntuaciones[i] += idf * tf * (self.k1 + 1) / (tf + norma)
+        
+        ordenados = sorted(puntuaciones.items(), key=lambda par: par[1], reverse=True)
+        resultados = []
+        for i, puntuacion in ordenados:
+            if filter_fn is None or filter_fn(self.documents[i]):
+                resultados.append((self.documents[i], puntuacion))
+                if len(resultados) >= k:
+                    break
+        return resultados
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Combina varias listas ordenadas de documentos con Reciprocal Rank Fusion"""
+    puntuaciones = defaultdict(float)
+    documentos = {}
+    for ranking in rankings:
+        for posicion, doc in enumerate(ranking):
+            clave = document_key(doc)
+            documentos.setdefault(clave, doc)
+            puntuaciones[clave] += 1.0 / (rrf_k + posicion + 1)
+    
+    ordenadas = sorted(puntuaciones, key=puntuaciones.get, reverse=True)
+    return [documentos[clave] for clave in ordenadas[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever híbrido: búsqueda densa en Chroma + BM25 léxico, combinados con RRF.
+    
+    Cada lado aporta `fetch_k` candidatos y se devuelven los `k` mejores. Si se
+    indica `filter` (un `where` de Chroma), ambos lados solo consideran las
+    entradas cuyos metadatos lo cumplen.
+    
+    La colección de Chroma se actualiza en sitio mientras el índice BM25 es un
+    snapshot inmutable. Con `entradas` (entry_id -> (hash, ids), las del mismo
+    snapshot que `lexical_index`) se descartan los resultados densos de versiones
+    que el snapshot no conoce, así que nunca se mezclan dos versiones del historial.
+    """
+    
+    vectorstore: Any
+    lexical_index: BM25Index
+    entradas: Optional[dict] = None
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+    filter: Optional[dict] = None
+    
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        if not len(self.lexical_index):
+            # Historial vacío: no hay nada que buscar en ninguno de los dos lados
+            return []
+        
+        if self.filter:
+            densos = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=self.filter)
+            lexicos = [
+                doc for doc, _ in self.lexical_index.search(
+                    query, k=self.fetch_k, filter_fn=lambda d: matches_where(d.metadata, self.filter)
+                )
+            ]
+        else:
+            densos = self.vectorstore.similarity_search(query, k=self.fetch_k)
+            lexicos = [doc for doc, _ in self.lexical_index.search(query, k=self.fetch_k)]
+        if self.entradas is not None:
+            densos = [doc for doc in densos if self._del_snapshot(doc)]
+        return reciprocal_rank_fusion([lexicos, densos], k=self.k, rrf_k=self.rrf_k)
+    
+    def _del_snapshot(self, doc: Document) -> bool:
+        indexada = self.entradas.get(doc.metadata.get("entry_id"))
+        return indexada is not None and indexada[0] == doc.metadata.get("entry_hash")
@@ -0,0 +1,116 @@
+"""
+Extracción de filtros de metadatos a partir de la pregunta del usuario.
+
+Las preguntas del tipo "facturas pendientes de pago" o "trabajos de este mes" se
+traducen a un filtro `where` de Chroma sobre los metadatos de cada entrada del
+historial, de modo que la búsqueda vectorial solo considera los candidatos que
+cumplen el filtro.
+"""
+from datetime import datetime, timedelta
+import re
+from typing import Optional
+
+from src.utils.text_helpers import normalize_text
+from src.utils.budget_resolver import PATRON_NIF
+
+
+def estado_pago_de(estado: Optional[str]) -> Optional[str]:
+    """Deriva el estado de pago ("pendiente"/"pagada") del estado de una entrada"""
+    estado = normalize_text(estado or "")
+    if "pagada" in estado and "pendiente" not in estado:
+        return "pagada"
+    if "pendiente" in estado:
+        return "pendiente"
+    return None
+
+
+def _ventana_temporal(texto: str, ahora: datetime):
+    """Retorna (desde, hasta) para expresiones temporales frecuentes, o None"""
+    hoy = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    if re.search(r"\bhoy\b", texto):
+        return hoy, None
+    if re.search(r"\bayer\b", texto):
+        return hoy - timedelta(days=1), hoy
+    if re.search(r"\besta semana\b", texto):
+        return hoy - timedelta(days=hoy.weekday()), None
+    if re.search(r"\b(ultima semana|ultimos 7 dias)\b", texto):
+        return ahora - timedelta(days=7), None
+    if re.search(r"\beste mes\b", texto):
+        return hoy.replace(day=1), None
+    if re.search(r"\bmes pasado\b", texto):
+        inicio_mes = hoy.replace(day=1)
+        return (inicio_mes - timedelta(days=1)).replace(day=1), inicio_mes
+    if re.search(r"\b(ultimo mes|ultimos 30 dias)\b", texto):
+        return ahora - timedelta(days=30), None
+    if re.search(r"\beste ano\b", texto):
+        return hoy.replace(month=1, day=1), None
+    return None
+
+
+def extract_filters(question: str, now: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Extrae filtros simples (estado, estado de pago, NIF y ventana de fechas).
+    
+    Returns:
+        Filtro `where` de Chroma sobre los metadatos de las entradas, o None si
+        la pregunta no contiene ningún filtro reconocible
+    """
+    texto = normalize_text(question)
+    condiciones = []
+    
+    if re.search(r"pendientes? de pago|sin pagar|por cobrar|sin cobrar", texto):
+        condiciones.append({"estado_pago": "pendiente"})
+    elif re.search(r"\b(pagad[oa]s?|cobrad[oa]s?)\b", texto):
+        condiciones.append({"estado_pago": "pagada"})
+    elif re.search(r"\bpresupuestad[oa]s?\b|sin aceptar|sin facturar", texto):
+        condiciones.append({"estado_normalizado": "presupuestado"})
+    
+    match_nif = PATRON_NIF.search(question)
+    if match_nif:
+        condiciones.append({"nif": match_nif.group(0).upper()})
+    
+    ventana = _ventana_temporal(texto, now or datetime.now())
+    if ventana:
+        desde, hasta = ventana
+        condiciones.append({"fecha_ts": {"$gte": int(desde.timestamp())}})
+        if hasta:
+            condiciones.append({"fecha_ts": {"$lt": int(hasta.timestamp())}})
+    
+    if not condiciones:
+        return None
+    if len(condiciones) == 1:
+        return condiciones[0]
+    return {"$and": condiciones}
+
+
+_OPERADORES = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+}
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evalúa en Python un filtro `where` de Chroma (para el lado BM25 del retriever)"""
+    if not where:
+        return True
+    
+    for clave, condicion in where.items():
+        if clave == "$and":
+            if not all(matches_where(metadata, c) for c in condicion):
+                return False
+        elif clave == "$or":
+            if not any(matches_where(metadata, c) for c in condicion):
+                return False
+        elif isinstance(condicion, dict):
+            valor = metadata.get(clave)
+            if not all(_OPERADORES[op](valor, esperado) for op, esperado in condicion.items()):
+                return False
+        elif metadata.get(clave) != condicion:
+            return False
+    
+    return True
@@ -1,18 +1,34 @@
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
 from src.llm_setup import get_llm
 from src.rag.vector_store import CustomerHistoryVectorStore
+from src.rag.answer_cache import AnswerCache
+from src.rag.embeddings import get_cached_embeddings
+from src.rag.query_filters import extract_filters
+from src.utils.history_manager import get_history_version
 
 class CustomerHistoryRAG:
     def __init__(self):
         self.vectorstore = CustomerHistoryVectorStore()
         self.llm = get_llm(temperature=0.3)
         self.qa_chain = None
+        self.retriever = None
+        self.prompt = None
+        # Snapshot del índice sobre el que está montada la cadena (ver index_worker)
+        self.snapshot_id = None
+        # Respuestas repetidas al instante; se invalidan con cualquier escritura del historial
+        self.answer_cache = AnswerCache(
+            max_entries=128,
+            ttl_seconds=6 * 3600,
+            embeddings=get_cached_embeddings(),
+        )
     
     def setup_qa_chain(self):
         """Configura la cadena de QA con RAG"""
         try:
-            retriever = self.vectorstore.get_retriever(k=8)  # Aumentado para mejor cobertura
+            # Híbrido (BM25 + vectores): los NIF y números PRES aciertan con menos chunks
+            retriever = self.vectorstore.get_retriever(k=5)
+            self.retriever = retriever
+            self.snapshot_id = self.vectorstore.snapshot_id
             
             # Prompt personalizado para el contexto de empresa de pinturas
             template = """Eres un asistente experto de una empresa de pinturas. Tu trabajo es ayudar a consultar el historial de trabajos realizados.
@@ -43,8 +59,10 @@ Respuesta:"""
                 template=template,
                 input_variables=["context", "question"]
             )
+            self.prompt = PROMPT
             
-            # Crear la cadena de RetrievalQA
+            # Crear la cadena de RetrievalQA (import perezoso: langchain.chains es pesado)
+            from langchain.chains import RetrievalQA
             self.qa_chain = RetrievalQA.from_chain_type(
                 llm=self.llm,
                 chain_type="stuff",
@@ -60,18 +78,77 @@ Respuesta:"""
             print(f"❌ Error configurando cadena RAG: {e}")
             raise
     
-    def query(self, question: str):
-        """Realiza una consulta al sistema RAG"""
+    def refresh_retriever(self):
+        """
+        Sustituye en el sitio el retriever por uno sobre el snapshot actual del índice.
+        
+        Es lo único que depende de la versión del historial: el LLM, el prompt y la
+        cadena se conservan.
+        """
+        retriever = self.vectorstore.get_retriever(k=5)
+        self.retriever = retriever
+        self.qa_chain.retriever = retriever
+        self.snapshot_id = self.vectorstore.snapshot_id
+        print(f"🔁 Retriever actualizado al snapshot {self.snapshot_id}")
+    
+    def _ensure_current_snapshot(self):
+        """Monta la cadena la primera vez y cambia el retriever si el worker publicó un snapshot nuevo"""
+        if not self.qa_chain:
+            self.setup_qa_chain()
+        elif self.vectorstore.snapshot_id != self.snapshot_id:
+            self.refresh_retriever()
+    
+    def _cache_version(self):
+        """Versión de la caché de respuestas: historial en disco + snapshot del índice"""
+        self._ensure_current_snapshot()
+        return f"{get_history_version(self.vectorstore.markdown_path)}|{self.snapshot_id}"
+    
+    def retrieve(self, question: str):
+        """
+        Recupera los documentos de contexto para la pregunta.
+        
+        Si la pregunta contiene filtros reconocibles (estado, NIF, fechas) se aplican
+        como filtro `where` sobre los metadatos de las entradas. Si el filtro no deja
+        ningún candidato se repite la búsqueda sin filtro, para que el LLM pueda
+        responder igualmente con el contexto más parecido.
+        """
+        self._ensure_current_snapshot()
+        
+        filtros = extract_filters(question)
+        if filtros:
+            print(f"🔎 Filtros de metadatos: {filtros}")
+            docs = self.vectorstore.get_retriever(k=5, filter=filtros).invoke(question)
+            if docs:
+                return docs
+        
+        return self.retriever.invoke(question)
+    
+    def query(self, question: str, use_cache: bool = True):
+        """
+        Realiza una consulta al sistema RAG (con caché de respuestas por versión del historial).
+        
+        Con `use_cache=False` la respuesta ni se lee ni se guarda en la caché; lo usan
+        las búsquedas que deciden sobre qué presupuesto actuar.
+        """
         try:
-            if not self.qa_chain:
-                self.setup_qa_chain()
+            version = self._cache_version()
+            cached = self.answer_cache.get(question, version) if use_cache else None
+            if cached is not None:
+                print("⚡ Respuesta RAG servida desde caché")
+                return cached
             
-            result = self.qa_chain.invoke({"query": question})
+            docs = self.retrieve(question)
+            answer = self.qa_chain.combine_documents_chain.invoke(
+                {"input_documents": docs, "question": question}
+            )["output_text"]
             
-            return {
-                "answer": result["result"],
-                "source_documents": result["source_documents"]
+            response = {
+                "answer": answer,
+                "source_documents": docs
             }
+            if use_cache:
+                self.answer_cache.put(question, version, response)
+            return response
         except Exception as e:
             print(f"❌ Error en query RAG: {e}")
             return {
@@ -79,6 +156,38 @@ Respuesta:"""
                 "source_documents": []
             }
     
+    def query_stream(self, question: str):
+        """
+        Versión en streaming de `query`: genera la respuesta token a token.
+        
+        Las respuestas cacheadas se emiten de una vez. Al terminar, la respuesta
+        completa queda en la caché igual que con `query`.
+        """
+        try:
+            version = self._cache_version()
+            cached = self.answer_cache.get(question, version)
+            if cached is not None:
+                print("⚡ Respuesta RAG servida desde caché")
+                yield cached["answer"]
+                return
+            
+            docs = self.retrieve(question)
+            context = "\n\n".join(doc.page_content for doc in docs)
+            
+            partes = []
+            for chunk in self.llm.stream(self.prompt.format(context=context, question=question)):
+                if chunk.content:
+                    partes.append(chunk.content)
+                    yield chunk.content
+            
+            self.answer_cache.put(question, version, {
+                "answer": "".join(partes),
+                "source_documents": docs
+            })
+        except Exception as e:
+            print(f"❌ Error en query RAG: {e}")
+            yield f"Error al consultar el historial: {str(e)}"
+    
     def query_simple(self, question: str):
         """Consulta simplificada que solo retorna la respuesta"""
         result = self.query(question)
@@ -1,157 +1,398 @@
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import MarkdownTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
 import os
-import chromadb
-from chromadb.config import Settings
+import re
+import hashlib
+import threading
+import time
 import shutil
 
+from src.utils.text_helpers import normalize_text
+from src.rag.embeddings import get_cached_embeddings
+from src.rag.lexical_index import BM25Index, HybridRetriever
+from src.rag.query_filters import estado_pago_de
+from datetime import datetime
+
+
+# Versión del formato de los documentos del índice: cambiarla fuerza a re-sincronizar
+# todas las entradas (los vectores salen de la caché de embeddings si el texto no cambia)
+ENTRY_SCHEMA_VERSION = 3
+
+# Colección de Chroma del historial (los índices de versiones anteriores usaban
+# una por snapshot con este prefijo; se borran al cargar)
+COLLECTION_PREFIX = "customer_history"
+
+
+def _campo(texto: str, patron: str):
+    match = re.search(patron, texto, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def _numero(valor):
+    try:
+        return float(valor.replace("€", "").replace(",", ".").strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_history_entry(texto: str) -> dict:
+    """
+    Extrae los campos estructurados de una entrada del historial.
+    
+    Soporta el formato de `guardar_presupuesto_en_historial` y el del agente
+    autónomo ("- Tipo:" / "- Pintura:").
+    
+    Returns:
+        dict con nombre, nif, estado, total, area, tipo_trabajo, tipo_pintura y
+        fecha (ISO "AAAA-MM-DD HH:MM"); los campos que no aparecen valen None
+    """
+    cabecera = re.match(r"## (.*?) - (.*) \((\d{2})/(\d{2})/(\d{4})(?: (\d{2}:\d{2}))?\)", texto)
+    
+    nombre = _campo(texto, r"^\*\*Cliente:\*\*[ \t]*(.*?)[ \t]*$")
+    if nombre is None:
+        nombre = cabecera.group(2) if cabecera else texto.splitlines()[0][3:].strip()
+    
+    estado = _campo(texto, r"^\*\*Estado actual:\*\*[ \t]*(.*?)[ \t]*$")
+    if estado is None and cabecera:
+        estado = cabecera.group(1)
+    
+    fecha = None
+    if cabecera:
+        dia, mes, anio, hora = cabecera.group(3, 4, 5, 6)
+        fecha = f"{anio}-{mes}-{dia} {hora or '00:00'}"
+    
+    return {
+        "nombre": nombre,
+        "nif": _campo(texto, r"^\*\*NIF/CIF:\*\*[ \t]*(.*?)[ \t]*$") or "No especificado",
+        "estado": estado,
+        "total": _numero(_campo(texto, r"^\*\*Total con IVA:\*\*[ \t]*(.*?)[ \t]*$")),
+        "area": _numero(_campo(texto, r"^- Área:[ \t]*([\d.,]+)")),
+        "tipo_trabajo": _campo(texto, r"^- Tipo(?: de trabajo)?:[ \t]*(.*?)[ \t]*$"),
+        "tipo_pintura": _campo(texto, r"^- (?:Tipo de pintura|Pintura):[ \t]*(.*?)[ \t]*$"),
+        "fecha": fecha,
+    }
+
+
+def split_history_entries(contenido: str, cache: dict = None) -> list:
+    """
+    Divide el contenido del historial en entradas individuales (una por bloque "## ...").
+    
+    Args:
+        contenido: texto completo del historial
+        cache: dict opcional texto de la entrada -> campos parseados, de llamadas
+            anteriores; las entradas que no estén se parsean y se añaden
+    
+    Returns:
+        Lista de dicts con `entry_id` estable (NIF + nombre normalizado), el texto
+        de la entrada (sin el separador "---") y sus campos parseados
+        (ver `parse_history_entry`).
+    """
+    entradas = []
+    ids_vistos = {}
+    
+    for bloque in re.split(r"(?m)^(?=## )", contenido):
+        if not bloque.startswith("## "):
+            # Cabecera del documento ("# Historial de Clientes") u otro texto suelto
+            continue
+        
+        texto = re.sub(r"\n-{3,}\s*$", "", bloque.strip()).strip()
+        parseada = cache.get(texto) if cache is not None else None
+        if parseada is None:
+            campos = parse_history_entry(texto)
+            parseada = (campos, f"{campos['nif'].upper()}::{normalize_text(campos['nombre']).strip()}")
+            if cache is not None:
+                cache[texto] = parseada
+        campos, entry_id = parseada
+        
+        # Entradas duplicadas (mismo cliente escrito dos veces) reciben un sufijo estable
+        ids_vistos[entry_id] = ids_vistos.get(entry_id, 0) + 1
+        if ids_vistos[entry_id] > 1:
+            entry_id = f"{entry_id}#{ids_vistos[entry_id]}"
+        
+        entradas.append({
+            "entry_id": entry_id,
+            "texto": texto,
+            **campos,
+        })
+    
+    return entradas
+
+
 class CustomerHistoryVectorStore:
+    """
+    Vector store del historial de clientes sobre Chroma + BM25.
+    
+    Las actualizaciones escriben solo las entradas cambiadas en la colección de
+    Chroma, en sitio, y después publican el índice BM25, las entradas indexadas y
+    un snapshot id nuevos con una única asignación.
+    
+    Garantía para los lectores: el snapshot (BM25 + entradas) es inmutable, pero la
+    colección de Chroma es compartida y durante una sincronización puede tener ya
+    parte de los cambios. El retriever híbrido descarta los resultados densos que no
+    pertenecen a su snapshot, así que nunca mezcla dos versiones; lo único que puede
+    pasar es que una entrada que se está modificando o borrando falte del lado denso
+    hasta que se publique el snapshot nuevo.
+    """
+    
     def __init__(self, markdown_path="data/customer_history.md", persist_directory="./chroma_db"):
         self.markdown_path = markdown_path
         self.persist_directory = persist_directory
-        self.vectorstore = None
+        # (snapshot id, Chroma, BM25Index, entradas indexadas): se sustituye entero en
+        # cada swap. Las entradas son entry_id -> (hash, ids de sus chunks en Chroma)
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        # Entradas ya parseadas y sus documentos, para no rehacerlos en cada sync
+        self._campos_cache = {}
+        self._documentos_cache = {}
+    
+    @property
+    def vectorstore(self):
+        return self._snapshot[1] if self._snapshot else None
+    
+    @property
+    def lexical_index(self):
+        return self._snapshot[2] if self._snapshot else None
+    
+    @property
+    def snapshot_id(self):
+        """Identificador del snapshot activo: colección + versión (cambia con cada swap)"""
+        return self._snapshot[0] if self._snapshot else None
+    
+    def _publish_snapshot(self, collection_name, vectorstore, lexical_index, entradas):
+        """Publica un snapshot nuevo en un único paso atómico"""
+        self._snapshot = (f"{collection_name}@{time.time_ns()}", vectorstore, lexical_index, entradas)
+    
+    @staticmethod
+    def _entradas_indexadas(chunk_ids, metadatas) -> dict:
+        """entry_id -> (hash, ids de sus chunks) a partir de lo guardado en Chroma"""
+        entradas = {}
+        for chunk_id, metadata in zip(chunk_ids, metadatas):
+            metadata = metadata or {}
+            _, ids = entradas.setdefault(metadata.get("entry_id", chunk_id), (metadata.get("entry_hash"), []))
+            ids.append(chunk_id)
+        return entradas
+    
+    def adopt_snapshot(self, other):
+        """Pasa a usar el snapshot publicado por otra instancia (ver index_worker)"""
+        if other._snapshot is not None:
+            self._snapshot = other._snapshot
     
     def load_and_split_documents(self):
-        """Carga el documento markdown y lo divide en chunks"""
+        """Carga el documento markdown y lo divide en un documento por entrada del historial"""
+        documents, _ = self.load_entry_documents()
+        print(f"✅ Documento cargado: {len(documents)} entradas")
+        return documents
+    
+    def load_entry_documents(self):
+        """
+        Carga el historial y genera exactamente un documento por entrada, con ID estable.
+        
+        Returns:
+            Tupla (documents, ids). Cada documento lleva en sus metadatos el `entry_id`,
+            el hash de su contenido (para detectar cambios) y los campos de la entrada:
+            nombre, nif, estado, total, area, tipo_trabajo, tipo_pintura y fecha.
+        """
+        self._ensure_markdown_exists()
+        
+        with open(self.markdown_path, 'r', encoding='utf-8') as f:
+            contenido = f.read()
+        
+        # Solo se parsean y se construyen los documentos de las entradas nuevas o
+        # modificadas; el resto sale de las cachés de la llamada anterior
+        campos_cache = self._campos_cache
+        entradas = split_history_entries(contenido, campos_cache)
+        self._campos_cache = {entrada["texto"]: campos_cache[entrada["texto"]] for entrada in entradas}
+        
+        documents = []
+        ids = []
+        documentos_cache = {}
+        for entrada in entradas:
+            clave = (entrada["entry_id"], entrada["texto"])
+            doc = self._documentos_cache.get(clave)
+            if doc is not None:
+                documentos_cache[clave] = doc
+                documents.append(doc)
+                ids.append(entrada["entry_id"])
+                continue
+            
+            metadata = {
+                "source": self.markdown_path,
+                "entry_id": entrada["entry_id"],
+                "entry_hash": hashlib.sha1(
+                    f"{ENTRY_SCHEMA_VERSION}\n{entrada['texto']}".encode("utf-8")
+                ).hexdigest(),
+            }
+            for campo in ("nombre", "nif", "estado", "total", "area", "tipo_trabajo", "tipo_pintura", "fecha"):
+                # Chroma no admite None en los metadatos
+                if entrada[campo] is not None:
+                    metadata[campo] = entrada[campo]
+            
+            # Campos derivados para los filtros `where` (ver src/rag/query_filters.py)
+            metadata["nif"] = entrada["nif"].upper()
+            if entrada["estado"]:
+                metadata["estado_normalizado"] = normalize_text(entrada["estado"])
+            if estado_pago_de(entrada["estado"]):
+                metadata["estado_pago"] = estado_pago_de(entrada["estado"])
+            if entrada["fecha"]:
+                metadata["fecha_ts"] = int(datetime.strptime(entrada["fecha"], "%Y-%m-%d %H:%M").timestamp())
+            
+            doc = Document(page_content=entrada["texto"], metadata=metadata)
+            documentos_cache[clave] = doc
+            documents.append(doc)
+            ids.append(entrada["entry_id"])
+        
+        self._documentos_cache = documentos_cache
+        return documents, ids
+    
+    def _ensure_markdown_exists(self):
+        """Crea un historial vacío si el archivo no existe"""
         if not os.path.exists(self.markdown_path):
             print(f"⚠️ Archivo {self.markdown_path} no existe. Creando uno vacío...")
             os.makedirs(os.path.dirname(self.markdown_path) or ".", exist_ok=True)
             with open(self.markdown_path, 'w', encoding='utf-8') as f:
                 f.write("# Historial de Clientes\n\n(Sin registros aún)\n")
+    
+    def _get_client(self):
+        """Crea el cliente persistente de Chroma sin telemetría"""
+        # Import perezoso: chromadb solo se carga cuando se abre el índice
+        import chromadb
+        from chromadb.config import Settings
         
-        loader = TextLoader(self.markdown_path, encoding='utf-8')
-        documents = loader.load()
-        
-        markdown_splitter = MarkdownTextSplitter(
-            chunk_size=1000,  # Aumentado de 500 para más contexto
-            chunk_overlap=200  # Aumentado de 50 para mejor coherencia
+        chroma_settings = Settings(
+            anonymized_telemetry=False,
+            allow_reset=True,
+            is_persistent=True
         )
         
-        split_docs = markdown_splitter.split_documents(documents)
-        print(f"✅ Documento cargado: {len(split_docs)} chunks creados")
-        return split_docs
+        os.makedirs(self.persist_directory, exist_ok=True)
+        
+        return chromadb.PersistentClient(
+            path=self.persist_directory,
+            settings=chroma_settings
+        )
     
     def get_embeddings(self):
-        """Retorna embeddings locales gratuitos usando HuggingFace"""
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+        """
+        Retorna los embeddings locales (HuggingFace) compartidos por todo el proceso,
+        con la caché persistente delante para no re-codificar chunks ya vistos.
+        """
+        return get_cached_embeddings()
+    
+    def _open_collection(self, client, collection_name):
+        from langchain_community.vectorstores import Chroma
+        
+        return Chroma(
+            embedding_function=self.get_embeddings(),
+            persist_directory=self.persist_directory,
+            collection_name=collection_name,
+            client=client
         )
-        print("✅ Embeddings locales cargados (multilingüe)")
-        return embeddings
     
     def create_vectorstore(self):
-        """Crea el vector store con ChromaDB y embeddings locales"""
+        """
+        Reconstrucción COMPLETA del vector store con ChromaDB y embeddings locales.
+        
+        Borra el directorio persistente y re-embebe todo el historial. Es una operación
+        de mantenimiento; para el día a día usar `sync_vectorstore()`.
+        """
         try:
             # Limpiar el directorio si existe para evitar problemas de tenant
             if os.path.exists(self.persist_directory):
                 print(f"🧹 Limpiando vector store anterior en {self.persist_directory}...")
                 try:
                     shutil.rmtree(self.persist_directory)
+                    # Chroma cachea el cliente por ruta; sin esto el nuevo quedaría en solo lectura
+                    from chromadb.api.client import SharedSystemClient
+                    SharedSystemClient.clear_system_cache()
                 except OSError as e:
                     print(f"⚠️ No se pudo eliminar el directorio (posible bloqueo de Windows): {e}")
             
-            documents = self.load_and_split_documents()
+            documents, ids = self.load_entry_documents()
             embeddings = self.get_embeddings()
             
-            # Crear configuración de ChromaDB sin telemetría
-            chroma_settings = Settings(
-                anonymized_telemetry=False,
-                allow_reset=True,
-                is_persistent=True
-            )
-            
-            os.makedirs(self.persist_directory, exist_ok=True)
-            
             # Crear cliente de Chroma manualmente
-            client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=chroma_settings
-            )
+            client = self._get_client()
             
             # Eliminar colección si existe
             try:
-                client.delete_collection("customer_history")
+                client.delete_collection(COLLECTION_PREFIX)
                 print("🗑️ Colección anterior eliminada")
             except:
                 pass
             
-            self.vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=embeddings,
-                persist_directory=self.persist_directory,
-                collection_name="customer_history",
-                client=client
+            vectorstore = self._open_collection(client, COLLECTION_PREFIX)
+            self._add_documents(vectorstore, documents, ids)
+            
+            self._publish_snapshot(
+                COLLECTION_PREFIX, vectorstore, BM25Index(documents),
+                self._entradas_indexadas(ids, [doc.metadata for doc in documents]),
             )
             
-            print(f"✅ Vector store creado en {self.persist_directory}")
+            print(f"✅ Vector store creado en {self.persist_directory} ({len(documents)} entradas)")
+            print(f"📊 Caché de embeddings: {embeddings.cache.stats()}")
             return self.vectorstore
             
         except Exception as e:
             print(f"❌ Error creando vector store: {e}")
             raise
     
-    def load_vectorstore(self):
-        """Carga un vector store existente o lo reconstruye si el archivo fuente ha cambiado"""
+    def _get_index_worker(self):
+        # Import local: index_worker importa este módulo
+        from src.rag.index_worker import get_index_worker
+        return get_index_worker(self.markdown_path, self.persist_directory)
+    
+    def load_vectorstore(self, background=True):
+        """
+        Carga el snapshot activo del vector store y lo pone al día con el historial.
+        
+        Con `background=True` (por defecto) la puesta al día se encarga al worker de
+        mantenimiento del índice y los lectores usan mientras tanto el snapshot
+        existente; con `background=False` se sincroniza antes de volver.
+        
+        En segundo plano, la colección se lee de disco una sola vez por proceso: la
+        instancia que la carga se la pasa al worker y las siguientes adoptan el
+        snapshot del worker.
+        """
         try:
-            # Verificar si existe el archivo de historial
-            if not os.path.exists(self.markdown_path):
-                print(f"⚠️ Archivo {self.markdown_path} no existe. Creando uno vacío...")
-                os.makedirs(os.path.dirname(self.markdown_path) or ".", exist_ok=True)
-                with open(self.markdown_path, 'w', encoding='utf-8') as f:
-                    f.write("# Historial de Clientes\n\n(Sin registros aún)\n")
-            
-            # Obtener timestamp del archivo de historial
-            history_mtime = os.path.getmtime(self.markdown_path)
+            if background:
+                worker = self._get_index_worker()
+                if worker.store.vectorstore is not None:
+                    self.adopt_snapshot(worker.store)
+                    worker.subscribe(self)
+                    worker.schedule_reindex()
+                    return self.vectorstore
             
-            # Verificar si existe el vector store y si es más antiguo que el archivo de historial
-            should_rebuild = False
+            collection_name = COLLECTION_PREFIX
+            client = self._get_client()
             
-            if os.path.exists(self.persist_directory):
-                try:
-                    # Obtener timestamp del directorio del vector store
-                    vectorstore_mtime = os.path.getmtime(self.persist_directory)
-                    
-                    # Si el historial es más nuevo, necesitamos reconstruir
-                    if history_mtime > vectorstore_mtime:
-                        print(f"📝 Detectado cambio en {self.markdown_path}, reconstruyendo vector store...")
-                        should_rebuild = True
-                except:
-                    should_rebuild = True
-            else:
+            if collection_name not in [c.name for c in client.list_collections()]:
                 print("⚠️ No existe vector store, creando uno nuevo...")
-                should_rebuild = True
-            
-            # Si necesitamos reconstruir, hacerlo
-            if should_rebuild:
-                return self.create_vectorstore()
-            
-            # Si no, cargar el existente
-            embeddings = self.get_embeddings()
-            
-            chroma_settings = Settings(
-                anonymized_telemetry=False,
-                allow_reset=True,
-                is_persistent=True
-            )
-            
-            # Crear cliente de Chroma
-            client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=chroma_settings
-            )
+                self.create_vectorstore()
+                if background:
+                    worker.seed(self)
+                    worker.subscribe(self)
+                return self.vectorstore
             
-            self.vectorstore = Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=embeddings,
-                collection_name="customer_history",
-                client=client
+            vectorstore = self._open_collection(client, collection_name)
+            guardado = vectorstore.get(include=["documents", "metadatas"])
+            documents = [
+                Document(page_content=texto, metadata=metadata or {})
+                for texto, metadata in zip(guardado["documents"], guardado["metadatas"])
+            ]
+            self._publish_snapshot(
+                collection_name, vectorstore, BM25Index(documents),
+                self._entradas_indexadas(guardado["ids"], guardado["metadatas"]),
             )
+            self._drop_old_collections(client, conservar={collection_name})
             
             print("✅ Vector store cargado desde disco")
+            
+            # Aplicar solo los cambios del historial desde la última sincronización
+            if background:
+                worker.seed(self)
+                worker.subscribe(self)
+                worker.schedule_reindex()
+            else:
+                self.sync_vectorstore()
             return self.vectorstore
                 
         except Exception as e:
@@ -159,24 +400,162 @@ class CustomerHistoryVectorStore:
             print("🔄 Recreando vector store...")
             return self.create_vectorstore()
     
-    def get_retriever(self, k=8):  # Aumentado de 5 a 8
-        """Obtiene el retriever configurado"""
+    def sync_vectorstore(self):
+        """
+        Sincronización INCREMENTAL del vector store con el historial.
+        
+        Compara el hash de cada entrada del historial con el de la última
+        sincronización y actualiza en sitio, en la colección de Chroma, solo lo que ha
+        cambiado: re-embebe y hace upsert de las entradas nuevas o modificadas y borra
+        las que ya no existen. Después publica en un único paso el índice BM25 nuevo,
+        las entradas indexadas y un snapshot id nuevo, que es lo que hace que los
+        retrievers y la caché de respuestas se renueven. El coste de los embeddings y
+        de Chroma depende solo del número de entradas cambiadas.
+        
+        Mientras dura, Chroma puede tener ya parte de los cambios; los retrievers
+        híbridos del snapshot anterior descartan esos resultados densos (ver la
+        garantía en el docstring de la clase).
+        
+        Returns:
+            dict con el número de entradas añadidas/actualizadas y eliminadas
+        """
+        if not self.vectorstore:
+            # load_vectorstore() abre la colección y vuelve a llamar a este método
+            self.load_vectorstore(background=False)
+            return {"upserted": 0, "deleted": 0}
+        
+        with self._refresh_lock:
+            documents, ids = self.load_entry_documents()
+            _, actual, indice_lexico, existentes = self._snapshot
+            
+            docs_a_insertar = []
+            ids_a_insertar = []
+            entradas = {}
+            for doc, chunk_id in zip(documents, ids):
+                entry_id = doc.metadata["entry_id"]
+                entry_hash = doc.metadata["entry_hash"]
+                if entry_id in entradas:
+                    entradas[entry_id][1].append(chunk_id)
+                else:
+                    entradas[entry_id] = (entry_hash, [chunk_id])
+                if entry_id not in existentes or existentes[entry_id][0] != entry_hash:
+                    docs_a_insertar.append(doc)
+                    ids_a_insertar.append(chunk_id)
+            
+            # Chunks que ya no corresponden a ninguna entrada vigente (los de las
+            # entradas modificadas con el mismo ID se sobrescriben con el upsert)
+            entradas_borradas = [entry_id for entry_id in existentes if entry_id not in entradas]
+            ids_a_borrar = [
+                chunk_id
+                for entry_id, (_, chunk_ids) in existentes.items()
+                for chunk_id in chunk_ids
+                if entry_id not in entradas or chunk_id not in entradas[entry_id][1]
+            ]
+            
+            if not ids_a_borrar and not docs_a_insertar:
+                return {"upserted": 0, "deleted": 0}
+            
+            # Primero las altas y después las bajas: una consulta concurrente nunca se
+            # queda sin la entrada que se está actualizando
+            self._add_documents(actual, docs_a_insertar, ids_a_insertar)
+            for inicio in range(0, len(ids_a_borrar), 5000):
+                actual.delete(ids=ids_a_borrar[inicio:inicio + 5000])
+            
+            self._publish_snapshot(
+                COLLECTION_PREFIX,
+                actual,
+                indice_lexico.with_changes(docs_a_insertar, entradas_borradas),
+                entradas,
+            )
+            
+            entradas_cambiadas = len({d.metadata["entry_id"] for d in docs_a_insertar})
+            print(f"🔄 Vector store sincronizado: {entradas_cambiadas} entradas actualizadas, {len(entradas_borradas)} eliminadas")
+            
+            return {"upserted": entradas_cambiadas, "deleted": len(entradas_borradas)}
+    
+    @staticmethod
+    def _add_documents(vectorstore, documents, ids, lote=5000):
+        """Embebe e inserta por lotes: Chroma rechaza inserciones de más de ~40k elementos"""
+        for inicio in range(0, len(documents), lote):
+            vectorstore.add_documents(documents[inicio:inicio + lote], ids=ids[inicio:inicio + lote])
+    
+    @staticmethod
+    def _drop_old_collections(client, conservar):
+        """
+        Elimina las colecciones de snapshots antiguos (una por sincronización en
+        versiones anteriores del índice).
+        """
+        for coleccion in client.list_collections():
+            if coleccion.name.startswith(COLLECTION_PREFIX) and coleccion.name not in conservar:
+                try:
+                    client.delete_collection(coleccion.name)
+                except Exception as e:
+                    print(f"⚠️ No se pudo eliminar el snapshot {coleccion.name}: {e}")
+    
+    def get_retriever(self, k=5, hybrid=True, filter=None):
+        """
+        Obtiene el retriever configurado.
+        
+        Por defecto es híbrido: similitud vectorial + BM25 sobre el texto normalizado,
+        combinados con Reciprocal Rank Fusion. Con `hybrid=False` se usa solo Chroma.
+        `filter` es un filtro `where` de Chroma sobre los metadatos de las entradas
+        que se aplica antes de la búsqueda.
+        """
         if not self.vectorstore:
             self.load_vectorstore()
         
-        retriever = self.vectorstore.as_retriever(
+        # Lectura única del snapshot: Chroma, BM25 y entradas de la misma versión
+        _, vectorstore, lexical_index, entradas = self._snapshot
+        
+        if hybrid and lexical_index is not None:
+            return HybridRetriever(
+                vectorstore=vectorstore,
+                lexical_index=lexical_index,
+                entradas=entradas,
+                k=k,
+                filter=filter,
+            )
+        
+        search_kwargs = {"k": k}
+        if filter:
+            search_kwargs["filter"] = filter
+        
+        retriever = vectorstore.as_retriever(
             search_type="similarity",  # Cambiado de mmr a similarity para más relevancia
-            search_kwargs={"k": k}
+            search_kwargs=search_kwargs
         )
         
         return retriever
+
+
+def sync_customer_history_vectorstore(
+    markdown_path: str = "data/customer_history.md",
+    persist_directory: str = "./chroma_db",
+):
+    """
+    Helper para actualizar de forma incremental (y síncrona) el vector store de
+    historial de clientes: solo re-embebe las entradas que han cambiado. Desde la app
+    se usa `schedule_history_reindex()` para no bloquear al usuario.
+    """
+    try:
+        vs = CustomerHistoryVectorStore(
+            markdown_path=markdown_path,
+            persist_directory=persist_directory,
+        )
+        vs.load_vectorstore(background=False)
+        return True
+    except Exception as e:
+        print(f"❌ Error sincronizando vector store: {e}")
+        return False
+
+
 def rebuild_customer_history_vectorstore(
     markdown_path: str = "data/customer_history.md",
     persist_directory: str = "./chroma_db",
 ):
     """
-    Helper para reconstruir el vector store de historial de clientes.
-    Se puede llamar desde app.py cada vez que se guarde un nuevo presupuesto.
+    Helper de mantenimiento para reconstruir por completo el vector store de historial
+    de clientes (borra la colección y re-embebe todo). Ver `reset_vector_store.py --rebuild`.
     """
     try:
         vs = CustomerHistoryVectorStore(
@@ -1,16 +1,25 @@
-from src.utils.pdf_generator import create_presupuesto_pdf, PresupuestoPDFGenerator
+"""
+Utilidades del asistente.
 
-from src.utils.history_manager import guardar_presupuesto_en_historial
-from src.utils.invoice_generator import generate_invoice_from_budget
-from src.utils.invoice_pdf_generator import create_invoice_pdf, InvoicePDFGenerator
+Los nombres exportados se importan en su primer uso (PEP 562): importar un
+submódulo ligero como `src.utils.storage` no arrastra reportlab ni los
+generadores de PDF.
+"""
+from src.lazy_exports import lazy_exports
 
+_EXPORTS = {
+    'create_presupuesto_pdf': 'src.utils.pdf_generator',
+    'PresupuestoPDFGenerator': 'src.utils.pdf_generator',
 
-__all__ = [
-    'create_presupuesto_pdf',
-    'PresupuestoPDFGenerator',
+    'guardar_presupuesto_en_historial': 'src.utils.history_manager',
+    'BudgetIndex': 'src.utils.budget_index',
+    'get_budget_index': 'src.utils.budget_index',
+    'guardar_presupuesto_json': 'src.utils.budget_index',
+    'generate_invoice_from_budget': 'src.utils.invoice_generator',
+    'create_invoice_pdf': 'src.utils.invoice_pdf_generator',
+    'InvoicePDFGenerator': 'src.utils.invoice_pdf_generator',
+}
 
-    'guardar_presupuesto_en_historial',
-    'generate_invoice_from_budget', 
-    'create_invoice_pdf',
-    'InvoicePDFGenerator',
-]
+__all__ = list(_EXPORTS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
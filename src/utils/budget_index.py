@@ -0,0 +1,422 @@
+"""
+Índice estructurado (SQLite) de los presupuestos guardados en data/presupuestos.
+
+Sustituye los recorridos con glob + json.load de todos los presupuestos por
+consultas indexadas por número, NIF, nombre normalizado, estado y fechas.
+
+Los JSON escritos o borrados fuera de `save_budget` (ediciones a mano, copias de
+seguridad restauradas, herramientas antiguas) se recogen solos: cada consulta
+compara la fecha de modificación del directorio con la de la última
+sincronización y, si cambió, `reconcile()` vuelve a leer solo los archivos nuevos
+o modificados. Para reconstruirlo entero: `python -m src.utils.budget_index --rebuild`.
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from src.utils.text_helpers import normalize_text
+from src.utils.storage import file_lock, atomic_write_json
+
+PRESUPUESTOS_DIR = "data/presupuestos"
+BUDGET_INDEX_PATH = "data/cache/budget_index.sqlite3"
+
+
+def budget_json_path(presupuesto_numero: str, presupuestos_dir: str = PRESUPUESTOS_DIR) -> str:
+    """Ruta canónica del JSON de un presupuesto"""
+    return os.path.join(presupuestos_dir, f"presupuesto_{presupuesto_numero}.json")
+
+
+def name_tokens(texto: str, min_word_length: int = 1) -> List[str]:
+    return [t for t in re.findall(r"\w+", normalize_text(texto)) if len(t) >= min_word_length]
+
+
+class BudgetIndex:
+    """
+    Índice de presupuestos: número -> ruta del JSON y campos de búsqueda.
+    
+    Cada escritura de un presupuesto pasa por `save_budget()`, que escribe el JSON
+    y actualiza el índice en la misma transacción. Los cambios hechos en el
+    directorio por otras vías los aplica `reconcile()` antes de la siguiente consulta.
+    """
+    
+    def __init__(self, db_path: str = BUDGET_INDEX_PATH, presupuestos_dir: str = PRESUPUESTOS_DIR):
+        self.db_path = db_path
+        self.presupuestos_dir = presupuestos_dir
+        self._lock = threading.Lock()
+        # mtime del directorio en la última sincronización (None: aún no comprobado)
+        self._firma_dir = None
+        
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS budgets (
+                    numero TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    nif TEXT,
+                    nombre TEXT,
+                    nombre_normalizado TEXT,
+                    estado TEXT,
+                    estado_pago TEXT,
+                    fecha TEXT,
+                    fecha_facturacion TEXT,
+                    fecha_pago TEXT,
+                    file_mtime INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_budgets_nif ON budgets(nif);
+                CREATE INDEX IF NOT EXISTS idx_budgets_estado ON budgets(estado);
+                CREATE INDEX IF NOT EXISTS idx_budgets_estado_pago ON budgets(estado_pago);
+                CREATE INDEX IF NOT EXISTS idx_budgets_fecha ON budgets(fecha);
+                
+                CREATE TABLE IF NOT EXISTS budget_tokens (
+                    token TEXT NOT NULL,
+                    numero TEXT NOT NULL,
+                    PRIMARY KEY (token, numero)
+                );
+                
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(budgets)")}
+            if "file_mtime" not in columnas:
+                # Índices creados antes de la reconciliación: la primera la rellena
+                conn.execute("ALTER TABLE budgets ADD COLUMN file_mtime INTEGER")
+            construido = conn.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        
+        if not construido:
+            self.rebuild()
+    
+    @contextmanager
+    def _connect(self):
+        """Conexión en una transacción (commit al salir, rollback si hay excepción) que siempre se cierra"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _dir_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.presupuestos_dir).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _upsert(self, conn, data: dict, path: str, file_mtime: Optional[int] = None):
+        numero = data.get("presupuesto_numero")
+        if not numero:
+            return
+        
+        cliente = data.get("cliente", {})
+        nombre = cliente.get("nombre", "")
+        
+        conn.execute("""
+            INSERT OR REPLACE INTO budgets
+                (numero, path, nif, nombre, nombre_normalizado, estado, estado_pago, fecha, fecha_facturacion, fecha_pago, file_mtime)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            numero,
+            path,
+            (cliente.get("nif") or "").strip().upper(),
+            nombre,
+            normalize_text(nombre),
+            normalize_text(data.get("estado", "")),
+            normalize_text(data.get("estadoPago", "")),
+            data.get("timestamp"),
+            data.get("fechaFacturacion"),
+            data.get("fechaPago"),
+            file_mtime,
+        ))
+        conn.execute("DELETE FROM budget_tokens WHERE numero = ?", (numero,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO budget_tokens (token, numero) VALUES (?, ?)",
+            [(token, numero) for token in name_tokens(nombre)],
+        )
+    
+    def _archivos_en_disco(self) -> dict:
+        """Ruta -> mtime (ns) de cada presupuesto_*.json del directorio"""
+        archivos = {}
+        try:
+            with os.scandir(self.presupuestos_dir) as entradas:
+                for entrada in entradas:
+                    if entrada.name.startswith("presupuesto_") and entrada.name.endswith(".json"):
+                        archivos[entrada.path] = entrada.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return archivos
+    
+    def _sincronizar(self, conn, completo: bool = False) -> dict:
+        """
+        Lleva al índice los JSON nuevos o modificados y quita las filas cuyo JSON ya no existe.
+        
+        Con `completo` vacía antes el índice y vuelve a leer todos los archivos.
+        """
+        if completo:
+            conn.execute("DELETE FROM budgets")
+            conn.execute("DELETE FROM budget_tokens")
+        
+        en_disco = self._archivos_en_disco()
+        indexados = dict(conn.execute("SELECT path, file_mtime FROM budgets").fetchall())
+        
+        cambiados = [ruta for ruta, mtime in en_disco.items() if indexados.get(ruta) != mtime]
+        # Las filas con una ruta fuera del directorio solo se quitan si el archivo ya no está
+        borrados = [ruta for ruta in indexados if ruta not in en_disco and not os.path.exists(ruta)]
+        
+        actualizados = 0
+        for ruta in cambiados:
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"⚠️ No se pudo indexar {ruta}: {e}")
+                continue
+            # Si el número cambió en el archivo, la fila antigua de esa ruta sobra
+            anteriores = conn.execute(
+                "SELECT numero FROM budgets WHERE path = ? AND numero != ?",
+                (ruta, data.get("presupuesto_numero")),
+            ).fetchall()
+            borrados_ruta = [numero for (numero,) in anteriores]
+            conn.executemany("DELETE FROM budgets WHERE numero = ?", [(n,) for n in borrados_ruta])
+            conn.executemany("DELETE FROM budget_tokens WHERE numero = ?", [(n,) for n in borrados_ruta])
+            self._upsert(conn, data, ruta, en_disco[ruta])
+            actualizados += 1
+        
+        for ruta in borrados:
+            conn.execute("DELETE FROM budget_tokens WHERE numero IN (SELECT numero FROM budgets WHERE path = ?)", (ruta,))
+            conn.execute("DELETE FROM budgets WHERE path = ?", (ruta,))
+        
+        return {"actualizados": actualizados, "eliminados": len(borrados)}
+    
+    def rebuild(self) -> int:
+        """Reconstruye el índice leyendo todos los JSON del directorio (mantenimiento)"""
+        with self._lock:
+            firma = self._dir_mtime()
+            with self._connect() as conn:
+                indexados = self._sincronizar(conn, completo=True)["actualizados"]
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+            self._firma_dir = firma
+        
+        print(f"✅ Índice de presupuestos reconstruido: {indexados} documentos")
+        return indexados
+    
+    def reconcile(self) -> dict:
+        """
+        Aplica al índice los JSON escritos, modificados o borrados fuera de `save_budget`.
+        
+        Solo relee los archivos cuya fecha de modificación no coincide con la indexada.
+        
+        Returns:
+            {"actualizados": n, "eliminados": n}
+        """
+        with self._lock:
+            # La firma se toma antes de recorrer: un cambio durante el recorrido se verá en la próxima
+            firma = self._dir_mtime()
+            with self._connect() as conn:
+                cambios = self._sincronizar(conn)
+            self._firma_dir = firma
+        
+        if cambios["actualizados"] or cambios["eliminados"]:
+            print(f"🔄 Índice de presupuestos sincronizado con el disco: {cambios}")
+        return cambios
+    
+    def ensure_current(self):
+        """Reconciliación barata: un stat del directorio si nada cambió desde la última"""
+        if self._dir_mtime() != self._firma_dir:
+            self.reconcile()
+    
+    def _registrar_escritura(self, conn, rutas: List[str], firma_antes: Optional[int]):
+        """
+        Guarda el mtime de los JSON recién escritos y, si el directorio estaba
+        sincronizado antes de escribir, da por vista también su nueva fecha (los
+        cambios los hicimos nosotros; no hace falta reconciliar).
+        """
+        conn.executemany(
+            "UPDATE budgets SET file_mtime = ? WHERE path = ?",
+            [(os.stat(ruta).st_mtime_ns, ruta) for ruta in rutas],
+        )
+        if firma_antes is not None and firma_antes == self._firma_dir:
+            self._firma_dir = self._dir_mtime()
+    
+    def save_budget(self, data: dict, path: Optional[str] = None, expected_version: Optional[str] = None) -> str:
+        """
+        Escribe el JSON del presupuesto y actualiza el índice de forma transaccional.
+        
+        El JSON se escribe de forma atómica bajo el lock de ese archivo; si falla la
+        escritura (o `expected_version` no coincide con la versión en disco y se lanza
+        `VersionConflictError`), la transacción del índice se deshace.
+        
+        Returns:
+            Ruta del JSON escrito
+        """
+        path = path or budget_json_path(data["presupuesto_numero"], self.presupuestos_dir)
+        firma_antes = self._dir_mtime()
+        
+        with file_lock(path), self._connect() as conn:
+            self._upsert(conn, data, path)
+            atomic_write_json(path, data, expected_version)
+            self._registrar_escritura(conn, [path], firma_antes)
+        
+        return path
+    
+    def _reservar_numeros(self, conn, cantidad: int, ahora: Optional[datetime] = None) -> List[str]:
+        """
+        Reclama `cantidad` números PRES-AAAAMMDDHHMMSS libres dentro de la transacción `conn`.
+        
+        Los números del chat se toman del segundo actual, así que los del lote se
+        cuentan hacia atrás desde el segundo anterior: un número de lote ya no es la
+        fecha de creación del presupuesto (en un lote de 1.000 filas, el más antiguo
+        queda unos 17 minutos antes). Cada número se reclama con un INSERT en
+        `budgets`; si ya existe (fila o JSON) se prueba el segundo anterior.
+        """
+        momento = (ahora or datetime.now()).replace(microsecond=0)
+        numeros = []
+        while len(numeros) < cantidad:
+            momento -= timedelta(seconds=1)
+            numero = f"PRES-{momento.strftime('%Y%m%d%H%M%S')}"
+            path = budget_json_path(numero, self.presupuestos_dir)
+            if os.path.exists(path):
+                continue
+            try:
+                conn.execute("INSERT INTO budgets (numero, path) VALUES (?, ?)", (numero, path))
+            except sqlite3.IntegrityError:
+                continue
+            numeros.append(numero)
+        return sorted(numeros)
+    
+    def save_budgets(self, presupuestos: List[dict], ahora: Optional[datetime] = None) -> List[str]:
+        """
+        Versión por lotes de `save_budget`: escribe todos los JSON (de forma atómica)
+        y los registra en el índice en una única transacción.
+        
+        Los presupuestos con `presupuesto_numero` vacío reciben su número en esa
+        misma transacción (ver `_reservar_numeros`), abierta con BEGIN IMMEDIATE:
+        dos lotes simultáneos, aunque sean de procesos distintos, se ponen en cola
+        y no pueden reservar el mismo número.
+        
+        Returns:
+            Rutas de los JSON escritos, en el mismo orden
+        """
+        firma_antes = self._dir_mtime()
+        
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            sin_numero = [data for data in presupuestos if not data.get("presupuesto_numero")]
+            for data, numero in zip(sin_numero, self._reservar_numeros(conn, len(sin_numero), ahora)):
+                data["presupuesto_numero"] = numero
+            
+            rutas = [budget_json_path(data["presupuesto_numero"], self.presupuestos_dir) for data in presupuestos]
+            for data, path in zip(presupuestos, rutas):
+                with file_lock(path):
+                    self._upsert(conn, data, path)
+                    atomic_write_json(path, data)
+            self._registrar_escritura(conn, rutas, firma_antes)
+        
+        return rutas
+    
+    def find_by_numero(self, presupuesto_numero: str) -> Optional[dict]:
+        """Busca un presupuesto por su número exacto (PRES-XXXXXXXXXXXXXX)"""
+        resultados = self.find(numero=presupuesto_numero, limit=1)
+        return resultados[0] if resultados else None
+    
+    def find(
+        self,
+        numero: Optional[str] = None,
+        nif: Optional[str] = None,
+        estado: Optional[str] = None,
+        estado_pago: Optional[str] = None,
+        name_query: Optional[str] = None,
+        min_word_length: int = 4,
+        limit: int = 20,
+    ) -> List[dict]:
+        """
+        Consulta indexada de presupuestos. Todos los filtros son opcionales y se combinan.
+        
+        `name_query` se trocea en palabras normalizadas (sin tildes ni mayúsculas);
+        basta con que una palabra de al menos `min_word_length` letras sea el
+        comienzo de alguna palabra del nombre del cliente.
+        
+        Returns:
+            Lista de filas (dicts) ordenadas de la más reciente a la más antigua
+        """
+        self.ensure_current()
+        
+        condiciones = []
+        parametros = []
+        
+        if numero:
+            condiciones.append("numero = ?")
+            parametros.append(numero)
+        if nif:
+            condiciones.append("nif = ?")
+            parametros.append(nif.strip().upper())
+        if estado:
+            condiciones.append("estado = ?")
+            parametros.append(normalize_text(estado))
+        if estado_pago:
+            condiciones.append("estado_pago = ?")
+            parametros.append(normalize_text(estado_pago))
+        if name_query is not None:
+            palabras = name_tokens(name_query, min_word_length)
+            if not palabras:
+                return []
+            prefijos = " OR ".join("(token >= ? AND token < ?)" for _ in palabras)
+            condiciones.append(f"numero IN (SELECT numero FROM budget_tokens WHERE {prefijos})")
+            for palabra in palabras:
+                parametros.extend([palabra, palabra + "\uffff"])
+        
+        consulta = "SELECT * FROM budgets"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY fecha DESC LIMIT ?"
+        parametros.append(limit)
+        
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(fila) for fila in conn.execute(consulta, parametros)]
+    
+    @staticmethod
+    def load(fila: dict) -> dict:
+        """Carga el JSON completo de un presupuesto a partir de su fila del índice"""
+        with open(fila["path"], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+_budget_index = None
+_budget_index_lock = threading.Lock()
+
+
+def get_budget_index() -> BudgetIndex:
+    """Índice de presupuestos compartido por todo el proceso"""
+    global _budget_index
+    
+    if _budget_index is None:
+        with _budget_index_lock:
+            if _budget_index is None:
+                _budget_index = BudgetIndex()
+    
+    return _budget_index
+
+
+def guardar_presupuesto_json(presupuesto_dict: dict, path: Optional[str] = None, expected_version: Optional[str] = None) -> str:
+    """
+    Guarda el JSON de un presupuesto manteniendo actualizado el índice.
+    
+    Pasar `expected_version` (de `read_json`) en los read-modify-write para no
+    pisar cambios de otra sesión.
+    """
+    return get_budget_index().save_budget(presupuesto_dict, path, expected_version)
+
+
+if __name__ == "__main__":
+    # Uso: python -m src.utils.budget_index [--rebuild]
+    if "--rebuild" in sys.argv[1:]:
+        BudgetIndex().rebuild()
+    else:
+        print(BudgetIndex().reconcile())
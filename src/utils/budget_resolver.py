@@ -0,0 +1,113 @@
+"""
+Resolución determinista (sin LLM) del presupuesto al que se refiere el usuario.
+
+Se usa antes del RAG en las acciones de aceptar presupuesto y marcar factura como
+pagada: número PRES exacto, NIF o nombre del cliente (exacto o aproximado) contra
+el índice de presupuestos. Solo si la coincidencia es ambigua o no existe hay que
+recurrir al RAG + LLM.
+"""
+import difflib
+import re
+from typing import Optional
+
+from src.utils.budget_index import BudgetIndex, get_budget_index, name_tokens
+
+PATRON_PRESUPUESTO = re.compile(r"PRES-\d{14}")
+# DNI (8 dígitos + letra), NIE (X/Y/Z + 7 dígitos + letra) y CIF (letra + 7 dígitos + control)
+PATRON_NIF = re.compile(r"\b(\d{8}[A-Za-z]|[XYZxyz]\d{7}[A-Za-z]|[A-Za-z]\d{7}[A-Za-z0-9])\b")
+
+# Palabras frecuentes en estas peticiones que nunca forman parte del nombre del cliente
+_PALABRAS_IGNORADAS = {
+    "acepta", "acepto", "aceptar", "aceptado", "aceptamos", "presupuesto", "presupuestos",
+    "factura", "facturas", "facturar", "pagada", "pagado", "pagadas", "pagar", "pago",
+    "cliente", "cobrado", "cobrada", "marca", "marcar", "como", "para", "esta", "estan",
+    "quiero", "genera", "generar", "convierte", "convertir", "favor",
+}
+
+SIMILITUD_MINIMA = 0.8
+
+
+def _palabras_busqueda(prompt: str):
+    return [p for p in name_tokens(prompt, min_word_length=4) if p not in _PALABRAS_IGNORADAS]
+
+
+def _resultado(resultado: str, metodo: Optional[str], candidatos: list) -> dict:
+    return {
+        "resultado": resultado,
+        "metodo": metodo,
+        "fila": candidatos[0] if resultado == "unico" else None,
+        "candidatos": candidatos,
+    }
+
+
+def resolver_presupuesto(
+    prompt: str,
+    estado: Optional[str] = None,
+    estado_pago: Optional[str] = None,
+    index: Optional[BudgetIndex] = None,
+) -> dict:
+    """
+    Intenta identificar un único presupuesto a partir del texto del usuario.
+    
+    Args:
+        prompt: Mensaje del usuario
+        estado: Filtro de estado (ej. "Presupuestado")
+        estado_pago: Filtro de estado de pago (ej. "Pendiente")
+        index: Índice de presupuestos (por defecto el compartido del proceso)
+    
+    Returns:
+        dict con `resultado` ("unico", "ambiguo" o "sin_coincidencias"), el `metodo`
+        que decidió ("numero", "nif", "nombre", "nombre_aproximado"), la `fila`
+        del índice si es única y la lista de `candidatos`.
+    """
+    index = index or get_budget_index()
+    filtros = {"estado": estado, "estado_pago": estado_pago}
+    
+    # 1. Número de presupuesto exacto: si el usuario lo da, no se adivina por nombre
+    match_numero = PATRON_PRESUPUESTO.search(prompt)
+    if match_numero:
+        candidatos = index.find(numero=match_numero.group(0), **filtros)
+        return _resultado("unico" if candidatos else "sin_coincidencias", "numero", candidatos)
+    
+    # 2. NIF/CIF del cliente
+    match_nif = PATRON_NIF.search(prompt)
+    if match_nif:
+        candidatos = index.find(nif=match_nif.group(0), **filtros)
+        if candidatos:
+            return _resultado("unico" if len(candidatos) == 1 else "ambiguo", "nif", candidatos)
+    
+    palabras = _palabras_busqueda(prompt)
+    if not palabras:
+        return _resultado("sin_coincidencias", None, [])
+    
+    # 3. Nombre del cliente: gana el candidato con más palabras coincidentes
+    candidatos = index.find(name_query=" ".join(palabras), **filtros)
+    if candidatos:
+        def puntuacion(fila):
+            tokens = fila["nombre_normalizado"].split()
+            return sum(1 for p in palabras if any(t.startswith(p) for t in tokens))
+        
+        candidatos.sort(key=puntuacion, reverse=True)
+        if len(candidatos) == 1 or puntuacion(candidatos[0]) > puntuacion(candidatos[1]):
+            return _resultado("unico", "nombre", candidatos)
+        return _resultado("ambiguo", "nombre", candidatos)
+    
+    # 4. Nombre aproximado (erratas: "Baca" por "Bacca") entre los presupuestos del estado pedido
+    aproximados = []
+    for fila in index.find(limit=500, **filtros):
+        tokens = fila["nombre_normalizado"].split()
+        similitud = max(
+            (difflib.SequenceMatcher(None, p, t).ratio() for p in palabras for t in tokens),
+            default=0.0,
+        )
+        if similitud >= SIMILITUD_MINIMA:
+            aproximados.append((similitud, fila))
+    
+    aproximados.sort(key=lambda par: par[0], reverse=True)
+    candidatos = [fila for _, fila in aproximados]
+    if len(aproximados) == 1 or (aproximados and aproximados[0][0] > aproximados[1][0]):
+        return _resultado("unico", "nombre_aproximado", candidatos)
+    if aproximados:
+        return _resultado("ambiguo", "nombre_aproximado", candidatos)
+    
+    return _resultado("sin_coincidencias", None, [])
@@ -0,0 +1,236 @@
+"""
+Presupuestos por lotes sin conversación (CSV o JSONL).
+
+Pensado para presupuestar de una vez muchas unidades de un mismo edificio o
+comunidad: cada fila es un trabajo (cliente, NIF, área, tipo de pintura y tipo de
+trabajo). Los importes se calculan de una vez para todo el lote con
+`pricing.calcular_costes_lote` (mismos resultados que `calcular_presupuesto`). Los
+JSON y el índice de presupuestos se guardan en una sola transacción, los PDF se
+renderizan en paralelo en el pool de procesos, el historial se actualiza con un
+único lote de eventos y el índice del RAG (Chroma + BM25) se sincroniza una vez
+al final del lote.
+"""
+import csv
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from src.utils.budget_index import get_budget_index
+from src.utils.history_manager import guardar_presupuestos_en_historial
+from src.utils.pdf_service import get_pdf_service, PdfQueueFullError
+from src.utils.pricing import calcular_costes_lote, costes_de_fila
+from src.utils.storage import atomic_write_bytes
+
+# Nombre de columna aceptado -> parámetro de calcular_presupuesto
+COLUMNAS = {
+    "cliente": "cliente_nombre",
+    "cliente_nombre": "cliente_nombre",
+    "nombre": "cliente_nombre",
+    "nif": "cliente_nif",
+    "cliente_nif": "cliente_nif",
+    "email": "cliente_email",
+    "cliente_email": "cliente_email",
+    "direccion": "cliente_direccion",
+    "dirección": "cliente_direccion",
+    "cliente_direccion": "cliente_direccion",
+    "area": "area_m2",
+    "área": "area_m2",
+    "area_m2": "area_m2",
+    "tipo_pintura": "tipo_pintura",
+    "pintura": "tipo_pintura",
+    "tipo_trabajo": "tipo_trabajo",
+    "trabajo": "tipo_trabajo",
+    "zona": "zona_trabajo",
+    "zona_trabajo": "zona_trabajo",
+}
+
+CAMPOS_OBLIGATORIOS = ("cliente_nombre", "area_m2", "tipo_pintura", "tipo_trabajo")
+
+
+def leer_trabajos(path: str) -> list:
+    """Lee los trabajos de un CSV (separado por comas o punto y coma) o de un JSONL"""
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(linea) for linea in f if linea.strip()]
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        return list(csv.DictReader(f, dialect=dialecto))
+
+
+def normalizar_trabajo(fila: dict) -> dict:
+    """
+    Convierte una fila de entrada en los argumentos de `calcular_presupuesto`.
+
+    Raises:
+        ValueError si falta un campo obligatorio o el área no es un número positivo
+    """
+    trabajo = {}
+    for columna, valor in fila.items():
+        parametro = COLUMNAS.get(str(columna).strip().lower())
+        if parametro and valor not in (None, ""):
+            trabajo[parametro] = valor.strip() if isinstance(valor, str) else valor
+
+    faltan = [campo for campo in CAMPOS_OBLIGATORIOS if campo not in trabajo]
+    if faltan:
+        raise ValueError(f"Faltan campos obligatorios: {', '.join(faltan)}")
+
+    # Se aceptan áreas con coma decimal ("85,5")
+    area = float(str(trabajo["area_m2"]).replace(",", "."))
+    if area <= 0:
+        raise ValueError(f"Área no válida: {trabajo['area_m2']}")
+    trabajo["area_m2"] = area
+    return trabajo
+
+
+def construir_presupuesto(trabajo: dict, costes: dict) -> dict:
+    """Presupuesto con el mismo formato que el de `calcular_presupuesto`"""
+    return {
+        "presupuesto_numero": None,
+        "cliente": {
+            "nombre": trabajo["cliente_nombre"],
+            "nif": trabajo.get("cliente_nif", "No especificado"),
+            "email": trabajo.get("cliente_email", "No especificado"),
+            "direccion": trabajo.get("cliente_direccion", "No especificada"),
+        },
+        "detalles_trabajo": {
+            "area_m2": trabajo["area_m2"],
+            "tipo_pintura": trabajo["tipo_pintura"],
+            "tipo_trabajo": trabajo["tipo_trabajo"],
+            "zona": trabajo.get("zona_trabajo", "Interior"),
+        },
+        "presupuesto": costes,
+        "timestamp": datetime.now().isoformat(),
+        "estado": "Presupuestado",
+    }
+
+
+def _ruta_pdf(presupuesto: dict, presupuestos_dir: str) -> str:
+    nombre = presupuesto["cliente"]["nombre"].replace(" ", "_").lower()
+    return os.path.join(presupuestos_dir, f"presupuesto_{nombre}_{presupuesto['presupuesto_numero']}.pdf")
+
+
+def generar_lote(
+    trabajos: list,
+    generar_pdfs: bool = True,
+    historial_path: str = "data/customer_history.md",
+    actualizar_indice: bool = True,
+    persist_directory: str = "./chroma_db",
+) -> dict:
+    """
+    Calcula, guarda y documenta un lote de trabajos.
+
+    Args:
+        trabajos: filas leídas con `leer_trabajos` (dicts con las columnas de entrada)
+        generar_pdfs: si se renderizan los PDF de los presupuestos
+        historial_path: historial de clientes a actualizar
+        actualizar_indice: si se sincroniza el índice del RAG con el historial al final
+            (con False queda desfasado hasta el próximo arranque de la aplicación)
+        persist_directory: directorio de Chroma del índice
+
+    Returns:
+        dict con el resultado, los errores por fila y el informe de rendimiento
+    """
+    tiempos = {}
+    errores = []
+    inicio_total = time.perf_counter()
+
+    # 1. Calcular (vectorizado sobre todas las filas válidas)
+    inicio = time.perf_counter()
+    validos = []
+    for fila_num, fila in enumerate(trabajos, start=1):
+        try:
+            validos.append(normalizar_trabajo(fila))
+        except Exception as e:
+            errores.append({"fila": fila_num, "error": str(e)})
+
+    presupuestos = []
+    if validos:
+        costes = calcular_costes_lote(
+            [t["area_m2"] for t in validos],
+            [t["tipo_pintura"] for t in validos],
+            [t["tipo_trabajo"] for t in validos],
+        )
+        presupuestos = [construir_presupuesto(t, costes_de_fila(costes, i)) for i, t in enumerate(validos)]
+    tiempos["calculo"] = time.perf_counter() - inicio
+
+    # 2. Numerar y guardar JSON + índice en una sola transacción (los números PRES
+    #    del lote se cuentan hacia atrás y no indican cuándo se creó cada presupuesto)
+    index = get_budget_index()
+    inicio = time.perf_counter()
+    rutas_json = index.save_budgets(presupuestos) if presupuestos else []
+    tiempos["json_indice"] = time.perf_counter() - inicio
+
+    # 3. PDFs en paralelo (ventana deslizante según la cola del servicio)
+    inicio = time.perf_counter()
+    rutas_pdf = {}
+    if generar_pdfs and presupuestos:
+        servicio = get_pdf_service()
+        fecha = datetime.now().strftime("%d/%m/%Y")
+        pendientes = deque()
+
+        def recoger():
+            presupuesto, futuro = pendientes.popleft()
+            numero = presupuesto["presupuesto_numero"]
+            try:
+                ruta = _ruta_pdf(presupuesto, index.presupuestos_dir)
+                atomic_write_bytes(ruta, servicio.result(futuro))
+                rutas_pdf[numero] = ruta
+            except Exception as e:
+                errores.append({"presupuesto": numero, "error": f"PDF: {e}"})
+
+        for presupuesto in presupuestos:
+            while True:
+                try:
+                    futuro = servicio.submit("presupuesto", presupuesto, presupuesto["presupuesto_numero"], fecha)
+                    pendientes.append((presupuesto, futuro))
+                    break
+                except PdfQueueFullError:
+                    if not pendientes:
+                        raise
+                    recoger()
+        while pendientes:
+            recoger()
+    tiempos["pdfs"] = time.perf_counter() - inicio
+
+    # 4. Historial: un único lote de eventos
+    inicio = time.perf_counter()
+    resultado_historial = (
+        guardar_presupuestos_en_historial(presupuestos, historial_path)
+        if presupuestos else {"estado": "éxito"}
+    )
+    if resultado_historial["estado"] != "éxito":
+        errores.append({"historial": resultado_historial["error"]})
+    tiempos["historial"] = time.perf_counter() - inicio
+
+    # 5. Índice del RAG: una sola sincronización incremental para todo el lote
+    indice_actualizado = False
+    if actualizar_indice and presupuestos and resultado_historial["estado"] == "éxito":
+        from src.rag.vector_store import sync_customer_history_vectorstore
+
+        inicio = time.perf_counter()
+        indice_actualizado = sync_customer_history_vectorstore(historial_path, persist_directory)
+        if not indice_actualizado:
+            errores.append({"indice": "No se pudo sincronizar el índice vectorial"})
+        tiempos["indice"] = time.perf_counter() - inicio
+
+    total = time.perf_counter() - inicio_total
+    return {
+        "estado": "éxito" if not errores else "parcial",
+        "trabajos": len(trabajos),
+        "presupuestos": len(presupuestos),
+        "pdfs": len(rutas_pdf),
+        "indice_actualizado": indice_actualizado,
+        "errores": errores,
+        "numeros": [p["presupuesto_numero"] for p in presupuestos],
+        "rutas_json": rutas_json,
+        "informe": {
+            "tiempos_s": {etapa: round(t, 3) for etapa, t in tiempos.items()},
+            "total_s": round(total, 3),
+            "presupuestos_por_segundo": round(len(presupuestos) / total, 1) if total else None,
+        },
+    }
@@ -0,0 +1,93 @@
+"""
+Renderizador único de los PDF de presupuestos y facturas.
+
+Mantiene por proceso un único entorno de Jinja con las plantillas compiladas, de
+modo que cada documento no vuelve a leer ni compilar su plantilla. Jinja comprueba
+la fecha de modificación de la plantilla en cada uso y la recompila si ha cambiado.
+El PDF se genera con la API pública de xhtml2pdf, sin modificar su estado global.
+
+Las hojas de estilo no se cachean: `pisa.CreatePDF` no admite CSS ya parseado y
+el parseo es una parte pequeña del documento (unos 4 ms de ~110 ms, ver la columna
+"CSS" de `python -m benchmarks.pdf_render`), que no compensa depender de las
+clases internas de xhtml2pdf.
+"""
+import threading
+from io import BytesIO
+
+from jinja2 import Environment, FileSystemLoader
+from xhtml2pdf import pisa
+
+from src.utils.pdf_helpers import generate_pdf_items, template_version, PLANTILLAS, TEMPLATES_DIR
+
+
+class DocumentRenderer:
+    """Renderiza presupuestos y facturas (HTML con Jinja y PDF con xhtml2pdf)"""
+
+    def __init__(self, templates_dir: str = TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        # auto_reload: recompila la plantilla solo si cambia su fecha de modificación
+        self.env = Environment(loader=FileSystemLoader(templates_dir), auto_reload=True)
+
+    def template_version(self, tipo: str) -> str:
+        """Huella del contenido actual de la plantilla de un tipo de documento"""
+        return template_version(tipo, self.templates_dir)
+
+    def build_context(self, tipo: str, presupuesto_dict: dict, numero: str, fecha: str) -> dict:
+        """Variables de la plantilla para un presupuesto o una factura"""
+        cliente = presupuesto_dict["cliente"]
+        presupuesto = presupuesto_dict["presupuesto"]
+
+        contexto = {
+            "fecha": fecha,
+            "cliente_nombre": cliente['nombre'],
+            "cliente_nif": cliente['nif'],
+            "cliente_direccion": cliente['direccion'],
+            "cliente_email": cliente['email'],
+            # Generar items usando la función helper
+            "items": generate_pdf_items(presupuesto_dict),
+            "iva": f"{presupuesto['iva_21']:.2f}",
+            "total": f"{presupuesto['total_con_iva']:.2f}",
+        }
+        if tipo == "presupuesto":
+            contexto.update(
+                presupuesto_numero=numero,
+                subtotal=f"{presupuesto['subtotal_sin_ganancia']:.2f}",
+                base_imponible=f"{presupuesto['total_sin_iva']:.2f}",
+            )
+        else:
+            contexto.update(
+                factura_numero=numero,
+                subtotal=f"{presupuesto['total_sin_iva']:.2f}",
+            )
+        return contexto
+
+    def render_html(self, tipo: str, **contexto) -> str:
+        return self.env.get_template(PLANTILLAS[tipo]).render(**contexto)
+
+    def render_pdf(self, html: str) -> bytes:
+        buffer = BytesIO()
+        pisa_status = pisa.CreatePDF(html, dest=buffer)
+        if pisa_status.err:
+            raise Exception(f"Error generando PDF: {pisa_status.err}")
+        return buffer.getvalue()
+
+    def render_document(self, tipo: str, presupuesto_dict: dict, numero: str, fecha: str) -> bytes:
+        """Renderiza el PDF completo de un presupuesto o una factura"""
+        contexto = self.build_context(tipo, presupuesto_dict, numero, fecha)
+        return self.render_pdf(self.render_html(tipo, **contexto))
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_document_renderer() -> DocumentRenderer:
+    """Retorna el renderizador del proceso (plantillas compiladas una vez)"""
+    global _renderer
+
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = DocumentRenderer()
+
+    return _renderer
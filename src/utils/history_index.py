@@ -0,0 +1,183 @@
+"""
+Índice de posiciones de las entradas de `customer_history.md`.
+
+Mapea cada entrada (clave NIF + nombre), cada NIF y cada número de presupuesto al
+rango de bytes que ocupa su entrada en el archivo, para localizarla y sustituirla
+sin recorrer el historial con expresiones regulares. El índice se construye una
+vez por proceso con una pasada lineal y se mantiene al día con cada escritura; si
+el archivo cambia por fuera (tamaño o fecha de modificación) se reconstruye.
+"""
+import os
+import threading
+
+from src.utils.history_log import history_entry_key, history_log_path, read_events
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def _valor_campo(linea: str, etiqueta: str):
+    prefijo = f"**{etiqueta}:**"
+    if linea.startswith(prefijo):
+        return linea[len(prefijo):].strip()
+    return None
+
+
+class HistoryEntryIndex:
+    """Rangos de bytes [inicio, fin) de cada entrada del historial Markdown"""
+
+    def __init__(self, markdown_path: str):
+        self.markdown_path = markdown_path
+        self.claves = []          # claves en el orden del archivo
+        self.posicion = {}        # clave -> índice en self.claves
+        self.rangos = {}          # clave -> [inicio, fin]
+        self.por_nif = {}         # NIF -> [claves]
+        self.por_presupuesto = {} # número de presupuesto -> clave
+        self._firma = None
+
+    # --- Construcción ---
+
+    def _firma_actual(self):
+        try:
+            stat = os.stat(self.markdown_path)
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def scan(self):
+        """
+        Recorre el archivo una vez y genera (clave, inicio, fin, nombre, nif) por
+        entrada. Una entrada va desde su línea `## ` hasta el final de su línea `---`.
+        """
+        if not os.path.exists(self.markdown_path):
+            return
+
+        with open(self.markdown_path, "rb") as f:
+            offset = 0
+            inicio = nombre = nif = None
+            for linea in f:
+                texto = linea.decode("utf-8").rstrip()
+                if texto.startswith("## "):
+                    inicio, nombre, nif = offset, None, None
+                elif inicio is not None:
+                    if nombre is None:
+                        nombre = _valor_campo(texto, "Cliente")
+                    if nif is None:
+                        nif = _valor_campo(texto, "NIF/CIF")
+                    if texto == "---":
+                        fin = offset + len(linea.rstrip(b"\r\n"))
+                        nombre = nombre or "No especificado"
+                        nif = nif or "No especificado"
+                        yield history_entry_key(nombre, nif), inicio, fin, nombre, nif
+                        inicio = None
+                offset += len(linea)
+
+    def build(self):
+        """Reconstruye el índice leyendo el archivo completo"""
+        self.claves, self.posicion, self.rangos, self.por_nif = [], {}, {}, {}
+        for clave, inicio, fin, nombre, nif in self.scan():
+            # Con entradas duplicadas se actualiza la primera, como antes
+            if clave in self.rangos:
+                continue
+            self._registrar(clave, inicio, fin, nif)
+        
+        # Los números de presupuesto no están en el Markdown: salen del log de eventos
+        self.por_presupuesto = {}
+        for evento, _ in read_events(history_log_path(self.markdown_path)):
+            if evento.get("presupuesto_numero") and evento.get("clave") in self.rangos:
+                self.por_presupuesto[evento["presupuesto_numero"]] = evento["clave"]
+        
+        self._firma = self._firma_actual()
+        return self
+
+    def ensure_current(self):
+        """Reconstruye el índice si el archivo cambió fuera de este índice"""
+        if self._firma is None or self._firma != self._firma_actual():
+            self.build()
+        return self
+
+    def _registrar(self, clave, inicio, fin, nif):
+        self.posicion[clave] = len(self.claves)
+        self.claves.append(clave)
+        self.rangos[clave] = [inicio, fin]
+        self.por_nif.setdefault(str(nif).strip().upper(), []).append(clave)
+
+    # --- Consultas ---
+
+    def rango(self, clave):
+        return self.rangos.get(clave)
+
+    def rangos_por_nif(self, nif):
+        return [self.rangos[c] for c in self.por_nif.get(str(nif).strip().upper(), [])]
+
+    def rango_por_presupuesto(self, numero):
+        clave = self.por_presupuesto.get(numero)
+        return self.rangos.get(clave) if clave else None
+
+    def read_entry(self, clave):
+        """Lee el texto de una entrada directamente de su rango de bytes"""
+        rango = self.rangos.get(clave)
+        if not rango:
+            return None
+        with open(self.markdown_path, "rb") as f:
+            f.seek(rango[0])
+            return f.read(rango[1] - rango[0]).decode("utf-8")
+
+    # --- Escrituras (el llamador serializa con el lock del archivo y hace fsync
+    # antes de dar los eventos por aplicados, ver actualizar_vista_historial) ---
+
+    def append_entry(self, clave, nombre, nif, texto, presupuesto_numero=None):
+        """Añade una entrada al final del archivo"""
+        datos = f"\n{texto}\n".encode("utf-8")
+        with open(self.markdown_path, "ab") as f:
+            fin_actual = f.tell()
+            f.write(datos)
+        inicio = fin_actual + 1
+        fin = fin_actual + len(datos) - 1
+        if clave not in self.rangos:
+            self._registrar(clave, inicio, fin, nif)
+        if presupuesto_numero:
+            self.por_presupuesto[presupuesto_numero] = clave
+        self._firma = self._firma_actual()
+
+    def replace_entry(self, clave, texto, presupuesto_numero=None):
+        """
+        Sustituye una entrada en su rango de bytes.
+
+        Si cambia de tamaño solo se reescribe lo que hay detrás de ella (lo normal es
+        actualizar entradas recientes, cerca del final del archivo).
+        """
+        inicio, fin = self.rangos[clave]
+        nuevo = texto.encode("utf-8")
+        delta = len(nuevo) - (fin - inicio)
+
+        with open(self.markdown_path, "r+b") as f:
+            if delta == 0:
+                f.seek(inicio)
+                f.write(nuevo)
+            else:
+                f.seek(fin)
+                cola = f.read()
+                f.seek(inicio)
+                f.write(nuevo)
+                f.write(cola)
+                f.truncate()
+
+        self.rangos[clave][1] = fin + delta
+        if delta:
+            for siguiente in self.claves[self.posicion[clave] + 1:]:
+                self.rangos[siguiente][0] += delta
+                self.rangos[siguiente][1] += delta
+        if presupuesto_numero:
+            self.por_presupuesto[presupuesto_numero] = clave
+        self._firma = self._firma_actual()
+
+
+def get_history_index(markdown_path: str = "data/customer_history.md") -> HistoryEntryIndex:
+    """Retorna el índice de posiciones del proceso para ese historial (al día con el archivo)"""
+    clave = os.path.abspath(markdown_path)
+    with _indices_lock:
+        if clave not in _indices:
+            _indices[clave] = HistoryEntryIndex(markdown_path)
+        indice = _indices[clave]
+    return indice.ensure_current()
@@ -0,0 +1,121 @@
+"""
+Registro de eventos del historial de clientes (JSONL, solo anexar).
+
+Es la fuente de verdad del historial: cada cambio de estado de un presupuesto
+(creado, facturado, pagado) se añade como una línea al final del log, con coste
+O(1) e independiente del tamaño del historial. `customer_history.md` es una vista
+derivada del log (ver `history_manager.actualizar_vista_historial`).
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+
+from src.utils.text_helpers import normalize_text
+from src.utils.storage import file_lock, atomic_write_bytes
+
+# Estado normalizado -> tipo de evento del ciclo de vida del presupuesto
+TIPOS_EVENTO = {
+    "presupuestado": "presupuesto_creado",
+    "facturado y pendiente de pago": "facturado",
+    "factura pagada": "pagado",
+}
+
+
+def history_log_path(markdown_path: str) -> str:
+    """Ruta del log de eventos asociado a un historial Markdown"""
+    base, _ = os.path.splitext(markdown_path)
+    return f"{base}.events.jsonl"
+
+
+def history_entry_key(nombre, nif) -> str:
+    """Clave de una entrada del historial: NIF + nombre normalizado (como el entry_id del índice)"""
+    return f"{str(nif).strip().upper()}::{normalize_text(str(nombre))}"
+
+
+def event_type_for(estado) -> str:
+    return TIPOS_EVENTO.get(normalize_text(str(estado or "")), "estado_actualizado")
+
+
+def new_event(tipo: str, clave: str, **datos) -> dict:
+    """Crea un evento con id y marca de tiempo"""
+    return {
+        "id": uuid.uuid4().hex,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "tipo": tipo,
+        "clave": clave,
+        **datos,
+    }
+
+
+def append_event(log_path: str, evento: dict) -> dict:
+    """Añade un evento al final del log (una línea JSON por evento)"""
+    append_events(log_path, [evento])
+    return evento
+
+
+def append_events(log_path: str, eventos) -> int:
+    """Añade varios eventos con una sola escritura y un solo fsync (cargas por lotes)"""
+    datos = b"".join(
+        (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+        for evento in eventos
+    )
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with file_lock(log_path):
+        with open(log_path, "ab") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+    return len(datos)
+
+
+def write_events(log_path: str, eventos) -> int:
+    """
+    Reescribe el log completo con los eventos dados (escritura atómica).
+
+    Returns:
+        Tamaño en bytes del log resultante
+    """
+    datos = b"".join(
+        (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+        for evento in eventos
+    )
+    atomic_write_bytes(log_path, datos)
+    return len(datos)
+
+
+def read_events(log_path: str, offset: int = 0):
+    """
+    Lee los eventos del log a partir de un offset en bytes.
+
+    Genera tuplas (evento, offset_siguiente). Una última línea sin salto de línea
+    (escritura a medias) se ignora hasta que se complete.
+    """
+    if not os.path.exists(log_path):
+        return
+
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        for linea in f:
+            if not linea.endswith(b"\n"):
+                break
+            offset += len(linea)
+            if not linea.strip():
+                continue
+            try:
+                evento = json.loads(linea)
+            except json.JSONDecodeError:
+                print(f"⚠️ Evento inválido en {log_path} (offset {offset - len(linea)}), se ignora")
+                continue
+            yield evento, offset
+
+
+def fold_events(eventos) -> dict:
+    """
+    Pliega los eventos: queda el último de cada clave, en el orden en que apareció
+    la clave por primera vez (el orden de las entradas en el Markdown).
+    """
+    estado = {}
+    for evento in eventos:
+        estado[evento["clave"]] = evento
+    return estado
@@ -1,64 +1,71 @@
 from datetime import datetime
+import json
 import os
-import re
+import threading
 
-def guardar_presupuesto_en_historial(presupuesto_dict: dict, archivo_path: str = "data/customer_history.md") -> dict:
+from src.utils.history_log import (
+    history_log_path,
+    history_entry_key,
+    event_type_for,
+    new_event,
+    append_event,
+    append_events,
+    write_events,
+    read_events,
+    fold_events,
+)
+from src.utils.history_index import HistoryEntryIndex, get_history_index
+from src.utils.storage import file_lock, file_version, fsync_file, atomic_write_text
+
+ENCABEZADO_HISTORIAL = "# Historial de Clientes\n\n---\n"
+
+# Contador de escrituras del historial en este proceso (ver get_history_version)
+_history_writes = 0
+_history_writes_lock = threading.Lock()
+
+
+def _registrar_escritura_historial():
+    global _history_writes
+    with _history_writes_lock:
+        _history_writes += 1
+
+
+def get_history_version(archivo_path: str = "data/customer_history.md") -> str:
     """
-    Guarda o actualiza un presupuesto en el historial de clientes.
-    Si ya existe una entrada para el mismo cliente y trabajo, la actualiza.
-    Si no existe, crea una nueva entrada.
+    Retorna un identificador de la versión actual del historial.
+    
+    Cambia con cada escritura de `guardar_presupuesto_en_historial` (y con cualquier
+    modificación externa del archivo, por tamaño y fecha de modificación).
     """
     try:
-        # Extraer datos del diccionario
-        cliente = presupuesto_dict.get("cliente", {})
-        nombre = cliente.get("nombre", "No especificado")
-        nif = cliente.get("nif", "No especificado")
-        direccion = cliente.get("direccion", "No especificada")
-        email = cliente.get("email", "No especificado")
-
-        detalles = presupuesto_dict.get("detalles_trabajo", {})
-        superficie = detalles.get("area_m2", "No especificado")
-        tipo_pintura = detalles.get("tipo_pintura", "No especificado")
-        tipo_trabajo = detalles.get("tipo_trabajo", "No especificado")
-        zona = detalles.get("zona", "No especificado")
-
-        presupuesto = presupuesto_dict.get("presupuesto", {})
-        coste_total = presupuesto.get("total_con_iva", "No especificado")
-
-        # El estado se añade dinámicamente en app.py antes de llamar a esta función
-        estado = presupuesto_dict.get("estado", "Presupuestado") 
-        
-        fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M")
+        stat = os.stat(archivo_path)
+        return f"{_history_writes}-{stat.st_mtime_ns}-{stat.st_size}"
+    except OSError:
+        return f"{_history_writes}-0-0"
+
+
+def _formatear_entrada(presupuesto_dict: dict, fecha: str) -> tuple:
+    """Retorna (nombre, nif, estado, texto Markdown de la entrada) para un presupuesto"""
+    # Extraer datos del diccionario
+    cliente = presupuesto_dict.get("cliente", {})
+    nombre = cliente.get("nombre", "No especificado")
+    nif = cliente.get("nif", "No especificado")
+    direccion = cliente.get("direccion", "No especificada")
+    email = cliente.get("email", "No especificado")
+
+    detalles = presupuesto_dict.get("detalles_trabajo", {})
+    superficie = detalles.get("area_m2", "No especificado")
+    tipo_pintura = detalles.get("tipo_pintura", "No especificado")
+    tipo_trabajo = detalles.get("tipo_trabajo", "No especificado")
+    zona = detalles.get("zona", "No especificado")
+
+    presupuesto = presupuesto_dict.get("presupuesto", {})
+    coste_total = presupuesto.get("total_con_iva", "No especificado")
 
-        # Asegurar que el directorio data/ existe
-        os.makedirs(os.path.dirname(archivo_path), exist_ok=True)
-
-        # Leer el archivo existente si existe
-        contenido_existente = ""
-        if os.path.exists(archivo_path):
-            with open(archivo_path, "r", encoding="utf-8") as f:
-                contenido_existente = f.read()
-            print(f"📄 Archivo existente leído: {len(contenido_existente)} caracteres")
-        else:
-            print(f"📄 Archivo no existe, se creará uno nuevo")
-        
-        # Buscar entrada existente por NIF
-        # Patrón muy específico: captura desde ## hasta el siguiente --- sin capturar más entradas
-        # [^#] asegura que no capture otra entrada que empiece con ##
-        patron_entrada = rf"## [^\n]*{re.escape(nombre)}[^\n]*\n\n\*\*Cliente:\*\*[^\n]*\n\*\*NIF/CIF:\*\* {re.escape(nif)}\n(?:.*?\n)*?\n---"
-        
-        # Buscar coincidencia
-        coincidencia = re.search(patron_entrada, contenido_existente, re.DOTALL)
-
-        if coincidencia:
-            # Ya existe una entrada para este cliente -> ACTUALIZAR
-            entrada_vieja = coincidencia.group(0)
-            print(f"🔄 Actualizando entrada existente para {nombre} (NIF: {nif})")
-            print(f"   Entrada vieja: {len(entrada_vieja)} caracteres")
-            print(f"   Primeros 100 caracteres: {entrada_vieja[:100]}")
-            
-            # Formatear la entrada actualizada
-            entrada_nueva = f"""## {estado} - {nombre} ({fecha_actual})
+    # El estado se añade dinámicamente en app.py antes de llamar a esta función
+    estado = presupuesto_dict.get("estado", "Presupuestado")
+
+    texto = f"""## {estado} - {nombre} ({fecha})
 
 **Cliente:** {nombre}
 **NIF/CIF:** {nif}
@@ -75,86 +82,260 @@ def guardar_presupuesto_en_historial(presupuesto_dict: dict, archivo_path: str =
 **Estado actual:** {estado}
 
 ---"""
+    return nombre, nif, estado, texto
 
-            # Reemplazar la entrada vieja con la nueva
-            contenido_actualizado = contenido_existente.replace(entrada_vieja, entrada_nueva)
-            
-            # Validación: asegurar que el contenido actualizado no esté vacío
-            if len(contenido_actualizado) < len(entrada_nueva):
-                print(f"⚠️ ERROR: El contenido actualizado es más pequeño que la entrada nueva!")
-                print(f"   Contenido original: {len(contenido_existente)} caracteres")
-                print(f"   Contenido actualizado: {len(contenido_actualizado)} caracteres")
-                print(f"   Entrada nueva: {len(entrada_nueva)} caracteres")
-                return {
-                    "estado": "error",
-                    "error": "Error interno: contenido actualizado inválido"
-                }
-            
-            print(f"   Contenido actualizado: {len(contenido_actualizado)} caracteres")
-            print(f"   Diferencia: {len(contenido_actualizado) - len(contenido_existente)} caracteres")
-            
-            # Sobrescribir el archivo con el contenido actualizado
-            with open(archivo_path, "w", encoding="utf-8") as f:
-                f.write(contenido_actualizado)
-
-            print(f"✅ Historial actualizado para el cliente: {nombre} (Estado: {estado})")
-            
-            return {
-                "estado": "éxito",
-                "mensaje": f"Historial actualizado correctamente para {nombre} - {estado}"
-            }
-        else:
-            # No existe -> CREAR NUEVA ENTRADA
-            print(f"➕ Creando nueva entrada para {nombre} (NIF: {nif})")
-            entrada = f"""
-## {estado} - {nombre} ({fecha_actual})
 
-**Cliente:** {nombre}
-**NIF/CIF:** {nif}
-**Email:** {email}
-**Dirección:** {direccion}
+def _offset_path(archivo_path: str) -> str:
+    """Archivo con el offset del log hasta el que está aplicado el Markdown"""
+    return f"{archivo_path}.offset"
 
-**Detalles del trabajo:**
-- Área: {superficie} m²
-- Tipo de trabajo: {tipo_trabajo}
-- Tipo de pintura: {tipo_pintura}
-- Zona: {zona}
 
-**Total con IVA:** €{coste_total}
-**Estado actual:** {estado}
+def _leer_offset(archivo_path: str) -> tuple:
+    """
+    Retorna (offset, versión del Markdown al guardarlo). Un archivo de offset antiguo,
+    sin versión, se lee con versión "" para que no coincida y se regenere la vista.
+    """
+    try:
+        with open(_offset_path(archivo_path), "r", encoding="utf-8") as f:
+            contenido = f.read().strip()
+    except OSError:
+        return 0, ""
+    try:
+        datos = json.loads(contenido or "0")
+        if isinstance(datos, int):
+            return datos, ""
+        return int(datos["offset"]), datos.get("vista")
+    except (ValueError, KeyError, TypeError):
+        return 0, ""
+
+
+def _guardar_offset(archivo_path: str, offset: int):
+    """
+    Guarda el offset aplicado junto con la versión (inode, fecha y tamaño) del
+    Markdown. El llamador ya ha hecho fsync del Markdown, así que el offset nunca
+    apunta por delante de lo que hay en disco.
+    """
+    atomic_write_text(_offset_path(archivo_path), json.dumps({
+        "offset": offset,
+        "vista": file_version(archivo_path),
+    }))
+
+
+def _regenerar_vista(archivo_path: str, log_path: str) -> int:
+    """
+    Reescribe el Markdown completo (de forma atómica) a partir del log de eventos.
+    
+    Returns:
+        Offset del final del log aplicado
+    """
+    eventos, tamano = [], 0
+    for evento, tamano in read_events(log_path):
+        eventos.append(evento)
+
+    plegados = fold_events(eventos).values()
+    contenido = ENCABEZADO_HISTORIAL + "".join(f"\n{e['texto']}\n" for e in plegados)
+    atomic_write_text(archivo_path, contenido)
+    get_history_index(archivo_path).build()
+
+    _guardar_offset(archivo_path, tamano)
+    _registrar_escritura_historial()
+    return tamano
+
+
+def _importar_historial_markdown(archivo_path: str, log_path: str):
+    """
+    Crea el log de eventos a partir de un historial Markdown anterior al log:
+    cada entrada existente pasa a ser un evento `importado` con su texto tal cual.
+    """
+    eventos = []
+    if os.path.exists(archivo_path):
+        with open(archivo_path, "rb") as f:
+            contenido = f.read()
+        for clave, inicio, fin, nombre, nif in HistoryEntryIndex(archivo_path).scan():
+            texto = contenido[inicio:fin].decode("utf-8")
+            eventos.append(new_event("importado", clave, nombre=nombre, nif=nif, texto=texto))
+
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    tamano = write_events(log_path, eventos)
+    # El Markdown ya refleja estas entradas
+    _guardar_offset(archivo_path, tamano)
+    if eventos:
+        print(f"📥 Historial importado al log de eventos: {len(eventos)} entradas")
+
+
+def actualizar_vista_historial(archivo_path: str = "data/customer_history.md") -> int:
+    """
+    Aplica al Markdown los eventos del log que aún no refleja.
+    
+    Las entradas nuevas se añaden al final del archivo; las existentes (mismo
+    cliente y NIF) se localizan con el índice de posiciones y se sustituyen en su
+    rango de bytes por el texto del último evento.
+    
+    Si el Markdown no está en la versión registrada junto al offset (una escritura
+    interrumpida o una edición externa), se regenera entero desde el log.
+    
+    Returns:
+        Número de eventos aplicados
+    """
+    log_path = history_log_path(archivo_path)
+
+    with file_lock(archivo_path):
+        if not os.path.exists(log_path):
+            _importar_historial_markdown(archivo_path, log_path)
+
+        offset, vista = _leer_offset(archivo_path)
+        pendientes = list(read_events(log_path, offset))
 
----
-"""
-
-            # Si el archivo no existe, crearlo con encabezado
-            if not os.path.exists(archivo_path):
-                print(f"   Creando archivo nuevo con encabezado")
-                with open(archivo_path, "w", encoding="utf-8") as f:
-                    f.write("# Historial de Clientes\n\n---\n")
-                contenido_existente = "# Historial de Clientes\n\n---\n"
-            
-            print(f"   Contenido actual antes de agregar: {len(contenido_existente)} caracteres")
-            print(f"   Nueva entrada a agregar: {len(entrada)} caracteres")
-            
-            # Agregar la nueva entrada al final del archivo
-            with open(archivo_path, "a", encoding="utf-8") as f:
-                f.write(entrada)
-            
-            # Verificar que se escribió correctamente
-            with open(archivo_path, "r", encoding="utf-8") as f:
-                contenido_final = f.read()
-            print(f"   Contenido final después de agregar: {len(contenido_final)} caracteres")
-
-            print(f"✅ Nueva entrada en historial creada para el cliente: {nombre}")
-            
-            return {
-                "estado": "éxito",
-                "mensaje": f"Historial guardado correctamente para {nombre}"
-            }
+        if vista != file_version(archivo_path):
+            print(f"⚠️ {archivo_path} no coincide con el log de eventos, se regenera")
+            _regenerar_vista(archivo_path, log_path)
+            return len(pendientes)
+
+        if not pendientes:
+            return 0
+
+        if not os.path.exists(archivo_path):
+            print(f"   Creando archivo nuevo con encabezado")
+            atomic_write_text(archivo_path, ENCABEZADO_HISTORIAL)
+
+        indice = get_history_index(archivo_path)
+        for evento, _ in pendientes:
+            if indice.rango(evento["clave"]):
+                # Ya existe una entrada para este cliente -> ACTUALIZAR en su rango de bytes
+                print(f"🔄 Actualizando entrada existente para {evento['nombre']} (NIF: {evento['nif']})")
+                indice.replace_entry(evento["clave"], evento["texto"], evento.get("presupuesto_numero"))
+            else:
+                # No existe -> CREAR NUEVA ENTRADA al final del archivo
+                print(f"➕ Creando nueva entrada para {evento['nombre']} (NIF: {evento['nif']})")
+                indice.append_entry(
+                    evento["clave"],
+                    evento["nombre"],
+                    evento["nif"],
+                    evento["texto"],
+                    evento.get("presupuesto_numero"),
+                )
+
+        # El Markdown se modifica en sitio: a disco antes de avanzar el offset
+        fsync_file(archivo_path)
+        _guardar_offset(archivo_path, pendientes[-1][1])
+        _registrar_escritura_historial()
+        return len(pendientes)
+
+
+def _evento_presupuesto(presupuesto_dict: dict, fecha: str) -> dict:
+    nombre, nif, estado, texto = _formatear_entrada(presupuesto_dict, fecha)
+    return new_event(
+        event_type_for(estado),
+        history_entry_key(nombre, nif),
+        nombre=nombre,
+        nif=nif,
+        estado=estado,
+        presupuesto_numero=presupuesto_dict.get("presupuesto_numero"),
+        texto=texto,
+    )
+
+
+def _asegurar_log(archivo_path: str) -> str:
+    """Retorna la ruta del log, importando el historial Markdown si aún no existe"""
+    # Asegurar que el directorio data/ existe
+    os.makedirs(os.path.dirname(archivo_path), exist_ok=True)
+
+    log_path = history_log_path(archivo_path)
+    if not os.path.exists(log_path):
+        with file_lock(archivo_path):
+            if not os.path.exists(log_path):
+                _importar_historial_markdown(archivo_path, log_path)
+    return log_path
+
+
+def guardar_presupuesto_en_historial(presupuesto_dict: dict, archivo_path: str = "data/customer_history.md") -> dict:
+    """
+    Guarda o actualiza un presupuesto en el historial de clientes.
+    
+    Registra el cambio como un evento en el log del historial (fuente de verdad) y
+    actualiza la vista Markdown: si ya existe una entrada para el mismo cliente y
+    trabajo, la actualiza; si no existe, crea una nueva entrada.
+    """
+    try:
+        evento = _evento_presupuesto(presupuesto_dict, datetime.now().strftime("%d/%m/%Y %H:%M"))
+
+        append_event(_asegurar_log(archivo_path), evento)
+        actualizar_vista_historial(archivo_path)
+
+        print(f"✅ Historial actualizado para el cliente: {evento['nombre']} (Estado: {evento['estado']})")
+
+        return {
+            "estado": "éxito",
+            "mensaje": f"Historial guardado correctamente para {evento['nombre']} - {evento['estado']}"
+        }
 
     except Exception as e:
         print(f"❌ Error al guardar en el historial: {e}")
         return {
             "estado": "error",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+
+def guardar_presupuestos_en_historial(presupuestos: list, archivo_path: str = "data/customer_history.md") -> dict:
+    """
+    Versión por lotes de `guardar_presupuesto_en_historial`: todos los eventos se
+    añaden al log en una sola escritura y la vista Markdown se actualiza una vez.
+    """
+    try:
+        fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M")
+        eventos = [_evento_presupuesto(p, fecha_actual) for p in presupuestos]
+
+        append_events(_asegurar_log(archivo_path), eventos)
+        aplicados = actualizar_vista_historial(archivo_path)
+
+        print(f"✅ Historial actualizado con {len(eventos)} presupuestos")
+
+        return {
+            "estado": "éxito",
+            "mensaje": f"Historial actualizado con {len(eventos)} presupuestos",
+            "eventos_aplicados": aplicados,
+        }
+
+    except Exception as e:
+        print(f"❌ Error al guardar el lote en el historial: {e}")
+        return {
+            "estado": "error",
+            "error": str(e)
+        }
+
+
+def compactar_historial(archivo_path: str = "data/customer_history.md") -> dict:
+    """
+    Compacta el log de eventos del historial.
+    
+    Pliega los eventos reemplazados (queda solo el último de cada entrada),
+    reescribe el log de forma atómica y regenera el Markdown completo desde él.
+    """
+    try:
+        log_path = history_log_path(archivo_path)
+
+        with file_lock(archivo_path):
+            if not os.path.exists(log_path):
+                _importar_historial_markdown(archivo_path, log_path)
+
+            with file_lock(log_path):
+                eventos = [evento for evento, _ in read_events(log_path)]
+                plegados = list(fold_events(eventos).values())
+                write_events(log_path, plegados)
+
+            _regenerar_vista(archivo_path, log_path)
+
+        print(f"🗜️ Log del historial compactado: {len(eventos)} -> {len(plegados)} eventos")
+        return {
+            "estado": "éxito",
+            "eventos_antes": len(eventos),
+            "eventos_despues": len(plegados),
+        }
+
+    except Exception as e:
+        print(f"❌ Error compactando el historial: {e}")
+        return {
+            "estado": "error",
+            "error": str(e)
+        }
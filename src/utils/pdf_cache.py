@@ -0,0 +1,152 @@
+"""
+Caché en disco de PDFs ya renderizados, direccionada por contenido.
+
+La clave es un hash del tipo de documento, la versión de la plantilla y los datos
+que se pintan en el PDF (cliente, detalles del trabajo, importes, número y fecha).
+Volver a descargar, aceptar o regenerar un presupuesto que no ha cambiado sirve el
+PDF de la caché sin pasar por Jinja ni xhtml2pdf; cualquier cambio en los datos o
+en la plantilla produce otra clave. El tamaño total está acotado y se expulsan
+primero los PDF usados hace más tiempo (LRU).
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from src.config import PDF_CACHE_DIR, PDF_CACHE_MAX_MB
+from src.utils.pdf_helpers import template_version
+from src.utils.storage import atomic_write_bytes_async, remove_file_async
+
+# Partes del presupuesto que aparecen en el documento (estado, timestamps, etc. no)
+CAMPOS_RENDERIZADOS = ("cliente", "detalles_trabajo", "presupuesto")
+
+
+class PdfCache:
+    """PDFs en `cache_dir/<2 primeros caracteres>/<clave>.pdf` con expulsión LRU por tamaño"""
+
+    def __init__(self, cache_dir: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()  # clave -> tamaño, del menos al más usado
+        self._total = 0
+        self._pendientes = {}  # clave -> bytes aún no escritos en disco
+        self._lock = threading.Lock()
+        self._cargar()
+
+    def _cargar(self):
+        """Recupera las entradas del disco, ordenadas por último uso (mtime)"""
+        encontrados = []
+        if os.path.isdir(self.cache_dir):
+            for carpeta, _, archivos in os.walk(self.cache_dir):
+                for archivo in archivos:
+                    if not archivo.endswith(".pdf"):
+                        continue
+                    stat = os.stat(os.path.join(carpeta, archivo))
+                    encontrados.append((stat.st_mtime, archivo[:-4], stat.st_size))
+        for _, clave, tamano in sorted(encontrados):
+            self._entradas[clave] = tamano
+            self._total += tamano
+
+    @staticmethod
+    def make_key(tipo: str, presupuesto_dict: dict, numero: str, fecha: str, version_plantilla: str = None) -> str:
+        """Hash del JSON canónico (claves ordenadas) de todo lo que determina el PDF"""
+        datos = {
+            "tipo": tipo,
+            "plantilla": version_plantilla or template_version(tipo),
+            "numero": numero,
+            "fecha": fecha,
+            **{campo: presupuesto_dict.get(campo) for campo in CAMPOS_RENDERIZADOS},
+        }
+        canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.cache_dir, clave[:2], f"{clave}.pdf")
+
+    def get(self, clave: str):
+        """Retorna los bytes del PDF o None si no está en caché"""
+        with self._lock:
+            if clave not in self._entradas:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            datos = self._pendientes.get(clave)
+        if datos is not None:
+            self.hits += 1
+            return datos
+
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            os.utime(ruta)  # el mtime guarda el último uso entre reinicios
+        except FileNotFoundError:
+            # Archivo borrado a mano
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return datos
+
+    def put(self, clave: str, datos: bytes):
+        """Guarda un PDF (escritura en segundo plano) y expulsa los menos usados si hace falta"""
+        with self._lock:
+            self._total += len(datos) - self._entradas.pop(clave, 0)
+            self._entradas[clave] = len(datos)
+            self._pendientes[clave] = datos
+            expulsadas = self._evict()
+
+        # Mismo hilo de escritura: un borrado nunca se adelanta a la escritura del archivo
+        futuro = atomic_write_bytes_async(self._ruta(clave), datos)
+        futuro.add_done_callback(lambda _: self._escrito(clave, datos))
+        for antigua in expulsadas:
+            remove_file_async(self._ruta(antigua))
+        if expulsadas:
+            print(f"🧹 Caché de PDFs: {len(expulsadas)} documentos expulsados")
+
+    def _escrito(self, clave: str, datos: bytes):
+        with self._lock:
+            if self._pendientes.get(clave) is datos:
+                del self._pendientes[clave]
+
+    def _evict(self) -> list:
+        """Saca del índice los PDF menos usados hasta bajar del 90% del tamaño máximo"""
+        if self._total <= self.max_bytes:
+            return []
+        expulsadas = []
+        while self._entradas and self._total > int(self.max_bytes * 0.9):
+            clave, tamano = self._entradas.popitem(last=False)
+            self._pendientes.pop(clave, None)
+            self._total -= tamano
+            expulsadas.append(clave)
+        return expulsadas
+
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos y tamaño actual de la caché"""
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+            "entries": len(self._entradas),
+            "size_bytes": self._total,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> PdfCache:
+    """Retorna la caché de PDFs del proceso"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PdfCache()
+
+    return _cache
@@ -1,8 +1,23 @@
 """
 Utilidades para generación de PDFs
 """
+import hashlib
+import os
 from typing import List, Dict
 
+TEMPLATES_DIR = "templates"
+
+PLANTILLAS = {
+    "presupuesto": "presupuesto_template.html.j2",
+    "factura": "factura_template.html.j2",
+}
+
+
+def template_version(tipo: str, templates_dir: str = TEMPLATES_DIR) -> str:
+    """Huella del contenido actual de la plantilla de un tipo de documento"""
+    with open(os.path.join(templates_dir, PLANTILLAS[tipo]), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
 
 def generate_pdf_items(presupuesto_dict: dict) -> List[Dict[str, str]]:
     """
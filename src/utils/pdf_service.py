@@ -0,0 +1,155 @@
+"""
+Servicio de renderizado de PDFs en un pool de procesos.
+
+`pisa.CreatePDF` consume CPU y retiene el GIL, así que renderizar en el hilo de una
+sesión de Streamlit bloquea esa sesión y compite con todas las demás. Aquí los PDF
+se renderizan en procesos aparte, cada uno con su `DocumentRenderer` ya caliente
+(plantillas compiladas), de modo que el rendimiento escala con los
+núcleos disponibles.
+
+API:
+    servicio = get_pdf_service()
+    futuro = servicio.submit("factura", presupuesto_dict, numero, fecha)
+    pdf_bytes = servicio.result(futuro)                  # síncrono, con timeout
+    pdf_bytes = await servicio.render_async(...)         # desde asyncio
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from src.config import PDF_RENDER_WORKERS, PDF_RENDER_MAX_QUEUE, PDF_RENDER_TIMEOUT_S
+
+
+class PdfQueueFullError(Exception):
+    """Hay demasiados PDFs pendientes en el servicio"""
+
+
+class PdfRenderTimeoutError(Exception):
+    """El PDF no se renderizó dentro del tiempo máximo por trabajo"""
+
+
+# --- Funciones que se ejecutan en los procesos del pool ---
+
+def _iniciar_worker():
+    """Precalienta el renderizador del proceso (compila las plantillas) antes del primer trabajo"""
+    from src.utils.document_renderer import get_document_renderer, PLANTILLAS
+
+    renderer = get_document_renderer()
+    for tipo in PLANTILLAS:
+        renderer.env.get_template(PLANTILLAS[tipo])
+
+
+def _render_job(tipo: str, presupuesto_dict: dict, numero: str, fecha: str) -> bytes:
+    from src.utils.document_renderer import get_document_renderer
+
+    return get_document_renderer().render_document(tipo, presupuesto_dict, numero, fecha)
+
+
+class PdfRenderService:
+    """Pool de procesos para renderizar presupuestos y facturas"""
+
+    def __init__(
+        self,
+        max_workers=PDF_RENDER_WORKERS,
+        max_queue: int = PDF_RENDER_MAX_QUEUE,
+        timeout: float = PDF_RENDER_TIMEOUT_S,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._huecos = threading.BoundedSemaphore(max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: hacer fork de un proceso con hilos (Streamlit) no es seguro
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_iniciar_worker,
+                    )
+        return self._executor
+
+    def submit(self, tipo: str, presupuesto_dict: dict, numero: str, fecha: str):
+        """
+        Encola el renderizado de un documento y retorna un Future con los bytes del PDF.
+
+        Lanza PdfQueueFullError si ya hay `max_queue` trabajos pendientes, para que
+        un pico de peticiones no acumule trabajo sin límite.
+        """
+        if not self._huecos.acquire(blocking=False):
+            raise PdfQueueFullError(
+                f"Hay {self.max_queue} PDFs en cola; inténtalo de nuevo en unos segundos"
+            )
+        try:
+            try:
+                futuro = self._get_executor().submit(_render_job, tipo, presupuesto_dict, numero, fecha)
+            except BrokenProcessPool:
+                # Un worker murió (p. ej. sin memoria): se recrea el pool una vez
+                print("⚠️ Pool de PDFs roto, recreando procesos...")
+                self.shutdown(wait=False)
+                futuro = self._get_executor().submit(_render_job, tipo, presupuesto_dict, numero, fecha)
+        except Exception:
+            self._huecos.release()
+            raise
+        futuro.add_done_callback(lambda _: self._huecos.release())
+        return futuro
+
+    def result(self, futuro, timeout: float = None) -> bytes:
+        """
+        Espera el resultado de un trabajo.
+
+        Si se agota el timeout se cancela el trabajo si aún no había empezado; si ya
+        estaba en marcha, el proceso lo termina en segundo plano y libera su hueco.
+        """
+        try:
+            return futuro.result(timeout=timeout if timeout is not None else self.timeout)
+        except FuturesTimeoutError:
+            futuro.cancel()
+            raise PdfRenderTimeoutError(
+                f"El PDF no se generó en {timeout if timeout is not None else self.timeout} s"
+            )
+
+    def render(self, tipo: str, presupuesto_dict: dict, numero: str, fecha: str, timeout: float = None) -> bytes:
+        """Encola un documento y espera sus bytes (atajo de submit + result)"""
+        return self.result(self.submit(tipo, presupuesto_dict, numero, fecha), timeout)
+
+    async def render_async(self, tipo: str, presupuesto_dict: dict, numero: str, fecha: str, timeout: float = None) -> bytes:
+        """Versión para asyncio de `render`"""
+        futuro = self.submit(tipo, presupuesto_dict, numero, fecha)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(futuro),
+                timeout=timeout if timeout is not None else self.timeout,
+            )
+        except asyncio.TimeoutError:
+            raise PdfRenderTimeoutError(
+                f"El PDF no se generó en {timeout if timeout is not None else self.timeout} s"
+            )
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_pdf_service() -> PdfRenderService:
+    """Retorna el servicio de renderizado del proceso (los workers se crean en el primer uso)"""
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = PdfRenderService()
+
+    return _service
@@ -0,0 +1,233 @@
+"""
+Motor de precios de los presupuestos de pintura.
+
+Las tablas de precios se cargan una sola vez al importar el módulo. `calcular_costes`
+calcula un trabajo (lo usa `calcular_presupuesto`) y `calcular_costes_lote` calcula
+columnas enteras de trabajos con NumPy, para presupuestos por lotes y simulaciones
+de precios sobre miles de filas. Ambas rutas hacen las mismas operaciones en el
+mismo orden y redondean igual que `round(x, 2)`, así que dan exactamente los
+mismos importes.
+
+NumPy solo se importa en las funciones por lotes: `calcular_presupuesto` (el camino
+de la app) no lo necesita.
+"""
+
+# Precios base por m² según tipo de pintura
+PRECIOS_BASE = {
+    "plástica": 8.50,
+    "acrílica": 12.00,
+    "esmalte": 15.00,
+    "epoxi": 25.00,
+    "poliuretano": 28.00,
+}
+PRECIO_BASE_DEFECTO = 10.00
+
+# Multiplicadores según tipo de trabajo
+MULTIPLICADORES = {
+    "interior": 1.0,
+    "exterior": 1.3,
+    "restauración": 1.5,
+    "fachada": 1.4,
+}
+MULTIPLICADOR_DEFECTO = 1.0
+
+# Mano de obra: 1 pintor = 12€/hora, 8m²/hora
+PRECIO_HORA = 12
+M2_POR_HORA = 8
+
+PORCENTAJE_PREPARACION = 0.15
+COSTE_TRANSPORTE = 50.00
+COSTE_LIMPIEZA = 30.00
+IVA = 0.21
+
+COLUMNAS_COSTES = (
+    "costo_material",
+    "costo_mano_obra",
+    "preparación",
+    "transporte",
+    "limpieza_final",
+    "subtotal_sin_ganancia",
+    "total_sin_iva",
+    "iva_21",
+    "total_con_iva",
+)
+
+
+def calcular_costes(area_m2: float, tipo_pintura: str, tipo_trabajo: str,
+                    precios_base: dict = None, multiplicadores: dict = None) -> dict:
+    """
+    Calcula el desglose de costes de un trabajo.
+
+    Returns:
+        dict con el mismo formato que la clave "presupuesto" de un presupuesto
+    """
+    precios_base = PRECIOS_BASE if precios_base is None else precios_base
+    multiplicadores = MULTIPLICADORES if multiplicadores is None else multiplicadores
+
+    precio_base = precios_base.get(tipo_pintura.lower(), PRECIO_BASE_DEFECTO)
+    multiplicador = multiplicadores.get(tipo_trabajo.lower(), MULTIPLICADOR_DEFECTO)
+
+    costo_material = area_m2 * precio_base * multiplicador
+
+    horas_trabajo = area_m2 / M2_POR_HORA
+    costo_mano_obra = horas_trabajo * PRECIO_HORA
+
+    costos_adicionales = {
+        "preparación": costo_material * PORCENTAJE_PREPARACION,
+        "transporte": COSTE_TRANSPORTE,
+        "limpieza_final": COSTE_LIMPIEZA,
+    }
+
+    subtotal = costo_material + costo_mano_obra + sum(costos_adicionales.values())
+
+    # No se aplica margen de ganancia por solicitud del usuario
+    total_sin_iva = subtotal
+    iva = total_sin_iva * IVA
+    total_con_iva = total_sin_iva + iva
+
+    return {
+        "costo_material": round(costo_material, 2),
+        "costo_mano_obra": round(costo_mano_obra, 2),
+        "costos_adicionales": {k: round(v, 2) for k, v in costos_adicionales.items()},
+        "subtotal_sin_ganancia": round(subtotal, 2),
+        "total_sin_iva": round(total_sin_iva, 2),
+        "iva_21": round(iva, 2),
+        "total_con_iva": round(total_con_iva, 2),
+    }
+
+
+def redondear_2(valores) -> "np.ndarray":
+    """
+    Redondeo a 2 decimales idéntico a `round(x, 2)` de Python.
+
+    `np.round` redondea x·100 ya calculado en coma flotante, mientras que Python
+    redondea (mitades al par) el valor exacto de x. Solo pueden diferir cuando x·100
+    cae en una mitad o a un error de redondeo de ella; en esos casos se calcula el
+    error exacto del producto (Dekker) para saber hacia qué lado cae el valor real.
+    """
+    import numpy as np
+
+    valores = np.asarray(valores, dtype=np.float64)
+    escalados = valores * 100
+    resultado = np.rint(escalados) / 100
+
+    base = np.floor(escalados)
+    with np.errstate(invalid="ignore"):
+        cerca = np.abs(escalados - base - 0.5) <= 1e-9 * np.maximum(1.0, np.abs(escalados))
+    dudosos = np.flatnonzero(cerca)
+    if dudosos.size:
+        x, p, k = valores[dudosos], escalados[dudosos], base[dudosos]
+        partido = x * 134217729.0  # 2^27 + 1
+        alto = partido - (partido - x)
+        bajo = x - alto
+        error = (alto * 100 - p) + bajo * 100  # x·100 == p + error, exacto
+        diferencia = (p - (k + 0.5)) + error
+        arriba = (diferencia > 0) | ((diferencia == 0) & (k % 2 == 1))
+        resultado[dudosos] = (k + arriba) / 100
+
+        # Fuera de [1, 2^51) estas restas ya no son exactas: se usa round
+        for i in dudosos[(p < 1) | (p >= 2.0 ** 51) | ~np.isfinite(p)]:
+            resultado[i] = round(float(valores[i]), 2)
+    return resultado
+
+
+def _buscar(tabla: dict, claves, defecto: float) -> "np.ndarray":
+    """Traduce una columna de textos a su valor en la tabla (un `lower()` por valor distinto)"""
+    import numpy as np
+
+    if hasattr(claves, "tolist"):
+        claves = claves.tolist()  # str de Python: más rápidos de hashear que los de NumPy
+    cache = {}
+
+    def valor(clave):
+        resultado = cache.get(clave)
+        if resultado is None:
+            resultado = cache[clave] = tabla.get(str(clave).lower(), defecto)
+        return resultado
+
+    return np.fromiter(map(valor, claves), dtype=np.float64, count=len(claves))
+
+
+def calcular_costes_lote(area_m2, tipo_pintura, tipo_trabajo,
+                         precios_base: dict = None, multiplicadores: dict = None) -> dict:
+    """
+    Calcula el desglose de costes de muchos trabajos a la vez.
+
+    Args:
+        area_m2: áreas en m² (array o lista)
+        tipo_pintura: tipos de pintura, uno por trabajo
+        tipo_trabajo: tipos de trabajo, uno por trabajo
+        precios_base, multiplicadores: tablas alternativas para simulaciones
+            (por defecto las del módulo)
+
+    Returns:
+        dict columna -> array (ver COLUMNAS_COSTES), con los importes redondeados
+        a 2 decimales igual que `calcular_costes`
+    """
+    import numpy as np
+
+    precios_base = PRECIOS_BASE if precios_base is None else precios_base
+    multiplicadores = MULTIPLICADORES if multiplicadores is None else multiplicadores
+
+    area = np.asarray(area_m2, dtype=np.float64)
+    if not (len(tipo_pintura) == len(tipo_trabajo) == area.size):
+        raise ValueError("area_m2, tipo_pintura y tipo_trabajo deben tener la misma longitud")
+
+    precio_base = _buscar(precios_base, tipo_pintura, PRECIO_BASE_DEFECTO)
+    multiplicador = _buscar(multiplicadores, tipo_trabajo, MULTIPLICADOR_DEFECTO)
+
+    # Mismas operaciones y en el mismo orden que calcular_costes
+    costo_material = area * precio_base * multiplicador
+    costo_mano_obra = area / M2_POR_HORA * PRECIO_HORA
+    preparacion = costo_material * PORCENTAJE_PREPARACION
+    adicionales = preparacion + COSTE_TRANSPORTE + COSTE_LIMPIEZA
+    subtotal = costo_material + costo_mano_obra + adicionales
+    iva = subtotal * IVA
+    total_con_iva = subtotal + iva
+
+    subtotal_redondeado = redondear_2(subtotal)
+    return {
+        "costo_material": redondear_2(costo_material),
+        "costo_mano_obra": redondear_2(costo_mano_obra),
+        "preparación": redondear_2(preparacion),
+        "transporte": np.full(area.size, COSTE_TRANSPORTE),
+        "limpieza_final": np.full(area.size, COSTE_LIMPIEZA),
+        "subtotal_sin_ganancia": subtotal_redondeado,
+        "total_sin_iva": subtotal_redondeado.copy(),
+        "iva_21": redondear_2(iva),
+        "total_con_iva": redondear_2(total_con_iva),
+    }
+
+
+def calcular_costes_tabla(trabajos, precios_base: dict = None, multiplicadores: dict = None):
+    """
+    Versión para DataFrames de pandas: columnas area_m2, tipo_pintura y tipo_trabajo.
+
+    Returns:
+        Copia del DataFrame con las columnas de COLUMNAS_COSTES añadidas
+    """
+    costes = calcular_costes_lote(
+        trabajos["area_m2"].to_numpy(),
+        trabajos["tipo_pintura"].to_numpy(),
+        trabajos["tipo_trabajo"].to_numpy(),
+        precios_base=precios_base,
+        multiplicadores=multiplicadores,
+    )
+    return trabajos.assign(**costes)
+
+
+def costes_de_fila(costes: dict, i: int) -> dict:
+    """Desglose de la fila `i` de un resultado de `calcular_costes_lote`, con el formato de `calcular_costes`"""
+    return {
+        "costo_material": float(costes["costo_material"][i]),
+        "costo_mano_obra": float(costes["costo_mano_obra"][i]),
+        "costos_adicionales": {
+            "preparación": float(costes["preparación"][i]),
+            "transporte": float(costes["transporte"][i]),
+            "limpieza_final": float(costes["limpieza_final"][i]),
+        },
+        "subtotal_sin_ganancia": float(costes["subtotal_sin_ganancia"][i]),
+        "total_sin_iva": float(costes["total_sin_iva"][i]),
+        "iva_21": float(costes["iva_21"][i]),
+        "total_con_iva": float(costes["total_con_iva"][i]),
+    }
@@ -0,0 +1,188 @@
+"""
+Escrituras seguras de archivos compartidos entre sesiones de Streamlit.
+
+Todas las sesiones corren en el mismo proceso, así que cada archivo tiene su propio
+lock (no hay un lock global que serialice todo el tráfico). Las escrituras van a
+un archivo temporal en el mismo directorio, se hace fsync y se sustituye el
+original con `os.replace`, de modo que nunca queda un archivo a medio escribir.
+
+Los archivos que no se vuelven a leer en la misma petición (PDF ya entregados al
+usuario) pueden guardarse en segundo plano con `atomic_write_bytes_async`.
+
+Para read-modify-write se usa control optimista: `read_json` devuelve también la
+versión del archivo y la escritura falla con `VersionConflictError` si otra sesión
+lo ha modificado entretanto.
+"""
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+
+class VersionConflictError(Exception):
+    """El archivo cambió desde que se leyó (escritura concurrente de otra sesión)"""
+
+    def __init__(self, path: str, expected: str, actual: str):
+        super().__init__(f"{path} ha sido modificado por otra sesión")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+
+def _lock_for(path: str) -> threading.RLock:
+    clave = os.path.abspath(path)
+    with _locks_lock:
+        if clave not in _locks:
+            _locks[clave] = threading.RLock()
+        return _locks[clave]
+
+
+@contextmanager
+def file_lock(path: str):
+    """Lock del proceso para un archivo concreto (reentrante)"""
+    lock = _lock_for(path)
+    with lock:
+        yield
+
+
+def file_version(path: str):
+    """
+    Versión actual de un archivo, o None si no existe.
+
+    `os.replace` crea un inode nuevo en cada escritura atómica, así que la versión
+    cambia aunque coincidan el tamaño y la fecha de modificación.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _fsync_directory(directorio: str):
+    # En Windows no se pueden abrir directorios; el rename ya es atómico allí
+    if os.name != "posix":
+        return
+    fd = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path: str):
+    """Fuerza a disco lo escrito en un archivo modificado en sitio (sin escritura atómica)"""
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def atomic_write_bytes(path: str, data: bytes, expected_version=None) -> str:
+    """
+    Escribe un archivo de forma atómica (temporal + fsync + rename).
+
+    Args:
+        expected_version: versión leída antes de modificar (ver `file_version`);
+            si el archivo ya no está en esa versión se lanza VersionConflictError
+
+    Returns:
+        La nueva versión del archivo
+    """
+    directorio = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directorio, exist_ok=True)
+
+    with file_lock(path):
+        if expected_version is not None:
+            actual = file_version(path)
+            if actual != expected_version:
+                raise VersionConflictError(path, expected_version, actual)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directorio, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        _fsync_directory(directorio)
+        return file_version(path)
+
+
+def _get_escritor() -> ThreadPoolExecutor:
+    global _escritor
+
+    if _escritor is None:
+        with _escritor_lock:
+            if _escritor is None:
+                # Un solo hilo: las escrituras se hacen en el orden en que se piden
+                _escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-writer")
+
+    return _escritor
+
+
+def _avisar_si_falla(path: str):
+    def callback(futuro: Future):
+        error = futuro.exception()
+        if error is not None:
+            print(f"❌ Error guardando {path} en segundo plano: {error}")
+    return callback
+
+
+def atomic_write_bytes_async(path: str, data: bytes) -> Future:
+    """
+    Encola una escritura atómica en el hilo de escritura del proceso.
+
+    El llamador no espera al disco; el Future permite esperar o comprobar errores
+    si hace falta. Las escrituras pendientes se completan antes de que el
+    intérprete termine.
+    """
+    futuro = _get_escritor().submit(atomic_write_bytes, path, data)
+    futuro.add_done_callback(_avisar_si_falla(path))
+    return futuro
+
+
+def _borrar_si_existe(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_file_async(path: str) -> Future:
+    """Borra un archivo en el hilo de escritura, después de las escrituras ya encoladas"""
+    futuro = _get_escritor().submit(_borrar_si_existe, path)
+    futuro.add_done_callback(_avisar_si_falla(path))
+    return futuro
+
+
+def atomic_write_text(path: str, texto: str, expected_version=None) -> str:
+    return atomic_write_bytes(path, texto.encode("utf-8"), expected_version)
+
+
+def atomic_write_json(path: str, data, expected_version=None) -> str:
+    return atomic_write_text(path, json.dumps(data, indent=4, ensure_ascii=False), expected_version)
+
+
+def read_json(path: str):
+    """
+    Lee un JSON junto con su versión.
+
+    Returns:
+        Tupla (datos, versión) para pasar después a `atomic_write_json`
+    """
+    with file_lock(path):
+        version = file_version(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), version
@@ -0,0 +1,53 @@
+"""
+Regresiones del clasificador local de intenciones: las preguntas y las frases
+negadas nunca deben acabar en una ruta que modifique un presupuesto o una factura.
+
+Uso:
+    python -m pytest tests
+"""
+import pytest
+
+from src.agents.intent_classifier import (
+    ACCIONES_POR_REGLAS,
+    CONSULTAS_SIN_ACCION,
+    RUTAS_CON_ACCION,
+    IntentClassifier,
+    classify_by_rules,
+)
+
+
+class _EmbeddingsFijos:
+    """Embeddings de prueba: todo texto cae sobre el mismo vector"""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+@pytest.mark.parametrize("texto", CONSULTAS_SIN_ACCION)
+def test_consultas_y_negaciones_no_deciden_acciones(texto):
+    decision = classify_by_rules(texto)
+    assert decision is None or decision["route"] not in RUTAS_CON_ACCION
+
+
+@pytest.mark.parametrize("texto,ruta", ACCIONES_POR_REGLAS)
+def test_ordenes_afirmativas_deciden_por_reglas(texto, ruta):
+    decision = classify_by_rules(texto)
+    assert decision == {"route": ruta, "tier": "reglas", "confidence": 1.0}
+
+
+@pytest.mark.parametrize("ruta", RUTAS_CON_ACCION)
+def test_embeddings_no_deciden_rutas_con_accion(ruta):
+    clasificador = IntentClassifier(embeddings=_EmbeddingsFijos())
+    # Solo la ruta con acción coincide con la consulta (similitud 1.0)
+    clasificador._centroides = {ruta: [1.0, 0.0], "historial": [0.0, 1.0]}
+    assert clasificador.classify_by_embeddings("Carlos y la factura") is None
+
+
+def test_embeddings_deciden_rutas_de_consulta():
+    clasificador = IntentClassifier(embeddings=_EmbeddingsFijos())
+    clasificador._centroides = {"historial": [1.0, 0.0], "marcar_pagada": [0.0, 1.0]}
+    decision = clasificador.classify_by_embeddings("qué le hicimos a Carlos")
+    assert decision == {"route": "historial", "tier": "embeddings", "confidence": 1.0}